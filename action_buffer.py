@@ -0,0 +1,83 @@
+from typing import Iterator, List
+
+import numpy as np
+
+from task_utils import SubtaskType
+
+
+class ActionBuffer:
+    """
+    Numeric per-robot commands of one frame,
+        formatted into a single string and written once
+    """
+
+    def __init__(self, num_robots: int = 4) -> None:
+        self.num_robots = num_robots
+        self.l_speed = np.zeros(num_robots)
+        self.a_speed = np.zeros(num_robots)
+        self.forward = np.zeros(num_robots, dtype=bool)
+        self.buy = np.zeros(num_robots, dtype=bool)
+        self.sell = np.zeros(num_robots, dtype=bool)
+        self.destroy = np.zeros(num_robots, dtype=bool)
+        # NOTE: raw action lines written before robot commands
+        self.raw_actions = []
+
+    def clear(self) -> None:
+        self.forward[:] = False
+        self.buy[:] = False
+        self.sell[:] = False
+        self.destroy[:] = False
+        self.raw_actions.clear()
+
+    def append(self, action: str) -> None:
+        self.raw_actions.append(action)
+
+    def setCommand(self,
+                   robot_id: int,
+                   subtask_type: SubtaskType,
+                   l_speed: float = 0,
+                   a_speed: float = 0) -> None:
+        if subtask_type == SubtaskType.GOTO:
+            self.forward[robot_id] = True
+            self.l_speed[robot_id] = l_speed
+            self.a_speed[robot_id] = a_speed
+        elif subtask_type == SubtaskType.BUY:
+            self.buy[robot_id] = True
+        elif subtask_type == SubtaskType.SELL:
+            self.sell[robot_id] = True
+        elif subtask_type == SubtaskType.DESTROY:
+            self.destroy[robot_id] = True
+        else:
+            raise NotImplementedError()
+
+    def lines(self) -> List[str]:
+        lines = list(self.raw_actions)
+        forward, buy, sell, destroy = \
+            self.forward.tolist(), self.buy.tolist(), \
+            self.sell.tolist(), self.destroy.tolist()
+        l_speed, a_speed = self.l_speed.tolist(), self.a_speed.tolist()
+        for robot_id in range(self.num_robots):
+            if forward[robot_id]:
+                lines.append(f"forward {robot_id} {l_speed[robot_id]!r}")
+                lines.append(f"rotate {robot_id} {a_speed[robot_id]!r}")
+            if buy[robot_id]:
+                lines.append(f"buy {robot_id}")
+            if sell[robot_id]:
+                lines.append(f"sell {robot_id}")
+            if destroy[robot_id]:
+                lines.append(f"destroy {robot_id}")
+        return lines
+
+    def format(self, frame_id: int, end_token: str = "OK") -> str:
+        lines = self.lines()
+        lines.insert(0, str(frame_id))
+        lines.append(end_token)
+        lines.append("")
+        return "\n".join(lines)
+
+    # NOTE: iterable as action strings, e.g., for EnvWrapper.send
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.lines())
+
+    def __len__(self) -> int:
+        return len(self.lines())
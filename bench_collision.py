@@ -0,0 +1,134 @@
+import argparse
+import math
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from collision_engine import CollisionEngine
+from subtask_to_action import SubtaskToAction
+
+
+Point = namedtuple("Point", ["x", "y"])
+
+
+def scalarBisection(x, y, vx, vy, speed_mod, predict_time,
+                    cross_x, cross_y, radius_sum,
+                    max_line_speed=6, episilon=1e-1) -> float:
+    # per-encounter search used by getAction before the collision engine
+    min_l_speed = 0
+    max_l_speed = max_line_speed
+    while max_l_speed - min_l_speed > episilon:
+        mid_l_speed = (min_l_speed + max_l_speed) / 2
+        mid_predicted_pos = Point(
+            x + mid_l_speed * vx / speed_mod * predict_time * 1.2,
+            y + mid_l_speed * vy / speed_mod * predict_time * 1.2
+        )
+        if np.sqrt(
+            (mid_predicted_pos.x - cross_x) ** 2 +
+            (mid_predicted_pos.y - cross_y) ** 2
+        ) < radius_sum:
+            max_l_speed = mid_l_speed
+        else:
+            min_l_speed = mid_l_speed
+    return min_l_speed
+
+
+def makeEncounters(num_encounters: int, seed: int):
+    # robot heading towards a crossing point within a few meters
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(0, 50, num_encounters)
+    y = rng.uniform(0, 50, num_encounters)
+    angle = rng.uniform(-math.pi, math.pi, num_encounters)
+    speed_mod = rng.uniform(0.1, 6, num_encounters)
+    distance = rng.uniform(0, 12, num_encounters)
+    offset = rng.uniform(-1.5, 1.5, num_encounters)
+    return (
+        x, y,
+        speed_mod * np.cos(angle), speed_mod * np.sin(angle), speed_mod,
+        rng.choice([1.3, 2.0, 2.5], num_encounters),
+        x + np.cos(angle) * distance - np.sin(angle) * offset,
+        y + np.sin(angle) * distance + np.cos(angle) * offset,
+        rng.choice([0.9, 0.98, 1.06], num_encounters),
+    )
+
+
+def makeFrame(rng, frame_id: int, num_robots: int):
+    robots = []
+    for _ in range(num_robots):
+        angle = rng.uniform(-math.pi, math.pi)
+        speed_mod = rng.uniform(0, 6)
+        robots.append({
+            "item_type": int(rng.integers(0, 2)),
+            "line_speed_x": speed_mod * math.cos(angle),
+            "line_speed_y": speed_mod * math.sin(angle),
+            "loc_x": rng.uniform(20, 30),
+            "loc_y": rng.uniform(20, 30),
+        })
+    return {"frame_id": frame_id, "robots": robots}
+
+
+def timeIt(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-encounters", default=10000, type=int)
+    parser.add_argument("--repeat", default=5, type=int)
+    parser.add_argument("--seed", default=0, type=int)
+    args = parser.parse_args()
+
+    engine = CollisionEngine(SubtaskToAction().params)
+    encounters = makeEncounters(args.num_encounters, args.seed)
+    scalar_encounters = list(zip(*[arg.tolist() for arg in encounters]))
+    single_encounters = [
+        tuple(np.array([value]) for value in encounter)
+        for encounter in scalar_encounters[:1000]
+    ]
+
+    expected = np.array([
+        scalarBisection(*encounter) for encounter in scalar_encounters])
+    assert np.array_equal(engine.safeSpeed(*encounters), expected)
+    assert np.array_equal(engine.bisectSafeSpeed(*encounters), expected)
+
+    results = {
+        "scalar bisection (old)": timeIt(
+            lambda: [scalarBisection(*encounter)
+                     for encounter in scalar_encounters],
+            args.repeat) / len(scalar_encounters),
+        "scalar closed form": timeIt(
+            lambda: [engine.scalarSafeSpeed(*encounter)
+                     for encounter in scalar_encounters],
+            args.repeat) / len(scalar_encounters),
+        "safeSpeed, 1 per call": timeIt(
+            lambda: [engine.safeSpeed(*encounter)
+                     for encounter in single_encounters],
+            args.repeat) / len(single_encounters),
+        "batched bisection": timeIt(
+            lambda: engine.bisectSafeSpeed(*encounters),
+            args.repeat) / args.num_encounters,
+        "batched closed form": timeIt(
+            lambda: engine.safeSpeed(*encounters),
+            args.repeat) / args.num_encounters,
+    }
+    print(f"[INFO]: {args.num_encounters} close encounters")
+    for name, seconds in results.items():
+        print(f"[INFO]: {name:<24} {seconds * 1e6:8.3f} us / encounter")
+
+    # whole collision pass per frame, robots crowded in a 10m x 10m area
+    rng = np.random.default_rng(args.seed)
+    for num_robots in [4, 8, 16, 32]:
+        frames = [makeFrame(rng, frame_id, num_robots) for frame_id in range(200)]
+
+        def solveFrames():
+            for frame in frames:
+                engine.update(frame)
+
+        seconds = timeIt(solveFrames, args.repeat) / len(frames)
+        print(f"[INFO]: {num_robots:>2} robots, {seconds * 1e6:8.3f} us / frame")
@@ -0,0 +1,417 @@
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+# NOTE: all helpers below are element-wise versions of the scalar geometry
+#   helpers used by the controller, the evaluation order of every expression
+#   is kept so that the results are bit-identical to the scalar ones
+
+
+# check if point p1 is between two other lines(p2, p3) and (p4, p5)
+def batchIsBetween(p1, p2, p3, p4, p5) -> np.ndarray:
+    x1, y1 = p1
+    x2, y2 = p2
+    x3, y3 = p3
+    x4, y4 = p4
+    x5, y5 = p5
+    return ((x1 - x2) * (y3 - y2) - (y1 - y2) * (x3 - x2) >= 0) \
+        & ((x1 - x2) * (y4 - y2) - (y1 - y2) * (x4 - x2) <= 0) \
+        & ((x1 - x5) * (y3 - y5) - (y1 - y5) * (x3 - x5) >= 0) \
+        & ((x1 - x5) * (y4 - y5) - (y1 - y5) * (x4 - x5) <= 0)
+
+
+# check if two lines are parallel
+def batchIsParallel(p1, p2, p3, p4) -> np.ndarray:
+    x1, y1 = p1
+    x2, y2 = p2
+    x3, y3 = p3
+    x4, y4 = p4
+    return (x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4) == 0
+
+
+# get the crossed points of two lines
+def batchCrossPoint(p1, p2, p3, p4) -> Tuple[np.ndarray, np.ndarray]:
+    x1, y1 = p1
+    x2, y2 = p2
+    x3, y3 = p3
+    x4, y4 = p4
+    x = ((x1 * y2 - y1 * x2) * (x3 - x4) - (x1 - x2) * (x3 * y4 - y3 * x4)) / \
+        ((x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4))
+    y = ((x1 * y2 - y1 * x2) * (y3 - y4) - (y1 - y2) * (x3 * y4 - y3 * x4)) / \
+        ((x1 - x2) * (y3 - y4) - (y1 - y2) * (x3 - x4))
+    return x, y
+
+
+# check if two line segments intersect
+def batchIsIntersect(p1, p2, p3, p4) -> np.ndarray:
+    def ccw(p1, p2, p3):
+        return (p2[0] - p1[0]) * (p3[1] - p1[1]) > \
+            (p2[1] - p1[1]) * (p3[0] - p1[0])  # cross product
+
+    return (ccw(p1, p3, p4) != ccw(p2, p3, p4)) \
+        & (ccw(p1, p2, p3) != ccw(p1, p2, p4))
+
+
+class CollisionEngine:
+    """
+    Pairwise collision prediction for all robots of one frame.
+
+    Every (self robot, other robot) pair is checked in one pass, the
+    results per self robot are the angular speed to turn away with
+    (None if no turn) and the max forward speed (inf if no limit).
+    """
+
+    def __init__(self,
+                 params: Dict[str, Any],
+                 same_direction_threshold: float = 0.18,
+                 revised: bool = False) -> None:
+        self.params = params
+        self.same_direction_threshold = same_direction_threshold
+        # NOTE: revised control uses a symmetric angle difference and
+        #   a stricter same direction check for parallel tracks
+        self.revised = revised
+        self.max_line_speed = 6
+        self.episilon = 1e-1
+        # safe speed solver: roots closer than this to a bisection mid
+        #   fall back to the exact search
+        self.root_margin = 1e-9
+        self.scalar_batch_size = 8
+        self.frame_key = None
+        self.other_mask = None
+
+        self.robot_turn: List[Optional[float]] = []
+        self.robot_speed_cap: List[float] = []
+
+    def robotStat(self, obs: Dict[str, Any]) -> np.ndarray:
+        # columns: loc_x, loc_y, line_speed_x, line_speed_y, radius,
+        #   collision_predict_time, speed_mod
+        robots = obs["robots"]
+        stat = np.empty((len(robots), 7))
+        stat[:, :5] = [
+            (robot["loc_x"], robot["loc_y"],
+             robot["line_speed_x"], robot["line_speed_y"], robot["item_type"])
+            for robot in robots
+        ]
+        empty = stat[:, 4] == 0
+        stat[:, 4] = np.where(empty, 0.45, 0.53)
+        stat[:, 5] = np.where(
+            empty,
+            self.params["collision_predict_time_1"],
+            self.params["collision_predict_time_2"])
+        stat[:, 6] = np.sqrt(stat[:, 2] ** 2 + stat[:, 3] ** 2)
+        return stat
+
+    def update(self, obs: Dict[str, Any],
+               stat: Optional[np.ndarray] = None) -> None:
+        # NOTE: results are cached for the whole frame
+        frame_key = (id(obs), obs["frame_id"])
+        if frame_key == self.frame_key:
+            return
+        self.frame_key = frame_key
+        if stat is None:
+            stat = self.robotStat(obs)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            self._solve(stat)
+
+    def otherMask(self, num_robots: int) -> np.ndarray:
+        if self.other_mask is None or self.other_mask.shape[0] != num_robots:
+            self.other_mask = ~np.eye(num_robots, dtype=bool)
+        return self.other_mask
+
+    def query(self, robot_id: int) -> Tuple[Optional[float], float]:
+        # the last robot that asks for a turn wins, speed limits are all applied
+        return self.robot_turn[robot_id], self.robot_speed_cap[robot_id]
+
+    def _solve(self, stat: np.ndarray) -> None:
+        episilon = self.episilon
+        avoid_collision_angular_speed = \
+            self.params["avoid_collision_angular_speed"]
+        num_robots = stat.shape[0]
+        self.robot_turn = [None] * num_robots
+        self.robot_speed_cap = [math.inf] * num_robots
+
+        # too slow: no need to check
+        moving = stat[:, 6] >= episilon
+        valid = moving[:, None] & moving[None, :] & self.otherMask(num_robots)
+        # too far: bounding boxes of the swept tracks do not overlap, the other
+        #   robot's track is swept with the longest predict time to cover all rows
+        loc, line_speed = stat[:, 0:2], stat[:, 2:4]
+        margin = stat[:, 4:5] + 1e-6
+        self_end = loc + line_speed * stat[:, 5:6]
+        other_end = loc + line_speed * stat[:, 5].max()
+        self_min = np.minimum(loc, self_end) - margin
+        self_max = np.maximum(loc, self_end) + margin
+        other_min = np.minimum(loc, other_end) - margin
+        other_max = np.maximum(loc, other_end) + margin
+        valid &= ((self_min[:, None] <= other_max[None, :])
+                  & (other_min[None, :] <= self_max[:, None])).all(axis=2)
+        # NOTE: pairs are kept in (self robot, other robot) row-major order
+        self_ids, other_ids = np.nonzero(valid)
+        if self_ids.size == 0:
+            return
+
+        x, y, vx, vy, radius, predict_time, speed_mod = stat[self_ids].T
+        other_x, other_y, other_vx, other_vy, other_radius, _, other_speed_mod = \
+            stat[other_ids].T
+
+        # draw moving line within collision_predict_time
+        predicted_x = x + vx * predict_time
+        predicted_y = y + vy * predict_time
+        other_predicted_x = other_x + other_vx * predict_time
+        other_predicted_y = other_y + other_vy * predict_time
+
+        # consider robot's radius: two track lines for each robot,
+        #   stacked along the first axis
+        side = np.array([[1.0], [-1.0]])
+        add_x = side * (vy / speed_mod * radius)
+        add_y = side * (-vx / speed_mod * radius)
+        other_add_x = side * (other_vy / other_speed_mod * other_radius)
+        other_add_y = side * (-other_vx / other_speed_mod * other_radius)
+        self_track_lines = (
+            (x + add_x, y + add_y),
+            (predicted_x + add_x, predicted_y + add_y),
+        )
+        track_lines = (
+            (other_x + other_add_x, other_y + other_add_y),
+            (other_predicted_x + other_add_x, other_predicted_y + other_add_y),
+        )
+
+        turn = np.empty(self_ids.shape)
+        turn.fill(np.nan)
+        speed_cap = np.empty(self_ids.shape)
+        speed_cap.fill(np.inf)
+        radius_sum = other_radius + radius
+        dot = vx * other_vx + vy * other_vy
+
+        # parallel: check if self track is between the other two track lines
+        parallel = batchIsParallel(
+            (self_track_lines[0][0][0], self_track_lines[0][1][0]),
+            (self_track_lines[1][0][0], self_track_lines[1][1][0]),
+            (track_lines[0][0][0], track_lines[0][1][0]),
+            (track_lines[1][0][0], track_lines[1][1][0]))
+        if parallel.any():
+            # (start / end point, track line, pair)
+            points = (
+                np.stack([self_track_lines[0][0], self_track_lines[1][0]]),
+                np.stack([self_track_lines[0][1], self_track_lines[1][1]]),
+            )
+            between = batchIsBetween(
+                points,
+                (track_lines[0][0][0], track_lines[0][1][0]),
+                (track_lines[1][0][0], track_lines[1][1][0]),
+                (track_lines[0][0][1], track_lines[0][1][1]),
+                (track_lines[1][0][1], track_lines[1][1][1]))
+            parallel_hit = parallel & between.all(axis=0).any(axis=0)
+            same_direction = dot >= episilon if self.revised else dot >= 0
+            too_close = (np.sqrt((x - other_x) ** 2 + (y - other_y) ** 2) <= radius_sum) \
+                | (np.sqrt((predicted_x - other_x) ** 2 + (predicted_y - other_y) ** 2) <= radius_sum) \
+                | (np.sqrt((x - other_predicted_x) ** 2 + (y - other_predicted_y) ** 2) <= radius_sum)
+            # opposite direction: turn right
+            turn[parallel_hit & ~same_direction & too_close] = \
+                -avoid_collision_angular_speed
+
+        # not parallel: check if any two track lines intersect
+        intersect = batchIsIntersect(
+            (self_track_lines[0][0][:, None], self_track_lines[0][1][:, None]),
+            (self_track_lines[1][0][:, None], self_track_lines[1][1][:, None]),
+            (track_lines[0][0][None, :], track_lines[0][1][None, :]),
+            (track_lines[1][0][None, :], track_lines[1][1][None, :]))
+        crossing = ~parallel & intersect.any(axis=(0, 1))
+        if crossing.any():
+            self._solveCrossing(
+                crossing, turn, speed_cap,
+                x, y, vx, vy, speed_mod, radius, predict_time,
+                other_x, other_y, other_vx, other_vy, other_speed_mod,
+                other_radius, predicted_x, predicted_y,
+                other_predicted_x, other_predicted_y, radius_sum, dot)
+
+        for k in np.flatnonzero(~np.isnan(turn)).tolist():
+            self.robot_turn[self_ids[k]] = float(turn[k])
+        for k in np.flatnonzero(speed_cap < math.inf).tolist():
+            robot_id = self_ids[k]
+            self.robot_speed_cap[robot_id] = min(
+                self.robot_speed_cap[robot_id], float(speed_cap[k]))
+
+    def _solveCrossing(self, crossing, turn, speed_cap,
+                       x, y, vx, vy, speed_mod, radius, predict_time,
+                       other_x, other_y, other_vx, other_vy, other_speed_mod,
+                       other_radius, predicted_x, predicted_y,
+                       other_predicted_x, other_predicted_y, radius_sum, dot):
+        same_direction_threshold = self.same_direction_threshold
+        avoid_collision_angular_speed = \
+            self.params["avoid_collision_angular_speed"]
+
+        # may collision: get crossed point and arriving time
+        cross_x, cross_y = batchCrossPoint(
+            (x, y), (predicted_x, predicted_y),
+            (other_x, other_y), (other_predicted_x, other_predicted_y))
+        self_arriving_time = np.sqrt(
+            (cross_x - x) ** 2 + (cross_y - y) ** 2) / speed_mod
+        robot_arriving_time = np.sqrt(
+            (cross_x - other_x) ** 2 + (cross_y - other_y) ** 2) / other_speed_mod
+        arrive_later = self_arriving_time > robot_arriving_time
+
+        # opposite direction
+        opposite = crossing & (dot < 0)
+        large_angle = np.zeros(crossing.shape, dtype=bool)
+        if opposite.any():
+            self_angle = np.arctan2(vy, vx)
+            self_angle = np.where(
+                self_angle < 0, self_angle + 2 * np.pi, self_angle)
+            robot_angle = np.arctan2(-other_vy, -other_vx) \
+                if self.revised else np.arctan2(other_vy, other_vx)
+            robot_angle = np.where(
+                robot_angle < 0, robot_angle + 2 * np.pi, robot_angle)
+            angle_diff = self_angle - robot_angle
+            angle_diff = np.where(
+                angle_diff < 0, angle_diff + 2 * np.pi, angle_diff)
+            if self.revised:
+                angle_diff = np.minimum(angle_diff, 2 * math.pi - angle_diff)
+            large_angle = angle_diff > same_direction_threshold
+            # if angle diff is small: turn
+            # TODO: left and right may be reversed
+            on_right = other_vx * (y - other_y) - \
+                other_vy * (x - other_x) > 0
+            turn_mask = opposite & ~large_angle
+            turn[turn_mask] = np.where(
+                on_right, -avoid_collision_angular_speed,
+                avoid_collision_angular_speed)[turn_mask]
+
+        # same direction: if another robot is by the wall, stop and wait
+        same = crossing & ~(dot < 0)
+        if same.any():
+            def byCorner(loc_x, loc_y, r):
+                return (np.sqrt((loc_x - 0) ** 2 + (loc_y - 0) ** 2) <= r) \
+                    | (np.sqrt((loc_x - 0) ** 2 + (loc_y - 50) ** 2) <= r) \
+                    | (np.sqrt((loc_x - 50) ** 2 + (loc_y - 0) ** 2) <= r) \
+                    | (np.sqrt((loc_x - 50) ** 2 + (loc_y - 50) ** 2) <= r)
+
+            stop = same & byCorner(other_x, other_y, other_radius) \
+                & ~byCorner(x, y, radius)
+            speed_cap[stop] = 0
+
+        # arrives later: slow down
+        slow_down = arrive_later & ((opposite & large_angle) | same)
+        if slow_down.any():
+            speed_cap[slow_down] = np.minimum(
+                speed_cap[slow_down],
+                self.safeSpeed(
+                    x[slow_down], y[slow_down], vx[slow_down], vy[slow_down],
+                    speed_mod[slow_down], predict_time[slow_down],
+                    cross_x[slow_down], cross_y[slow_down],
+                    radius_sum[slow_down]))
+
+    @staticmethod
+    def tooClose(l_speed, x, y, vx, vy, speed_mod, predict_time,
+                 cross_x, cross_y, radius_sum) -> np.ndarray:
+        predicted_x = x + l_speed * vx / speed_mod * predict_time * 1.2
+        predicted_y = y + l_speed * vy / speed_mod * predict_time * 1.2
+        return np.sqrt(
+            (predicted_x - cross_x) ** 2 +
+            (predicted_y - cross_y) ** 2
+        ) < radius_sum
+
+    def safeSpeed(self, x, y, vx, vy, speed_mod, predict_time,
+                  cross_x, cross_y, radius_sum) -> np.ndarray:
+        # maximum speed that avoid collision, all inputs are 1-D arrays
+        # NOTE: squared distance to the crossing point is a quadratic in speed,
+        #   the speeds that are too close lie strictly between its two roots
+        args = (x, y, vx, vy, speed_mod, predict_time,
+                cross_x, cross_y, radius_sum)
+        # NOTE: a few encounters per frame are cheaper with plain math
+        if x.size <= self.scalar_batch_size:
+            return np.array([
+                self.scalarSafeSpeed(*encounter)
+                for encounter in zip(*[arg.tolist() for arg in args])
+            ], dtype=np.float64)
+
+        margin = self.root_margin
+        scale = predict_time * 1.2
+        diff_x, diff_y = cross_x - x, cross_y - y
+        proj = (vx * diff_x + vy * diff_y) / speed_mod
+        disc = proj ** 2 - (diff_x ** 2 + diff_y ** 2) + radius_sum ** 2
+        sqrt_disc = np.sqrt(np.maximum(disc, 0))
+        low_root = np.where(disc < 0, np.inf, (proj - sqrt_disc) / scale)
+        high_root = np.where(disc < 0, np.inf, (proj + sqrt_disc) / scale)
+
+        # replay the bisection against the roots, which needs no distance
+        #   evaluation; mids that fall on a root are left to the exact search
+        uncertain = np.abs(disc) <= margin
+        min_l_speed = np.zeros(x.shape)
+        max_l_speed = np.full(x.shape, float(self.max_line_speed))
+        while (max_l_speed - min_l_speed > self.episilon).any():
+            mid_l_speed = (min_l_speed + max_l_speed) / 2
+            uncertain |= (np.abs(mid_l_speed - low_root) <= margin) \
+                | (np.abs(mid_l_speed - high_root) <= margin)
+            too_close = (mid_l_speed > low_root) & (mid_l_speed < high_root)
+            max_l_speed = np.where(too_close, mid_l_speed, max_l_speed)
+            min_l_speed = np.where(too_close, min_l_speed, mid_l_speed)
+
+        if uncertain.any():
+            min_l_speed[uncertain] = self.bisectSafeSpeed(
+                *[arg[uncertain] for arg in args])
+        return min_l_speed
+
+    def scalarSafeSpeed(self, x, y, vx, vy, speed_mod, predict_time,
+                        cross_x, cross_y, radius_sum) -> float:
+        margin = self.root_margin
+        scale = predict_time * 1.2
+        diff_x, diff_y = cross_x - x, cross_y - y
+        proj = (vx * diff_x + vy * diff_y) / speed_mod
+        disc = proj ** 2 - (diff_x ** 2 + diff_y ** 2) + radius_sum ** 2
+        if disc < -margin:
+            low_root = high_root = math.inf
+        elif disc <= margin:
+            return self.scalarBisectSafeSpeed(
+                x, y, vx, vy, speed_mod, predict_time,
+                cross_x, cross_y, radius_sum)
+        else:
+            sqrt_disc = math.sqrt(disc)
+            low_root = (proj - sqrt_disc) / scale
+            high_root = (proj + sqrt_disc) / scale
+
+        min_l_speed, max_l_speed = 0.0, float(self.max_line_speed)
+        while max_l_speed - min_l_speed > self.episilon:
+            mid_l_speed = (min_l_speed + max_l_speed) / 2
+            if abs(mid_l_speed - low_root) <= margin \
+                    or abs(mid_l_speed - high_root) <= margin:
+                return self.scalarBisectSafeSpeed(
+                    x, y, vx, vy, speed_mod, predict_time,
+                    cross_x, cross_y, radius_sum)
+            if low_root < mid_l_speed < high_root:
+                max_l_speed = mid_l_speed
+            else:
+                min_l_speed = mid_l_speed
+        return min_l_speed
+
+    def scalarBisectSafeSpeed(self, x, y, vx, vy, speed_mod, predict_time,
+                              cross_x, cross_y, radius_sum) -> float:
+        min_l_speed, max_l_speed = 0.0, float(self.max_line_speed)
+        while max_l_speed - min_l_speed > self.episilon:
+            mid_l_speed = (min_l_speed + max_l_speed) / 2
+            predicted_x = x + mid_l_speed * vx / speed_mod * predict_time * 1.2
+            predicted_y = y + mid_l_speed * vy / speed_mod * predict_time * 1.2
+            if math.sqrt(
+                (predicted_x - cross_x) ** 2 +
+                (predicted_y - cross_y) ** 2
+            ) < radius_sum:
+                max_l_speed = mid_l_speed
+            else:
+                min_l_speed = mid_l_speed
+        return min_l_speed
+
+    def bisectSafeSpeed(self, x, y, vx, vy, speed_mod, predict_time,
+                        cross_x, cross_y, radius_sum) -> np.ndarray:
+        # search for maximum speed that avoid collision
+        args = (x, y, vx, vy, speed_mod, predict_time,
+                cross_x, cross_y, radius_sum)
+        min_l_speed = np.zeros(x.shape)
+        max_l_speed = np.full(x.shape, float(self.max_line_speed))
+        while (max_l_speed - min_l_speed > self.episilon).any():
+            mid_l_speed = (min_l_speed + max_l_speed) / 2
+            too_close = self.tooClose(mid_l_speed, *args)
+            max_l_speed = np.where(too_close, mid_l_speed, max_l_speed)
+            min_l_speed = np.where(too_close, min_l_speed, mid_l_speed)
+        return min_l_speed
@@ -0,0 +1,113 @@
+from collections.abc import Mapping
+from typing import Any, Dict, Iterator
+
+import numpy as np
+
+STATION_DTYPE = np.dtype([
+    ("station_type", np.int64),
+    ("loc_x", np.float64),
+    ("loc_y", np.float64),
+    ("remain_time", np.int64),
+    ("input_status", np.int64),
+    ("output_status", np.int64),
+])
+ROBOT_DTYPE = np.dtype([
+    ("station_id", np.int64),
+    ("item_type", np.int64),
+    ("time_coef", np.float64),
+    ("momentum_coef", np.float64),
+    ("angular_speed", np.float64),
+    ("line_speed_x", np.float64),
+    ("line_speed_y", np.float64),
+    ("theta", np.float64),
+    ("loc_x", np.float64),
+    ("loc_y", np.float64),
+])
+
+
+class ObsRecord(Mapping):
+    # NOTE: read-only dict view of one row, values are plain python numbers
+    __slots__ = ("values",)
+    fields: Dict[str, int] = {}
+
+    def __init__(self, values: tuple) -> None:
+        self.values = values
+
+    def __getitem__(self, key: str) -> Any:
+        return self.values[self.fields[key]]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.fields)
+
+    def __len__(self) -> int:
+        return len(self.fields)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
+
+
+class StationRecord(ObsRecord):
+    __slots__ = ()
+    fields = {name: i for i, name in enumerate(STATION_DTYPE.names)}
+
+
+class RobotRecord(ObsRecord):
+    __slots__ = ()
+    fields = {name: i for i, name in enumerate(ROBOT_DTYPE.names)}
+
+
+class CompactObs(Mapping):
+    """
+    Observation backed by structured arrays,
+        obs["stations"][i]["loc_x"] works as with the dict observation,
+        obs.station_array["loc_x"] gives the whole column
+    """
+    __slots__ = (
+        "frame_id", "money",
+        "station_array", "robot_array",
+        "stations", "robots",
+    )
+    obs_keys = ("frame_id", "money", "stations", "robots")
+
+    def __init__(self,
+                 frame_id: int,
+                 money: int,
+                 station_array: np.ndarray,
+                 robot_array: np.ndarray) -> None:
+        self.frame_id = frame_id
+        self.money = money
+        self.station_array = station_array
+        self.robot_array = robot_array
+        # NOTE: one tuple per row from a single tolist() call, no dicts
+        self.stations = list(map(StationRecord, station_array.tolist()))
+        self.robots = list(map(RobotRecord, robot_array.tolist()))
+
+    @staticmethod
+    def fromValues(frame_id: int,
+                   money: int,
+                   station_values: np.ndarray,
+                   robot_values: np.ndarray) -> "CompactObs":
+        # (stations, 6) and (robots, 10) values in protocol order
+        # NOTE: agents keep references to old observations (task logs, robot_stat),
+        #   so every frame owns its arrays instead of sharing one buffer
+        station_array = np.empty(len(station_values), dtype=STATION_DTYPE)
+        for k, name in enumerate(STATION_DTYPE.names):
+            station_array[name] = station_values[:, k]
+        robot_array = np.empty(len(robot_values), dtype=ROBOT_DTYPE)
+        for k, name in enumerate(ROBOT_DTYPE.names):
+            robot_array[name] = robot_values[:, k]
+        return CompactObs(frame_id, money, station_array, robot_array)
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.obs_keys:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.obs_keys)
+
+    def __len__(self) -> int:
+        return len(self.obs_keys)
+
+    def __repr__(self) -> str:
+        return repr(dict(self))
@@ -0,0 +1,94 @@
+import dataclasses
+import enum
+from typing import Any, Dict, List, Optional
+
+
+class EventType(enum.Enum):
+    ROBOT_IDLE = 1
+    ITEM_BOUGHT = 2
+    ITEM_SOLD = 3  # NOTE: destroyed items are reported as sold
+    OUTPUT_READY = 4
+    INPUT_FREED = 5
+    PRODUCTION_DONE = 6  # remain_time hit 0
+
+
+@dataclasses.dataclass
+class Event:
+    event_type: EventType
+    frame_id: int
+    robot_id: int = -1
+    station_id: int = -1
+    item_type: int = 0
+
+
+class EventDetector:
+    """
+    Diff of consecutive observations as typed events,
+        keeps its own copy of the fields so reused observation buffers are safe
+    """
+
+    def __init__(self) -> None:
+        self.reset()
+
+    def reset(self) -> None:
+        self.station_states: Optional[List[tuple]] = None
+        self.robot_states: Optional[List[tuple]] = None
+        self.idle: Optional[List[bool]] = None
+
+    def diff(self, obs: Dict[str, Any], idle: List[bool]) -> List[Event]:
+        frame_id = obs["frame_id"]
+        station_states = [
+            (station["remain_time"], station["input_status"], station["output_status"])
+            for station in obs["stations"]
+        ]
+        robot_states = [
+            (robot["item_type"], robot["station_id"]) for robot in obs["robots"]
+        ]
+        events = []
+        if self.station_states is None \
+                or len(self.station_states) != len(station_states):
+            # the first frame, every idle robot needs a task
+            events += [
+                Event(EventType.ROBOT_IDLE, frame_id, robot_id=i)
+                for i, is_idle in enumerate(idle) if is_idle
+            ]
+        else:
+            for i, (is_idle, was_idle) in enumerate(zip(idle, self.idle)):
+                if is_idle and not was_idle:
+                    events.append(Event(EventType.ROBOT_IDLE, frame_id, robot_id=i))
+            for i, ((item_type, station_id), (last_item_type, last_station_id)) in \
+                    enumerate(zip(robot_states, self.robot_states)):
+                if item_type == last_item_type:
+                    continue
+                if last_item_type:
+                    events.append(Event(
+                        EventType.ITEM_SOLD, frame_id, robot_id=i,
+                        station_id=last_station_id, item_type=last_item_type))
+                if item_type:
+                    events.append(Event(
+                        EventType.ITEM_BOUGHT, frame_id, robot_id=i,
+                        station_id=station_id, item_type=item_type))
+            for i, (state, last_state) in \
+                    enumerate(zip(station_states, self.station_states)):
+                if state == last_state:
+                    continue
+                remain_time, input_status, output_status = state
+                last_remain_time, last_input_status, last_output_status = last_state
+                if output_status and not last_output_status:
+                    events.append(Event(EventType.OUTPUT_READY, frame_id, station_id=i))
+                freed = last_input_status & ~input_status
+                item_type = 0
+                while freed:
+                    if freed & 1:
+                        events.append(Event(
+                            EventType.INPUT_FREED, frame_id,
+                            station_id=i, item_type=item_type))
+                    freed >>= 1
+                    item_type += 1
+                if remain_time == 0 and last_remain_time > 0:
+                    events.append(Event(EventType.PRODUCTION_DONE, frame_id, station_id=i))
+
+        self.station_states = station_states
+        self.robot_states = robot_states
+        self.idle = list(idle)
+        return events
@@ -0,0 +1,534 @@
+import math
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from action_buffer import ActionBuffer
+from compact_obs import ROBOT_DTYPE, STATION_DTYPE, CompactObs
+from task_utils import batchDecayFunc
+
+MAP_SIZE = 50.0
+MAP_CELLS = 100
+FPS = 50
+MAX_FRAMES = 9000
+INIT_MONEY = 200000
+NUM_ROBOTS = 4
+
+# station type: (input item types, production frames, output item type)
+STATION_SPECS = {
+    1: ([], 50, 1),
+    2: ([], 50, 2),
+    3: ([], 50, 3),
+    4: ([1, 2], 500, 4),
+    5: ([1, 3], 500, 5),
+    6: ([2, 3], 500, 6),
+    7: ([4, 5, 6], 1000, 7),
+    8: ([7], 1, 0),
+    9: ([1, 2, 3, 4, 5, 6, 7], 1, 0),
+}
+# indexed by item type, 0 is no item
+BUY_PRICES = np.array([0, 3000, 4400, 5800, 15400, 17200, 19200, 76000])
+SELL_PRICES = np.array([0, 6000, 7600, 9200, 22500, 25000, 27500, 105000])
+
+# indexed by station type
+INPUT_MASKS = np.zeros(10, dtype=np.int64)
+PERIODS = np.zeros(10, dtype=np.int64)
+OUTPUT_ITEMS = np.zeros(10, dtype=np.int64)
+for _station_type, (_inputs, _period, _output) in STATION_SPECS.items():
+    INPUT_MASKS[_station_type] = sum(1 << item_type for item_type in _inputs)
+    PERIODS[_station_type] = _period
+    OUTPUT_ITEMS[_station_type] = _output
+
+ROBOT_RADIUS = 0.45
+CARRY_RADIUS = 0.53
+ROBOT_DENSITY = 20
+MAX_FORCE = 250
+MAX_TORQUE = 50
+LINE_SPEED_RANGE = (-2, 6)
+ANGULAR_SPEED_RANGE = (-math.pi, math.pi)
+STATION_RANGE = 0.4
+
+# robot pairs of one game, collisions are checked for all of them at once
+PAIR_I, PAIR_J = np.triu_indices(NUM_ROBOTS, k=1)
+
+
+def parseMap(env_map: List[str]) -> Tuple[List[int], np.ndarray, np.ndarray]:
+    # map rows from top to bottom, ids in reading order as the judge does
+    station_types, station_locs, robot_locs = [], [], []
+    for row, line in enumerate(env_map[:MAP_CELLS]):
+        for col, cell in enumerate(line.strip()[:MAP_CELLS]):
+            loc = (col * 0.5 + 0.25, MAP_SIZE - row * 0.5 - 0.25)
+            if cell.isdigit() and cell != "0":
+                station_types.append(int(cell))
+                station_locs.append(loc)
+            elif cell == "A":
+                robot_locs.append(loc)
+    if len(robot_locs) != NUM_ROBOTS:
+        raise ValueError(f"Map needs {NUM_ROBOTS} robots, got {len(robot_locs)}")
+    return station_types, \
+        np.array(station_locs, dtype=float).reshape(-1, 2), \
+        np.array(robot_locs, dtype=float)
+
+
+def readMap(map_path: str) -> List[str]:
+    with open(map_path) as f:
+        return [line.rstrip("\n") for line in f if line.strip()][:MAP_CELLS]
+
+
+def randomMap(seed: int = 0,
+              station_counts: Optional[Dict[int, int]] = None) -> List[str]:
+    # a full production chain at random cells, robots near the center
+    station_counts = station_counts or {
+        1: 3, 2: 3, 3: 3, 4: 2, 5: 2, 6: 2, 7: 1, 8: 1, 9: 1}
+    rng = np.random.default_rng(seed)
+    cells = [["."] * MAP_CELLS for _ in range(MAP_CELLS)]
+    for k in range(NUM_ROBOTS):
+        cells[MAP_CELLS // 2][MAP_CELLS // 2 - 6 + 4 * k] = "A"
+    # NOTE: stations keep 3 cells away from each other and the border
+    grid = [(row, col)
+            for row in range(4, MAP_CELLS - 4, 3)
+            for col in range(4, MAP_CELLS - 4, 3)
+            if row != MAP_CELLS // 2]
+    num_stations = sum(station_counts.values())
+    picks = rng.choice(len(grid), size=num_stations, replace=False)
+    station_types = [
+        station_type
+        for station_type, count in sorted(station_counts.items())
+        for _ in range(count)
+    ]
+    for pick, station_type in zip(picks, station_types):
+        row, col = grid[pick]
+        cells[row][col] = str(station_type)
+    return ["".join(row) for row in cells]
+
+
+def parseActions(actions: List[str]) -> List[Tuple[str, int, float]]:
+    commands = []
+    for action in actions:
+        items = action.split()
+        if not items:
+            continue
+        value = float(items[2]) if len(items) > 2 else 0.0
+        commands.append((items[0], int(items[1]), value))
+    return commands
+
+
+class BatchSimulator:
+    """
+    Headless stand-in for the judge binary, K games stepped in lockstep,
+        station timers and robot kinematics are arrays with a game axis
+    """
+
+    def __init__(self,
+                 env_maps: List[List[str]],
+                 max_frames: int = MAX_FRAMES) -> None:
+        self.env_maps = env_maps
+        self.num_games = len(env_maps)
+        self.max_frames = max_frames
+        self.dt = 1 / FPS
+        self.reset()
+
+    def reset(self) -> None:
+        parsed_maps = [parseMap(env_map) for env_map in self.env_maps]
+        num_games = self.num_games
+        max_stations = max(1, max(len(types) for types, _, _ in parsed_maps))
+
+        # stations, padded to the largest map
+        self.num_stations = [len(types) for types, _, _ in parsed_maps]
+        self.station_type = np.zeros((num_games, max_stations), dtype=np.int64)
+        self.station_loc = np.zeros((num_games, max_stations, 2))
+        for k, (types, locs, _) in enumerate(parsed_maps):
+            self.station_type[k, :len(types)] = types
+            self.station_loc[k, :len(types)] = locs
+        self.input_mask = INPUT_MASKS[self.station_type]
+        self.period = PERIODS[self.station_type]
+        self.has_output = OUTPUT_ITEMS[self.station_type] > 0
+        self.is_sink = np.isin(self.station_type, [8, 9])
+        self.remain_time = np.full((num_games, max_stations), -1, dtype=np.int64)
+        self.input_status = np.zeros((num_games, max_stations), dtype=np.int64)
+        self.output_status = np.zeros((num_games, max_stations), dtype=np.int64)
+        # NOTE: station values never change, so their dicts are built once
+        self.station_static = [
+            list(zip(types, locs[:, 0].tolist(), locs[:, 1].tolist()))
+            for types, locs, _ in parsed_maps
+        ]
+
+        # robots
+        self.robot_loc = np.stack([locs for _, _, locs in parsed_maps])
+        self.theta = np.zeros((num_games, NUM_ROBOTS))
+        self.velocity = np.zeros((num_games, NUM_ROBOTS, 2))
+        self.angular_speed = np.zeros((num_games, NUM_ROBOTS))
+        self.target_line_speed = np.zeros((num_games, NUM_ROBOTS))
+        self.target_angular_speed = np.zeros((num_games, NUM_ROBOTS))
+        self.item_type = np.zeros((num_games, NUM_ROBOTS), dtype=np.int64)
+        self.hold_frames = np.zeros((num_games, NUM_ROBOTS))
+        self.impulse = np.zeros((num_games, NUM_ROBOTS))
+        self.station_id = np.full((num_games, NUM_ROBOTS), -1, dtype=np.int64)
+
+        self.money = np.full(num_games, float(INIT_MONEY))
+        self.frame_id = 1
+        self._updateRobotStations()
+
+    @property
+    def done(self) -> bool:
+        return self.frame_id > self.max_frames
+
+    def scores(self) -> List[int]:
+        return np.floor(self.money).astype(int).tolist()
+
+    def robotCoefs(self) -> Tuple[np.ndarray, np.ndarray]:
+        # value coefficients of the carried items, 0 without an item
+        carrying = self.item_type > 0
+        time_coef = np.where(
+            carrying, batchDecayFunc(self.hold_frames, MAX_FRAMES, 0.8), 0.0)
+        momentum_coef = np.where(
+            carrying, batchDecayFunc(self.impulse, 1000, 0.8), 0.0)
+        return time_coef, momentum_coef
+
+    def observations(self) -> List[Dict[str, Any]]:
+        time_coef, momentum_coef = self.robotCoefs()
+        robot_columns = list(zip(
+            self.station_id.tolist(), self.item_type.tolist(),
+            time_coef.tolist(), momentum_coef.tolist(),
+            self.angular_speed.tolist(),
+            self.velocity[..., 0].tolist(), self.velocity[..., 1].tolist(),
+            self.theta.tolist(),
+            self.robot_loc[..., 0].tolist(), self.robot_loc[..., 1].tolist(),
+        ))
+        remain_time = self.remain_time.tolist()
+        input_status = self.input_status.tolist()
+        output_status = self.output_status.tolist()
+        money = self.scores()
+
+        observations = []
+        for k in range(self.num_games):
+            stations = [
+                {
+                    "station_type": station_type,
+                    "loc_x": loc_x,
+                    "loc_y": loc_y,
+                    "remain_time": remain,
+                    "input_status": input_stat,
+                    "output_status": output_stat,
+                }
+                for (station_type, loc_x, loc_y), remain, input_stat, output_stat
+                in zip(self.station_static[k], remain_time[k],
+                       input_status[k], output_status[k])
+            ]
+            robots = [
+                {
+                    "station_id": values[0],
+                    "item_type": values[1],
+                    "time_coef": values[2],
+                    "momentum_coef": values[3],
+                    "angular_speed": values[4],
+                    "line_speed_x": values[5],
+                    "line_speed_y": values[6],
+                    "theta": values[7],
+                    "loc_x": values[8],
+                    "loc_y": values[9],
+                }
+                for values in zip(*robot_columns[k])
+            ]
+            observations.append({
+                "frame_id": self.frame_id,
+                "money": money[k],
+                "stations": stations,
+                "robots": robots,
+            })
+        return observations
+
+    def stackedObs(self) -> Dict[str, Any]:
+        # structured (games, stations) and (games, robots) arrays,
+        #   padded stations have station_type 0
+        station_array = np.empty(self.station_type.shape, dtype=STATION_DTYPE)
+        station_array["station_type"] = self.station_type
+        station_array["loc_x"] = self.station_loc[..., 0]
+        station_array["loc_y"] = self.station_loc[..., 1]
+        station_array["remain_time"] = self.remain_time
+        station_array["input_status"] = self.input_status
+        station_array["output_status"] = self.output_status
+        time_coef, momentum_coef = self.robotCoefs()
+        robot_array = np.empty(self.item_type.shape, dtype=ROBOT_DTYPE)
+        robot_array["station_id"] = self.station_id
+        robot_array["item_type"] = self.item_type
+        robot_array["time_coef"] = time_coef
+        robot_array["momentum_coef"] = momentum_coef
+        robot_array["angular_speed"] = self.angular_speed
+        robot_array["line_speed_x"] = self.velocity[..., 0]
+        robot_array["line_speed_y"] = self.velocity[..., 1]
+        robot_array["theta"] = self.theta
+        robot_array["loc_x"] = self.robot_loc[..., 0]
+        robot_array["loc_y"] = self.robot_loc[..., 1]
+        return {
+            "frame_id": self.frame_id,
+            "money": np.floor(self.money).astype(np.int64),
+            "num_stations": np.array(self.num_stations),
+            "station_array": station_array,
+            "robot_array": robot_array,
+        }
+
+    def compactObservations(self) -> List[CompactObs]:
+        # per game views of one stacked frame
+        stacked_obs = self.stackedObs()
+        money = stacked_obs["money"].tolist()
+        return [
+            CompactObs(
+                self.frame_id, money[k],
+                stacked_obs["station_array"][k, :self.num_stations[k]],
+                stacked_obs["robot_array"][k])
+            for k in range(self.num_games)
+        ]
+
+    def step(self, actions: List[List[str]]) -> None:
+        # one frame for every game, actions[k] are the action strings of game k
+        for k, game_actions in enumerate(actions):
+            self._applyActions(k, parseActions(game_actions))
+        self._stepRobots()
+        self._stepStations()
+        self.hold_frames += self.item_type > 0
+        self._updateRobotStations()
+        self.frame_id += 1
+
+    def _applyActions(self, k: int, commands: List[Tuple[str, int, float]]) -> None:
+        # NOTE: trades happen in command order, at the station seen in the last frame
+        for command, robot_id, value in commands:
+            if command == "forward":
+                self.target_line_speed[k, robot_id] = min(
+                    max(value, LINE_SPEED_RANGE[0]), LINE_SPEED_RANGE[1])
+            elif command == "rotate":
+                self.target_angular_speed[k, robot_id] = min(
+                    max(value, ANGULAR_SPEED_RANGE[0]), ANGULAR_SPEED_RANGE[1])
+            elif command == "buy":
+                self._buy(k, robot_id)
+            elif command == "sell":
+                self._sell(k, robot_id)
+            elif command == "destroy":
+                self.item_type[k, robot_id] = 0
+            else:
+                raise ValueError(f"Unknown action {command}")
+
+    def _buy(self, k: int, robot_id: int) -> None:
+        station_id = self.station_id[k, robot_id]
+        if station_id < 0 or self.item_type[k, robot_id] != 0 \
+                or not self.output_status[k, station_id]:
+            return
+        item_type = OUTPUT_ITEMS[self.station_type[k, station_id]]
+        if self.money[k] < BUY_PRICES[item_type]:
+            return
+        self.money[k] -= BUY_PRICES[item_type]
+        self.output_status[k, station_id] = 0
+        self.item_type[k, robot_id] = item_type
+        self.hold_frames[k, robot_id] = 0
+        self.impulse[k, robot_id] = 0
+
+    def _sell(self, k: int, robot_id: int) -> None:
+        station_id = self.station_id[k, robot_id]
+        item_type = self.item_type[k, robot_id]
+        if station_id < 0 or item_type == 0:
+            return
+        item_bit = 1 << int(item_type)
+        if not self.input_mask[k, station_id] & item_bit \
+                or self.input_status[k, station_id] & item_bit:
+            return
+        time_coef = batchDecayFunc(self.hold_frames[k, robot_id], MAX_FRAMES, 0.8)
+        momentum_coef = batchDecayFunc(self.impulse[k, robot_id], 1000, 0.8)
+        self.money[k] += math.floor(
+            SELL_PRICES[item_type] * time_coef * momentum_coef)
+        self.input_status[k, station_id] |= item_bit
+        self.item_type[k, robot_id] = 0
+
+    def _stepRobots(self) -> None:
+        dt = self.dt
+        radius = np.where(self.item_type > 0, CARRY_RADIUS, ROBOT_RADIUS)
+        mass = ROBOT_DENSITY * np.pi * radius ** 2
+        inertia = 0.5 * mass * radius ** 2
+
+        # NOTE: approximate kinematics, the traction force only acts along the heading
+        heading = np.stack([np.cos(self.theta), np.sin(self.theta)], axis=-1)
+        line_speed = (self.velocity * heading).sum(axis=-1)
+        max_delta = MAX_FORCE / mass * dt
+        line_speed += np.clip(
+            self.target_line_speed - line_speed, -max_delta, max_delta)
+        max_delta = MAX_TORQUE / inertia * dt
+        self.angular_speed += np.clip(
+            self.target_angular_speed - self.angular_speed, -max_delta, max_delta)
+        self.theta = np.mod(
+            self.theta + self.angular_speed * dt + np.pi, 2 * np.pi) - np.pi
+        heading = np.stack([np.cos(self.theta), np.sin(self.theta)], axis=-1)
+        self.velocity = line_speed[..., None] * heading
+        self.robot_loc += self.velocity * dt
+
+        self._collideRobots(radius, mass)
+        self._collideWalls(radius, mass)
+
+    def _collideRobots(self, radius: np.ndarray, mass: np.ndarray) -> None:
+        # inelastic contact of all robot pairs, (games, pairs)
+        delta = self.robot_loc[:, PAIR_J] - self.robot_loc[:, PAIR_I]
+        dist = np.linalg.norm(delta, axis=-1)
+        overlap = radius[:, PAIR_I] + radius[:, PAIR_J] - dist
+        hit = overlap > 0
+        if not hit.any():
+            return
+        normal = delta / np.maximum(dist, 1e-9)[..., None]
+        mass_i, mass_j = mass[:, PAIR_I], mass[:, PAIR_J]
+        reduced_mass = mass_i * mass_j / (mass_i + mass_j)
+
+        # separate along the normal, the lighter robot moves more
+        shift = np.where(hit, overlap, 0)[..., None] * normal
+        loc_delta = np.zeros_like(self.robot_loc)
+        np.add.at(loc_delta, (slice(None), PAIR_I),
+                  -shift * (reduced_mass / mass_i)[..., None])
+        np.add.at(loc_delta, (slice(None), PAIR_J),
+                  shift * (reduced_mass / mass_j)[..., None])
+
+        # cancel the approaching normal velocity
+        rel_speed = ((self.velocity[:, PAIR_J] - self.velocity[:, PAIR_I])
+                     * normal).sum(axis=-1)
+        impulse = np.where(hit & (rel_speed < 0), -rel_speed * reduced_mass, 0)
+        velocity_delta = np.zeros_like(self.velocity)
+        np.add.at(velocity_delta, (slice(None), PAIR_I),
+                  -(impulse / mass_i)[..., None] * normal)
+        np.add.at(velocity_delta, (slice(None), PAIR_J),
+                  (impulse / mass_j)[..., None] * normal)
+        np.add.at(self.impulse, (slice(None), PAIR_I), impulse)
+        np.add.at(self.impulse, (slice(None), PAIR_J), impulse)
+
+        self.robot_loc += loc_delta
+        self.velocity += velocity_delta
+
+    def _collideWalls(self, radius: np.ndarray, mass: np.ndarray) -> None:
+        low, high = radius[..., None], MAP_SIZE - radius[..., None]
+        outside = (self.robot_loc < low) & (self.velocity < 0) \
+            | (self.robot_loc > high) & (self.velocity > 0)
+        self.impulse += (np.abs(np.where(outside, self.velocity, 0)).sum(axis=-1)
+                         * mass)
+        self.velocity[outside] = 0
+        self.robot_loc = np.clip(self.robot_loc, low, high)
+
+    def _stepStations(self) -> None:
+        producing = self.remain_time > 0
+        self.remain_time[producing] -= 1
+        # NOTE: a finished product waits with remain_time 0 until the output is empty
+        deliver = (self.remain_time == 0) & (self.output_status == 0)
+        self.output_status[deliver] = 1
+        self.remain_time[deliver] = -1
+        start = (self.remain_time == -1) & self.has_output \
+            & (self.input_status & self.input_mask == self.input_mask)
+        self.input_status[start] = 0
+        self.remain_time[start] = self.period[start]
+        # sinks consume whatever was sold to them
+        self.input_status[self.is_sink] = 0
+
+    def _updateRobotStations(self) -> None:
+        # nearest station in range, (games, robots, stations)
+        dist = np.linalg.norm(
+            self.robot_loc[:, :, None] - self.station_loc[:, None], axis=-1)
+        dist[self.station_type[:, None].repeat(NUM_ROBOTS, axis=1) == 0] = np.inf
+        nearest = dist.argmin(axis=-1)
+        in_range = np.take_along_axis(
+            dist, nearest[..., None], axis=-1)[..., 0] <= STATION_RANGE
+        self.station_id = np.where(in_range, nearest, -1)
+
+
+class HeadlessEnv:
+    """
+    In-process replacement of EnvWrapper,
+        same reset/recv/send protocol on a single game BatchSimulator
+    """
+
+    def __init__(self,
+                 env_map: List[str],
+                 max_frames: int = MAX_FRAMES) -> None:
+        self.env_map = env_map
+        self.simulator = BatchSimulator([env_map], max_frames)
+
+    def reset(self) -> Dict[str, Any]:
+        self.simulator.reset()
+        return {"map": self.env_map}
+
+    def recv(self) -> Tuple[Optional[Dict], bool]:
+        if self.simulator.done:
+            return None, True
+        return self.simulator.observations()[0], False
+
+    def send(self, actions: List[str]) -> None:
+        self.simulator.step([list(actions)])
+
+    def close(self) -> None:
+        pass
+
+    @property
+    def score(self) -> int:
+        return self.simulator.scores()[0]
+
+
+class VecEnv:
+    """
+    K independent games stepped in lockstep,
+        reset/recv/send of EnvWrapper with one entry per game
+    """
+
+    def __init__(self,
+                 env_maps: List[List[str]],
+                 max_frames: int = MAX_FRAMES,
+                 compact_obs: bool = False) -> None:
+        self.env_maps = env_maps
+        self.num_envs = len(env_maps)
+        # NOTE: array backed observations, see compact_obs.py
+        self.compact_obs = compact_obs
+        self.simulator = BatchSimulator(env_maps, max_frames)
+
+    def reset(self) -> List[Dict[str, Any]]:
+        self.simulator.reset()
+        return [{"map": env_map} for env_map in self.env_maps]
+
+    def recv(self) -> Tuple[Optional[List], bool]:
+        # all games share the frame counter, so they end together
+        if self.simulator.done:
+            return None, True
+        if self.compact_obs:
+            return self.simulator.compactObservations(), False
+        return self.simulator.observations(), False
+
+    def stackedObs(self) -> Dict[str, Any]:
+        return self.simulator.stackedObs()
+
+    def send(self, actions: List[Union[List[str], ActionBuffer]]) -> None:
+        self.simulator.step([list(game_actions) for game_actions in actions])
+
+    def close(self) -> None:
+        pass
+
+    def scores(self) -> List[int]:
+        return self.simulator.scores()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    from item_centric.agent import ItemBasedAgent
+    from item_centric.scheduler import GreedyScheduler
+    from utils import fixSeed
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--map", default="", help="map file, random map if empty")
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--max-frames", default=MAX_FRAMES, type=int)
+    args = parser.parse_args()
+
+    fixSeed(args.seed)
+    env_map = readMap(args.map) if args.map else randomMap(args.seed)
+    env = HeadlessEnv(env_map, args.max_frames)
+    agent = ItemBasedAgent(GreedyScheduler())
+    env.reset()
+    start_time = time.perf_counter()
+    while True:
+        obs, done = env.recv()
+        if done:
+            break
+        env.send(agent.step(obs))
+    elapsed = time.perf_counter() - start_time
+    print(f"[INFO]: Score {env.score}, "
+          f"{args.max_frames / elapsed:.0f} frames/s")
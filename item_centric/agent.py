@@ -1,7 +1,15 @@
-from typing import Dict, List
+import sys
+import time
+from typing import Dict, List, Optional, Union
 
+from action_buffer import ActionBuffer
+from events import EventDetector
+from profiler import StageProfiler
 from task_to_subtask import TaskHelper
+from task_utils import MetaTask, TimeRange
 
+from .planner_process import PlannerProcess
+from .route_planner import RoutePlanner
 from .scheduler import BaseScheduler
 from .task_manager import ItemTaskManager
 
@@ -10,14 +18,42 @@ class ItemBasedAgent:
     def __init__(self,
                  scheduler: BaseScheduler,
                  use_revised_control=False,
-                 movement_params=None) -> None:
+                 movement_params=None,
+                 use_action_buffer=False,
+                 profiler: Optional[StageProfiler] = None,
+                 deadline: Optional[float] = None,
+                 plan_ahead: bool = False,
+                 event_driven: bool = False,
+                 reschedule_period: int = 50,
+                 background_planner: bool = False,
+                 use_sampling_control: bool = False) -> None:
         self.num_robots = 4
+        # NOTE: seconds of step for scheduling, then degrade to fallback
+        self.deadline = deadline
+        # NOTE: scheduling only runs on observation events,
+        #   or every reschedule_period frames
+        self.event_detector = EventDetector() if event_driven else None
+        self.reschedule_period = reschedule_period
         self.reset()
+        self.profiler = StageProfiler(enabled=False) \
+            if profiler is None else profiler
+        # NOTE: step returns the same ActionBuffer every frame
+        self.action_buffer = ActionBuffer(self.num_robots) \
+            if use_action_buffer else None
 
         self.scheduler = scheduler
         self.task_manager = ItemTaskManager()
+        # NOTE: busy robots get a chained next task, see route_planner.py
+        self.route_planner = RoutePlanner(scheduler, self.task_manager) \
+            if plan_ahead else None
+        # NOTE: scheduling runs in a worker process, this loop only does control
+        self.planner_process = PlannerProcess(scheduler) \
+            if background_planner else None
         self.task_helper = TaskHelper()
-        if not use_revised_control:
+        if use_sampling_control:
+            from subtask_to_action_sampling import SubtaskToAction
+            self.subtask_to_action = SubtaskToAction(movement_params)
+        elif not use_revised_control:
             from subtask_to_action import SubtaskToAction
             self.subtask_to_action = SubtaskToAction(movement_params)
         else:
@@ -29,27 +65,154 @@ class ItemBasedAgent:
         self.moneys, self.task_log = [], []
         self.last_frame = [0 for _ in range(self.num_robots)]
         self.assigned_tasks = [[] for _ in range(self.num_robots)]
+        self.last_candidate_tasks = []
+        self.num_degraded_frames = 0
+        self.num_skipped_frames = 0
+        self.num_dropped_plans = 0
+        self.last_schedule_frame = None
+        if self.event_detector is not None:
+            self.event_detector.reset()
 
-    def step(self, obs: Dict) -> List[str]:
+    def overDeadline(self, step_start_time: float) -> bool:
+        return self.deadline is not None \
+            and time.perf_counter() - step_start_time > self.deadline
+
+    def fallbackAssign(self, obs: Dict, idle_indices: List[int]) -> None:
+        # nearest ready src station among the latest candidate tasks
+        reservations = self.task_manager.reservationIndex(
+            obs, self.assigned_tasks)
+        robot_station_times = self.task_manager.robotStationTimes(obs)
+        # NOTE: candidates may be frames old, src must still have the output
+        #   or be producing it and dst must still take the item in the current obs
+        self.task_manager.forecaster.update(obs)
+        ready_tasks = []
+        for task in sum(self.last_candidate_tasks, []):
+            if task.robot_id != -1:
+                continue
+            src_station = obs["stations"][task.src_station_id]
+            if src_station["output_status"]:
+                src_ready = 0
+            elif src_station["remain_time"] >= 0:
+                src_ready = src_station["remain_time"]
+            else:
+                continue
+            ready_times = self.task_manager.readyTimes(
+                task.item_type, task.src_station_id, task.dst_station_id, obs)
+            if ready_times is None:
+                continue
+            ready_tasks.append((task, src_ready, ready_times[1]))
+        for robot_id in idle_indices:
+            if self.assigned_tasks[robot_id]:
+                continue
+            selected, min_time = None, float("inf")
+            for task, src_ready, dst_ready_time in ready_tasks:
+                if task.robot_id != -1 \
+                        or self.task_manager.reservationPenalty(
+                            task.item_type, task.src_station_id,
+                            task.dst_station_id, reservations) is None:
+                    continue
+                robot_src_time = max(
+                    robot_station_times[robot_id, task.src_station_id], src_ready)
+                # NOTE: ignore tasks that cannot be finished in time
+                if robot_src_time + task.dst_src_time + obs["frame_id"] >= 9000:
+                    continue
+                if robot_src_time < min_time:
+                    selected, min_time = (task, src_ready, dst_ready_time), robot_src_time
+            if selected is None:
+                continue
+            selected_task, src_ready, dst_ready_time = selected
+            selected_task.robot_id = robot_id
+            selected_task.src_ready_time = TimeRange(src_ready, src_ready)
+            selected_task.dst_ready_time = dst_ready_time
+            selected_task.dst_input_status = \
+                obs["stations"][selected_task.dst_station_id]["input_status"] \
+                | reservations.input_masks[selected_task.dst_station_id]
+            selected_task.update(obs)
+            self.assigned_tasks[robot_id].append(selected_task)
+            reservations.reserve(selected_task)
+
+    def acceptAssignments(self, obs: Dict) -> None:
+        # plans of the worker, dropped if the robot or the stations were taken since
+        reservations = self.task_manager.reservationIndex(
+            obs, self.assigned_tasks)
+        for robot_id, task in self.planner_process.poll(obs["frame_id"]):
+            if self.assigned_tasks[robot_id] \
+                    or self.task_manager.reservationPenalty(
+                        task.item_type, task.src_station_id,
+                        task.dst_station_id, reservations) is None:
+                self.num_dropped_plans += 1
+                continue
+            task.robot_id = robot_id
+            task.update(obs)
+            self.assigned_tasks[robot_id].append(task)
+            reservations.reserve(task)
+            self.last_frame[robot_id] = obs["frame_id"]
+
+    def close(self) -> None:
+        if self.planner_process is not None:
+            self.planner_process.close()
+
+    def reserveTask(self, task: MetaTask) -> None:
+        if self.task_manager.reservations is not None:
+            self.task_manager.reservations.reserve(task)
+
+    def releaseTask(self, task: MetaTask) -> None:
+        if self.task_manager.reservations is not None:
+            self.task_manager.reservations.release(task)
+
+    def step(self, obs: Dict) -> Union[List[str], ActionBuffer]:
+        with self.profiler.stage("step"):
+            return self._step(obs)
+
+    def _step(self, obs: Dict) -> Union[List[str], ActionBuffer]:
+        step_start_time = time.perf_counter()
         assert obs is not None
         self.last_obs = obs
         self.moneys.append(obs["money"])
 
         # check task status
-        for i, tasks in enumerate(self.assigned_tasks):
-            while tasks:
-                current_task = tasks[0]
-                current_task.update(obs)
-                if self.task_helper.isMetaTaskDone(current_task):
-                    self.task_log.append({
-                        "start_time": self.last_frame[i],
-                        "end_time": obs["frame_id"],
-                        "duration": obs["frame_id"] - self.last_frame[i],
-                        "task_info": current_task,
-                    })
-                    tasks.pop(0)
-                else:
-                    break
+        with self.profiler.stage("status"):
+            for i, tasks in enumerate(self.assigned_tasks):
+                while tasks:
+                    current_task = tasks[0]
+                    current_task.update(obs)
+                    if self.task_helper.isMetaTaskDone(current_task):
+                        self.task_log.append({
+                            "start_time": self.last_frame[i],
+                            "end_time": obs["frame_id"],
+                            "duration": obs["frame_id"] - self.last_frame[i],
+                            "task_info": current_task,
+                        })
+                        tasks.pop(0)
+                        self.releaseTask(current_task)
+                        # a chained task starts now
+                        self.last_frame[i] = obs["frame_id"]
+                    else:
+                        break
+        skipped = False
+        if self.planner_process is not None:
+            with self.profiler.stage("handoff"):
+                self.acceptAssignments(obs)
+                self.planner_process.publish(obs, self.assigned_tasks)
+            skipped = True
+        elif self.event_detector is not None:
+            with self.profiler.stage("events"):
+                events = self.event_detector.diff(
+                    obs, [not tasks for tasks in self.assigned_tasks])
+            if events or self.last_schedule_frame is None \
+                    or obs["frame_id"] - self.last_schedule_frame >= self.reschedule_period:
+                self.last_schedule_frame = obs["frame_id"]
+            else:
+                # nothing changed since the last decision
+                skipped = True
+                self.num_skipped_frames += 1
+        with self.profiler.stage("replan"):
+            # planned tasks that became impossible are dropped
+            # NOTE: skipped near the deadline, checked again on the next frame
+            if self.route_planner is not None and not skipped \
+                    and not self.overDeadline(step_start_time):
+                self.task_manager.genTasks(obs, self.assigned_tasks)
+                self.route_planner.replan(obs, self.assigned_tasks)
 
         # make decision
         # HACK: FIXME: DO NOT reschedule tasks, we avoid this by scheduling ahead
@@ -57,36 +220,94 @@ class ItemBasedAgent:
             i for i in range(self.num_robots)
             if not self.assigned_tasks[i]
         ]
-        for _ in range(len(idle_indices)):
-            candidate_tasks = \
-                self.task_manager.genTasks(
-                    obs, self.assigned_tasks)
-            result = self.scheduler.assign(
-                obs, candidate_tasks, self.assigned_tasks)
-            if not result:
-                break
+        if skipped:
+            idle_indices = []
+        degraded = False
+        if self.scheduler.assign_all:
+            degraded = bool(idle_indices) and self.overDeadline(step_start_time)
+            if idle_indices and not degraded:
+                with self.profiler.stage("genTasks"):
+                    candidate_tasks = \
+                        self.task_manager.genTasks(
+                            obs, self.assigned_tasks)
+                    self.last_candidate_tasks = candidate_tasks
+                degraded = self.overDeadline(step_start_time)
+            if idle_indices and not degraded:
+                with self.profiler.stage("assign"):
+                    self.scheduler.assignAll(
+                        obs, candidate_tasks, self.assigned_tasks,
+                        self.task_manager)
+        else:
+            for _ in range(len(idle_indices)):
+                degraded = self.overDeadline(step_start_time)
+                if degraded:
+                    break
+                with self.profiler.stage("genTasks"):
+                    candidate_tasks = \
+                        self.task_manager.genTasks(
+                            obs, self.assigned_tasks)
+                    self.last_candidate_tasks = candidate_tasks
+                degraded = self.overDeadline(step_start_time)
+                if degraded:
+                    break
+                with self.profiler.stage("assign"):
+                    result = self.scheduler.assign(
+                        obs, candidate_tasks, self.assigned_tasks,
+                        self.task_manager.robotStationTimes(obs))
+                if not result:
+                    break
+        # NOTE: near the deadline, remaining idle robots take the nearest task
+        if degraded:
+            self.num_degraded_frames += 1
+            with self.profiler.stage("fallback"):
+                self.fallbackAssign(obs, idle_indices)
         for index in idle_indices:
             if self.assigned_tasks[index]:
                 self.last_frame[index] = obs["frame_id"]
+                self.reserveTask(self.assigned_tasks[index][-1])
             else:
                 print(
                     f"[INFO]: Robot {index} is idle "
                     f"at frame {obs['frame_id']}"
                 )
+        if self.route_planner is not None and not degraded and not skipped \
+                and not self.overDeadline(step_start_time):
+            with self.profiler.stage("plan"):
+                self.route_planner.plan(
+                    obs, self.task_manager.genTasks(obs, self.assigned_tasks),
+                    self.assigned_tasks)
         # control
-        actions = [" "]
-        for meta_tasks in self.assigned_tasks:
-            if meta_tasks:
-                task = self.task_helper.makeTask(meta_tasks[0], obs)
-                subtask = self.task_helper.makeSubtask(task, obs)
-                action = self.subtask_to_action.getAction(subtask, obs)
-                actions += action
+        subtasks = [None] * self.num_robots
+        with self.profiler.stage("makeSubtask"):
+            for i, meta_tasks in enumerate(self.assigned_tasks):
+                if meta_tasks:
+                    task = self.task_helper.makeTask(meta_tasks[0], obs)
+                    # NOTE: a picked up item frees its src station
+                    self.reserveTask(meta_tasks[0])
+                    subtasks[i] = self.task_helper.makeSubtask(task, obs)
+        with self.profiler.stage("getAction"):
+            if self.action_buffer is not None:
+                self.action_buffer.clear()
+                self.action_buffer.append(" ")
+                return self.subtask_to_action.getActions(
+                    subtasks, obs, self.action_buffer)
+            actions = [" "]
+            actions += self.subtask_to_action.getActions(subtasks, obs)
 
         return actions
 
     def showStatistics(self, save_unfinished: bool = False) -> Dict:
         print(f"[INFO]: Score {self.moneys[-1]}")
         print(f"[INFO]: Max Score {max(self.moneys)}")
+        if self.deadline is not None:
+            print(f"[INFO]: Degrade mode fired in {self.num_degraded_frames} frames")
+        if self.event_detector is not None:
+            print(f"[INFO]: Decision skipped in {self.num_skipped_frames} frames")
+        if self.planner_process is not None:
+            latencies = self.planner_process.plan_latencies
+            print(
+                f"[INFO]: Worker plans {len(latencies)}, dropped {self.num_dropped_plans}, "
+                f"max latency {max(latencies, default=0)} frames")
 
         task_durations = [
             task_info["duration"]
@@ -109,22 +330,27 @@ class ItemBasedAgent:
                 task_durations.append(
                     self.last_obs["frame_id"] - self.last_frame[i])
 
-        import matplotlib.pyplot as plt
         import numpy as np
 
-        # time - money
-        fig, ax = plt.subplots()
-        ax.plot(self.moneys, label="money")
-        ax.set_xlabel("time")
-        ax.set_ylabel("money")
-        fig.savefig("money.png")
+        # NOTE: latency report replaces the plots when profiling
+        if self.profiler.enabled:
+            self.profiler.showReport(sys.stdout)
+        else:
+            import matplotlib.pyplot as plt
+
+            # time - money
+            fig, ax = plt.subplots()
+            ax.plot(self.moneys, label="money")
+            ax.set_xlabel("time")
+            ax.set_ylabel("money")
+            fig.savefig("money.png")
 
-        # task info
-        fig, ax = plt.subplots()
-        ax.hist(task_durations, bins=100)
-        ax.set_xlabel("duration")
-        ax.set_ylabel("count")
-        fig.savefig("task_durations.png")
+            # task info
+            fig, ax = plt.subplots()
+            ax.hist(task_durations, bins=100)
+            ax.set_xlabel("duration")
+            ax.set_ylabel("count")
+            fig.savefig("task_durations.png")
 
         print("[INFO]: Task duration {:.2f} +- {:.2f}".format(
             np.mean(task_durations), np.std(task_durations)))
@@ -179,12 +405,12 @@ class ReplayAgent:
                 f"at frame {obs['frame_id']}"
             )
         # control
-        actions = [" "]
-        for meta_tasks in self.assigned_tasks:
+        subtasks = [None] * self.num_robots
+        for i, meta_tasks in enumerate(self.assigned_tasks):
             if meta_tasks:
                 task = self.task_helper.makeTask(meta_tasks[0], obs)
-                subtask = self.task_helper.makeSubtask(task, obs)
-                action = self.subtask_to_action.getAction(subtask, obs)
-                actions += action
+                subtasks[i] = self.task_helper.makeSubtask(task, obs)
+        actions = [" "]
+        actions += self.subtask_to_action.getActions(subtasks, obs)
 
         return actions
@@ -0,0 +1,158 @@
+import sys
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+from task_utils import MetaTask
+
+from .task_manager import ItemTaskManager
+
+
+def linearProgram(c: np.ndarray,
+                  A_ub: np.ndarray,
+                  b_ub: np.ndarray,
+                  max_iter: int = 100000) -> np.ndarray:
+    # simplex with Bland's rule, maximize c @ x s.t. A_ub @ x <= b_ub, x >= 0
+    # NOTE: b_ub >= 0, the origin is feasible
+    eps = 1e-12
+    m, n = A_ub.shape
+    tableau = np.zeros((m + 1, n + m + 1))
+    tableau[:m, :n] = A_ub
+    tableau[:m, n:n + m] = np.eye(m)
+    tableau[:m, -1] = b_ub
+    tableau[-1, :n] = -c
+    basis = list(range(n, n + m))
+    for _ in range(max_iter):
+        entering = np.flatnonzero(tableau[-1, :-1] < -eps)
+        if not entering.size:
+            break
+        col = entering[0]
+        column = tableau[:m, col]
+        positive = np.flatnonzero(column > eps)
+        if not positive.size:
+            raise ValueError("unbounded linear program")
+        ratios = tableau[positive, -1] / column[positive]
+        candidates = positive[ratios <= ratios.min() + eps]
+        row = min(candidates, key=lambda i: basis[i])
+        tableau[row] /= tableau[row, col]
+        pivot_row = tableau[row].copy()
+        tableau -= np.outer(tableau[:, col], pivot_row)
+        tableau[row] = pivot_row
+        basis[row] = col
+    x = np.zeros(n + m)
+    x[basis] = tableau[:m, -1]
+    return x[:n]
+
+
+class FlowPlanner:
+    """
+    Steady state delivery rate of every (item, src, dst) edge,
+        solved once per map as a linear program over the station graph
+    """
+
+    def __init__(self,
+                 num_robots: int = 4,
+                 empty_factor: float = 1.0) -> None:
+        self.task_manager = None
+        self.num_robots = num_robots
+        # NOTE: empty travel to the next src, relative to the loaded travel
+        self.empty_factor = empty_factor
+        self.input_money = [3000, 4400, 5800, 15400, 17200, 19200, 76000]
+        self.output_money = [6000, 7600, 9200, 22500, 25000, 27500, 105000]
+        self.start_frame = None
+        self.last_frame = None
+        # (item, src, dst) -> items per frame
+        self.target_rates: Dict[Tuple[int, int, int], float] = {}
+        self.counts: Dict[Tuple[int, int, int], int] = {}
+
+    def edges(self) -> List[Tuple[int, int, int]]:
+        task_manager = self.task_manager
+        return [
+            (item_type, i, j)
+            for item_type, pairs in zip(task_manager.item_types, task_manager.task_pairs)
+            for i, j in pairs
+        ]
+
+    def solve(self, obs: Dict[str, Any]) -> Dict[Tuple[int, int, int], float]:
+        # NOTE: station graph of this map, same as the candidate tasks
+        task_manager = self.task_manager = ItemTaskManager()
+        task_manager.initStations(obs)
+        stations = obs["stations"]
+        edges = self.edges()
+        edge_index = {edge: k for k, edge in enumerate(edges)}
+        fps = task_manager.fps
+
+        value = np.array([
+            self.output_money[item_type - 1] - self.input_money[item_type - 1]
+            for item_type, _, _ in edges
+        ], dtype=np.float64)
+        # robot frames spent on one delivery
+        cost = np.array([
+            task_manager.station_times[i, j] * fps * (1 + self.empty_factor)
+            for _, i, j in edges
+        ])
+
+        A_ub, b_ub, A_eq = [cost], [self.num_robots], []
+        for s, station in enumerate(stations):
+            station_spec = task_manager.station_specs[station["station_type"]]
+            if not station_spec["output"]:
+                continue
+            output_row = np.zeros(len(edges))
+            for item_type, i, j in edges:
+                if i == s:
+                    output_row[edge_index[(item_type, i, j)]] = 1
+            # production capacity
+            A_ub.append(output_row)
+            b_ub.append(1 / station_spec["period"])
+            # every input is consumed once per product
+            for input_type in station_spec["input"]:
+                row = -output_row
+                for item_type, i, j in edges:
+                    if j == s and item_type == input_type:
+                        row[edge_index[(item_type, i, j)]] = 1
+                A_eq.append(row)
+
+        A_ub, b_ub = np.array(A_ub), np.array(b_ub)
+        A_eq = np.array(A_eq).reshape(-1, len(edges))
+        try:
+            from scipy.optimize import linprog
+            result = linprog(
+                -value, A_ub=A_ub, b_ub=b_ub,
+                A_eq=A_eq if len(A_eq) else None,
+                b_eq=np.zeros(len(A_eq)) if len(A_eq) else None,
+                bounds=(0, None), method="highs")
+            rates = result.x
+        except ImportError:
+            rates = linearProgram(
+                value, np.vstack([A_ub, A_eq, -A_eq]),
+                np.concatenate([b_ub, np.zeros(2 * len(A_eq))]))
+
+        self.target_rates = {
+            edge: float(rate) for edge, rate in zip(edges, rates) if rate > 1e-9}
+        self.counts = {}
+        self.start_frame = obs["frame_id"]
+        # NOTE: stdout may be the judge pipe
+        print(
+            f"[INFO]: Flow plan with {len(self.target_rates)} edges, "
+            f"{float(value @ rates):.1f} per frame", file=sys.stderr)
+        return self.target_rates
+
+    def update(self, obs: Dict[str, Any]) -> None:
+        # NOTE: solved again when a new game starts
+        if self.last_frame is None or obs["frame_id"] < self.last_frame:
+            self.solve(obs)
+        self.last_frame = obs["frame_id"]
+
+    def record(self, task: MetaTask) -> None:
+        edge = (task.item_type, task.src_station_id, task.dst_station_id)
+        self.counts[edge] = self.counts.get(edge, 0) + 1
+
+    def deficits(self, obs: Dict[str, Any], tasks: List[MetaTask]) -> np.ndarray:
+        # planned minus assigned deliveries so far, in items
+        elapsed = obs["frame_id"] - self.start_frame + 1
+        deficits = np.zeros(len(tasks))
+        for k, task in enumerate(tasks):
+            edge = (task.item_type, task.src_station_id, task.dst_station_id)
+            deficits[k] = self.target_rates.get(edge, 0.0) * elapsed \
+                - self.counts.get(edge, 0)
+        return deficits
@@ -0,0 +1,230 @@
+import dataclasses
+import multiprocessing
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from compact_obs import ROBOT_DTYPE, STATION_DTYPE, CompactObs
+from task_utils import MetaTask, TimeRange
+
+from .scheduler import BaseScheduler
+from .task_manager import ItemTaskManager
+
+MAX_STATIONS = 50
+MAX_QUEUE = 4
+NUM_ROBOTS = 4
+
+
+def slotDtype(max_stations: int = MAX_STATIONS, max_queue: int = MAX_QUEUE) -> np.dtype:
+    # NOTE: tasks are (item_type, src, dst, owned_item), item_type 0 is empty
+    return np.dtype([
+        ("seq", np.int64),
+        ("frame_id", np.int64),
+        ("money", np.int64),
+        ("num_stations", np.int64),
+        ("stations", STATION_DTYPE, (max_stations,)),
+        ("robots", ROBOT_DTYPE, (NUM_ROBOTS,)),
+        ("tasks", np.int64, (NUM_ROBOTS, max_queue, 4)),
+    ])
+
+
+class ObsRing:
+    """
+    Ring buffer of observations and assigned tasks in shared memory,
+        written by the control loop, the planner reads the latest slot
+    """
+
+    def __init__(self,
+                 num_slots: int = 4,
+                 name: Optional[str] = None) -> None:
+        self.num_slots = num_slots
+        self.dtype = slotDtype()
+        size = self.dtype.itemsize * num_slots
+        # NOTE: only the owner unlinks, the worker shares its resource tracker
+        self.owner = name is None
+        self.shm = shared_memory.SharedMemory(
+            name=name, create=self.owner, size=size)
+        self.slots = np.ndarray(num_slots, dtype=self.dtype, buffer=self.shm.buf)
+        if self.owner:
+            self.slots["seq"] = -1
+        self.write_seq = 0
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def write(self, obs: Dict[str, Any], assigned_tasks: List[List[MetaTask]]) -> int:
+        seq = self.write_seq
+        slot = self.slots[seq % self.num_slots]
+        # seqlock, readers drop a slot that is being written
+        slot["seq"] = -1
+        slot["frame_id"] = obs["frame_id"]
+        slot["money"] = obs["money"]
+        num_stations = len(obs["stations"])
+        slot["num_stations"] = num_stations
+        if isinstance(obs, CompactObs):
+            slot["stations"][:num_stations] = obs.station_array
+            slot["robots"][:] = obs.robot_array
+        else:
+            slot["stations"][:num_stations] = [
+                tuple(station[name] for name in STATION_DTYPE.names)
+                for station in obs["stations"]]
+            slot["robots"][:] = [
+                tuple(robot[name] for name in ROBOT_DTYPE.names)
+                for robot in obs["robots"]]
+        tasks = slot["tasks"]
+        tasks[:] = 0
+        for robot_id, robot_tasks in enumerate(assigned_tasks):
+            for k, task in enumerate(robot_tasks[:MAX_QUEUE]):
+                tasks[robot_id, k] = (
+                    task.item_type, task.src_station_id,
+                    task.dst_station_id, task.owned_item)
+        slot["seq"] = seq
+        self.write_seq += 1
+        return seq
+
+    def readLatest(self, last_seq: int) -> Optional[Tuple[int, CompactObs, np.ndarray]]:
+        # (seq, obs, tasks) newer than last_seq, copied out of shared memory
+        seqs = self.slots["seq"]
+        index = int(seqs.argmax())
+        seq = int(seqs[index])
+        if seq <= last_seq:
+            return None
+        slot = self.slots[index].copy()
+        if int(self.slots[index]["seq"]) != seq:
+            return None
+        num_stations = int(slot["num_stations"])
+        obs = CompactObs(
+            int(slot["frame_id"]), int(slot["money"]),
+            slot["stations"][:num_stations].copy(), slot["robots"].copy())
+        return seq, obs, slot["tasks"]
+
+    def close(self) -> None:
+        del self.slots
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def plannerWorker(ring_name: str,
+                  num_slots: int,
+                  scheduler: BaseScheduler,
+                  result_queue: Any,
+                  stop_event: Any,
+                  pending_frames: int = 10) -> None:
+    # NOTE: stdout may be the judge pipe
+    sys.stdout = sys.stderr
+    ring = ObsRing(num_slots, name=ring_name)
+    task_manager = ItemTaskManager()
+    mirror: Dict[Tuple, MetaTask] = {}
+    # robot -> (frame, task) published but not seen in the ring yet
+    pending: Dict[int, Tuple[int, MetaTask]] = {}
+    last_seq = -1
+    while not stop_event.is_set():
+        entry = ring.readLatest(last_seq)
+        if entry is None:
+            time.sleep(0.0002)
+            continue
+        last_seq, obs, task_array = entry
+        if task_manager.station_by_types is None:
+            task_manager.initStations(obs)
+
+        # assigned tasks of the control loop, same objects while they live
+        assigned_tasks, current_mirror = [], {}
+        for robot_id in range(NUM_ROBOTS):
+            robot_tasks = []
+            for item_type, src, dst, owned_item in task_array[robot_id].tolist():
+                if not item_type:
+                    break
+                key = (robot_id, item_type, src, dst)
+                task = mirror.get(key)
+                if task is None:
+                    task = MetaTask(
+                        item_type, src, dst,
+                        TimeRange(0, 0), TimeRange(0, 0),
+                        task_manager.station_times[src, dst],
+                        robot_id=robot_id)
+                task.owned_item = bool(owned_item)
+                current_mirror[key] = task
+                robot_tasks.append(task)
+            # NOTE: a pending task keeps its robot busy and its stations reserved,
+            #   dropped when the control loop took it or did not in time
+            if robot_id in pending:
+                plan_frame, task = pending[robot_id]
+                if robot_tasks or obs["frame_id"] > plan_frame + pending_frames:
+                    del pending[robot_id]
+                else:
+                    robot_tasks.append(task)
+            assigned_tasks.append(robot_tasks)
+        mirror = current_mirror
+        idle_indices = [i for i in range(NUM_ROBOTS) if not assigned_tasks[i]]
+        if not idle_indices:
+            continue
+
+        station_tasks = task_manager.genTasks(obs, assigned_tasks)
+        if scheduler.assign_all:
+            scheduler.assignAll(obs, station_tasks, assigned_tasks, task_manager)
+        else:
+            for _ in range(len(idle_indices)):
+                if not scheduler.assign(
+                        obs, station_tasks, assigned_tasks,
+                        task_manager.robotStationTimes(obs)):
+                    break
+                station_tasks = task_manager.genTasks(obs, assigned_tasks)
+
+        assignments = []
+        for robot_id in idle_indices:
+            if assigned_tasks[robot_id]:
+                task = assigned_tasks[robot_id][-1]
+                pending[robot_id] = (obs["frame_id"], task)
+                # NOTE: the control loop refreshes robot_stat
+                assignments.append((robot_id, dataclasses.replace(task, robot_stat={})))
+        if assignments:
+            result_queue.put((obs["frame_id"], assignments))
+    ring.close()
+
+
+class PlannerProcess:
+    """
+    Scheduling in a worker process, the control loop publishes every frame
+        and picks up assignments when they are ready
+    """
+
+    def __init__(self, scheduler: BaseScheduler, num_slots: int = 4) -> None:
+        self.ring = ObsRing(num_slots)
+        context = multiprocessing.get_context()
+        self.result_queue = context.Queue()
+        self.stop_event = context.Event()
+        self.process = context.Process(
+            target=plannerWorker,
+            args=(self.ring.name, num_slots, scheduler,
+                  self.result_queue, self.stop_event),
+            daemon=True)
+        self.process.start()
+        self.plan_latencies: List[int] = []
+
+    def publish(self, obs: Dict[str, Any], assigned_tasks: List[List[MetaTask]]) -> None:
+        self.ring.write(obs, assigned_tasks)
+
+    def poll(self, frame_id: int) -> List[Tuple[int, MetaTask]]:
+        # assignments published since the last call, never blocks
+        assignments = []
+        while True:
+            try:
+                plan_frame, plan = self.result_queue.get_nowait()
+            except queue.Empty:
+                break
+            self.plan_latencies.append(frame_id - plan_frame)
+            assignments += plan
+        return assignments
+
+    def close(self) -> None:
+        self.stop_event.set()
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.ring.close()
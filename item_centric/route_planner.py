@@ -0,0 +1,143 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from task_utils import MetaTask
+
+from .scheduler import GreedyScheduler
+from .task_manager import ItemTaskManager
+
+
+class RoutePlanner:
+    """
+    Chains tasks behind the current task of each robot,
+        the next task starts at the station where the queue ends
+    """
+
+    def __init__(self,
+                 scheduler: GreedyScheduler,
+                 task_manager: ItemTaskManager,
+                 max_queue: int = 2,
+                 max_wait: float = 50) -> None:
+        self.scheduler = scheduler
+        self.task_manager = task_manager
+        # NOTE: current task included
+        self.max_queue = max_queue
+        # frames a robot may wait at the next src after finishing its queue
+        self.max_wait = max_wait
+        # id(task) -> (task, station keys of src and dst at the last check)
+        self.planned: Dict[int, Tuple[MetaTask, Any]] = {}
+
+    def queueEnds(self,
+                  obs: Dict[str, Any],
+                  assigned_tasks: List[List[MetaTask]]
+                  ) -> List[Optional[Tuple[int, float]]]:
+        # (station, estimated frames) where each robot finishes its queue
+        # NOTE: travel is converted to frames, the unit of ready times
+        fps = self.task_manager.fps
+        robot_times = self.task_manager.robotStationTimes(obs) * fps
+        station_times = self.task_manager.station_times * fps
+        queue_ends = []
+        for robot_id, tasks in enumerate(assigned_tasks):
+            if not tasks:
+                queue_ends.append(None)
+                continue
+            end_time, move_times = 0.0, robot_times[robot_id]
+            for task in tasks:
+                if task.owned_item:
+                    end_time = max(
+                        end_time + move_times[task.dst_station_id],
+                        task.dst_ready_time.max)
+                else:
+                    end_time = max(
+                        max(end_time + move_times[task.src_station_id],
+                            task.src_ready_time.max) + task.dst_src_time * fps,
+                        task.dst_ready_time.max)
+                move_times = station_times[task.dst_station_id]
+            queue_ends.append((tasks[-1].dst_station_id, float(end_time)))
+        return queue_ends
+
+    def stationKeys(self, task: MetaTask) -> Tuple:
+        station_keys = self.task_manager.station_keys
+        return station_keys[task.src_station_id], station_keys[task.dst_station_id]
+
+    def replan(self,
+               obs: Dict[str, Any],
+               assigned_tasks: List[List[MetaTask]]) -> int:
+        # planned tasks not started yet are checked again when their stations change,
+        #   a task that became impossible is dropped with the tasks behind it
+        reservations = self.task_manager.reservationIndex(obs, assigned_tasks)
+        current_ids = {id(task) for tasks in assigned_tasks for task in tasks}
+        for task_id in [
+                task_id for task_id in self.planned if task_id not in current_ids]:
+            del self.planned[task_id]
+
+        num_dropped = 0
+        for tasks in assigned_tasks:
+            for index, task in enumerate(tasks):
+                entry = self.planned.get(id(task))
+                if entry is None:
+                    continue
+                # NOTE: owned_item is refreshed later in makeTask,
+                #   a robot already holding the item has started its task
+                if task.owned_item or index == 0 and \
+                        obs["robots"][task.robot_id]["item_type"] == task.item_type:
+                    del self.planned[id(task)]
+                    continue
+                station_keys = self.stationKeys(task)
+                if self.task_manager.incremental and station_keys == entry[1]:
+                    continue
+                ready_times = self.task_manager.readyTimes(
+                    task.item_type, task.src_station_id, task.dst_station_id, obs)
+                if ready_times is not None:
+                    task.src_ready_time, task.dst_ready_time = ready_times
+                    self.planned[id(task)] = (task, station_keys)
+                    continue
+                for dropped_task in tasks[index:]:
+                    reservations.release(dropped_task)
+                    self.planned.pop(id(dropped_task), None)
+                    num_dropped += 1
+                del tasks[index:]
+                break
+        return num_dropped
+
+    def plan(self,
+             obs: Dict[str, Any],
+             station_tasks: List[List[MetaTask]],
+             assigned_tasks: List[List[MetaTask]]) -> int:
+        # one chained task per robot and call, robots that finish first choose first
+        reservations = self.task_manager.reservationIndex(obs, assigned_tasks)
+        all_station_tasks = sum(station_tasks, [])
+        queue_ends = self.queueEnds(obs, assigned_tasks)
+        robot_ids = sorted(
+            [robot_id for robot_id, tasks in enumerate(assigned_tasks)
+             if tasks and len(tasks) < self.max_queue],
+            key=lambda robot_id: queue_ends[robot_id][1])
+
+        num_planned = 0
+        for robot_id in robot_ids:
+            end_station, end_time = queue_ends[robot_id]
+            chained_tasks = [
+                task for task in all_station_tasks
+                if task.robot_id == -1
+                and task.src_station_id == end_station
+                and task.src_ready_time.max <= end_time + self.max_wait
+                and self.task_manager.reservationPenalty(
+                    task.item_type, task.src_station_id,
+                    task.dst_station_id, reservations) == task.penalty
+            ]
+            if not chained_tasks:
+                continue
+            efficiency = self.scheduler.batchEfficiency(
+                obs, chained_tasks, np.full((1, len(chained_tasks)), end_time))[0]
+            best = int(efficiency.argmax())
+            if not efficiency[best] > 0:
+                continue
+            task = chained_tasks[best]
+            task.robot_id = robot_id
+            task.update(obs)
+            assigned_tasks[robot_id].append(task)
+            reservations.reserve(task)
+            self.planned[id(task)] = (task, self.stationKeys(task))
+            num_planned += 1
+        return num_planned
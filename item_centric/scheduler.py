@@ -1,21 +1,71 @@
+import dataclasses
 import random
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, List, Optional, Tuple
 
 import numpy as np
 
-from task_utils import MetaTask, decayFunc
+from task_utils import MetaTask, batchDecayFunc, decayFunc
 
+from .flow_planner import FlowPlanner
 from .task_manager import ItemTaskManager
 
 
+def linearAssignment(cost: np.ndarray) -> List[Tuple[int, int]]:
+    # Hungarian algorithm, minimum cost matching of every row (or column)
+    transposed = cost.shape[0] > cost.shape[1]
+    if transposed:
+        cost = cost.T
+    cost = cost.tolist()
+    n, m = len(cost), len(cost[0])
+    u, v = [0.0] * (n + 1), [0.0] * (m + 1)
+    match, way = [0] * (m + 1), [0] * (m + 1)
+    for i in range(1, n + 1):
+        match[0] = i
+        j0 = 0
+        min_v = [float("inf")] * (m + 1)
+        used = [False] * (m + 1)
+        while match[j0] != 0:
+            used[j0] = True
+            i0, delta, j1 = match[j0], float("inf"), 0
+            for j in range(1, m + 1):
+                if used[j]:
+                    continue
+                current = cost[i0 - 1][j - 1] - u[i0] - v[j]
+                if current < min_v[j]:
+                    min_v[j], way[j] = current, j0
+                if min_v[j] < delta:
+                    delta, j1 = min_v[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[match[j]] += delta
+                    v[j] -= delta
+                else:
+                    min_v[j] -= delta
+            j0 = j1
+        while j0 != 0:
+            j1 = way[j0]
+            match[j0] = match[j1]
+            j0 = j1
+
+    pairs = [(match[j] - 1, j - 1) for j in range(1, m + 1) if match[j] != 0]
+    if transposed:
+        pairs = [(j, i) for i, j in pairs]
+    return sorted(pairs)
+
+
 class BaseScheduler:
+    # NOTE: schedulers with assign_all solve all idle robots in one call
+    assign_all = False
+
     def __init__(self) -> None:
         self.num_robots = 4
 
     def assign(self,
                obs: Dict[str, Any],
                station_tasks: List[List[MetaTask]],
-               assigned_tasks: List[List[MetaTask]]
+               assigned_tasks: List[List[MetaTask]],
+               robot_station_times: Optional[np.ndarray] = None
                ) -> bool:
         assert len(assigned_tasks) == self.num_robots
         all_station_tasks = sum(station_tasks, [])
@@ -45,9 +95,21 @@ class GreedyScheduler(BaseScheduler):
         self.input_money = [3000, 4400, 5800, 15400, 17200, 19200, 76000]
         self.output_money = [6000, 7600, 9200, 22500, 25000, 27500, 105000]
         # self.delta = np.array(self.output_money) - np.array(self.input_money)
-        self.item_delta = params["item_delta"]
-        self.station_type_delta = params["station_type_delta"]
-        self.station_input_delta = params["station_input_delta"]
+        self.item_delta = np.asarray(params["item_delta"])
+        self.station_type_delta = np.asarray(params["station_type_delta"])
+        self.station_input_delta = np.asarray(params["station_input_delta"])
+        # NOTE: input value of every input status, summed bit by bit
+        #   in the same order as priorityValue
+        self.input_value_table = []
+        for input_status in range(1 << len(self.station_input_delta)):
+            input_value = 0
+            for i in range(len(self.station_input_delta)):
+                if (1 << i) & input_status:
+                    input_value += self.station_input_delta[i]
+            self.input_value_table.append(input_value)
+        self.input_value_table = np.array(
+            self.input_value_table, dtype=np.float64)
+        self.tie_tolerance = 1e-9
 
     def priorityValue(self,
                       task: MetaTask,
@@ -65,10 +127,69 @@ class GreedyScheduler(BaseScheduler):
 
         return item_value + station_value + input_value
 
+    def taskEfficiency(self,
+                       task: MetaTask,
+                       robot_src_time: float,
+                       obs: Dict[str, Any]) -> Optional[float]:
+        estimated_total_time = max(
+            max(robot_src_time, task.src_ready_time.max) +
+            task.dst_src_time,
+            task.dst_ready_time.max
+        )
+        # NOTE: ignore tasks that cannot be finished in time
+        if estimated_total_time + obs["frame_id"] >= 9000:
+            return None
+
+        delta = self.priorityValue(
+            task, estimated_total_time, obs) + task.penalty
+        return delta / estimated_total_time
+
+    @staticmethod
+    def batchTotalTime(tasks: List[MetaTask],
+                       robot_src_times: np.ndarray) -> np.ndarray:
+        # (robots, tasks) estimated total time, same as taskEfficiency
+        src_ready_time = np.array(
+            [task.src_ready_time.max for task in tasks], dtype=np.float64)
+        dst_ready_time = np.array(
+            [task.dst_ready_time.max for task in tasks], dtype=np.float64)
+        dst_src_time = np.array(
+            [task.dst_src_time for task in tasks], dtype=np.float64)
+        return np.maximum(
+            np.maximum(robot_src_times, src_ready_time) + dst_src_time,
+            dst_ready_time
+        )
+
+    def batchEfficiency(self,
+                        obs: Dict[str, Any],
+                        tasks: List[MetaTask],
+                        robot_src_times: np.ndarray) -> np.ndarray:
+        # (robots, tasks) efficiency, -inf for tasks that cannot be finished
+        estimated_total_time = self.batchTotalTime(tasks, robot_src_times)
+
+        item_value = self.item_delta[
+            [task.item_type - 1 for task in tasks]]
+        station_value = self.station_type_delta[[
+            obs["stations"][task.dst_station_id]["station_type"] - 1
+            for task in tasks
+        ]]
+        input_value = self.input_value_table[[
+            task.dst_input_status & (len(self.input_value_table) - 1)
+            for task in tasks
+        ]]
+        penalty = np.array([task.penalty for task in tasks])
+        delta = item_value * batchDecayFunc(estimated_total_time, 9000, 0.8) + \
+            station_value + input_value + penalty
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            efficiency = delta / estimated_total_time
+        efficiency[estimated_total_time + obs["frame_id"] >= 9000] = -np.inf
+        return efficiency
+
     def assign(self,
                obs: Dict[str, Any],
                station_tasks: List[List[MetaTask]],
-               assigned_tasks: List[List[MetaTask]]
+               assigned_tasks: List[List[MetaTask]],
+               robot_station_times: Optional[np.ndarray] = None
                ) -> bool:
         # HACK: FIXME: DO NOT reschedule tasks, we avoid this by scheduling ahead
         assert len(assigned_tasks) == self.num_robots
@@ -79,39 +200,44 @@ class GreedyScheduler(BaseScheduler):
                 or not idle_indices:
             return False
 
-        max_efficiency = 0
-        selected_task = None
-        selected_robot_id = 0
+        if robot_station_times is None:
+            robot_station_times = ItemTaskManager.moveTimesEst(
+                np.array([[robot["loc_x"], robot["loc_y"]]
+                          for robot in obs["robots"]]),
+                np.array([[station["loc_x"], station["loc_y"]]
+                          for station in obs["stations"]])
+            )
 
         # TODO: sell to non-sink station first
-        for robot_id in idle_indices:
-            robot_loc = np.array([
-                obs["robots"][robot_id]["loc_x"],
-                obs["robots"][robot_id]["loc_y"]
-            ])
-            for task in all_station_tasks:
-                src_loc = np.array([
-                    obs["stations"][task.src_station_id]["loc_x"],
-                    obs["stations"][task.src_station_id]["loc_y"]
-                ])
-                robot_src_time = \
-                    ItemTaskManager.moveTimeEst(robot_loc, src_loc)
-                estimated_total_time = max(
-                    max(robot_src_time, task.src_ready_time.max) +
-                    task.dst_src_time,
-                    task.dst_ready_time.max
-                )
-                # NOTE: ignore tasks that cannot be finished in time
-                if estimated_total_time + obs["frame_id"] >= 9000:
-                    continue
+        robot_src_times = robot_station_times[np.ix_(
+            idle_indices,
+            [task.src_station_id for task in all_station_tasks]
+        )]
+        efficiency = self.batchEfficiency(
+            obs, all_station_tasks, robot_src_times)
+        best_efficiency = efficiency.max()
+        if best_efficiency == -np.inf:
+            return False
+        tolerance = self.tie_tolerance * max(1, abs(best_efficiency))
+        if not best_efficiency + tolerance > 0:
+            return False
 
-                delta = self.priorityValue(
-                    task, estimated_total_time, obs) + task.penalty
-                efficiency = delta / estimated_total_time
-                if efficiency > max_efficiency:
-                    max_efficiency = efficiency
-                    selected_task = task
-                    selected_robot_id = robot_id
+        # NOTE: decayFunc rounds differently with np.sqrt,
+        #   near ties are scored again one by one, in the original order
+        max_efficiency = 0
+        selected_task = None
+        selected_robot_id = 0
+        num_tasks = len(all_station_tasks)
+        for index in np.flatnonzero(efficiency >= best_efficiency - tolerance):
+            robot_id = idle_indices[index // num_tasks]
+            task = all_station_tasks[index % num_tasks]
+            task_efficiency = self.taskEfficiency(
+                task, robot_src_times.item(index), obs)
+            if task_efficiency is not None \
+                    and task_efficiency > max_efficiency:
+                max_efficiency = task_efficiency
+                selected_task = task
+                selected_robot_id = robot_id
 
         if not selected_task:
             return False
@@ -120,3 +246,382 @@ class GreedyScheduler(BaseScheduler):
         selected_task.update(obs)
         assigned_tasks[selected_robot_id].append(selected_task)
         return True
+
+
+class FlowScheduler(GreedyScheduler):
+    """
+    Greedy efficiency plus a bonus for edges behind their planned rate,
+        the rates come from the flow planner solved at map load
+    """
+
+    def __init__(self,
+                 params: Optional[Dict[str, np.ndarray]] = None,
+                 flow_planner: Optional[FlowPlanner] = None,
+                 flow_weight: float = 300) -> None:
+        if params is None:
+            super().__init__()
+        else:
+            super().__init__(params)
+        self.flow_planner = FlowPlanner() \
+            if flow_planner is None else flow_planner
+        self.flow_weight = flow_weight
+
+    def flowValues(self, obs: Dict[str, Any], tasks: List[MetaTask]) -> np.ndarray:
+        # NOTE: one item ahead or behind the plan is worth flow_weight
+        self.flow_planner.update(obs)
+        return self.flow_weight * \
+            np.clip(self.flow_planner.deficits(obs, tasks), -1, 1)
+
+    def priorityValue(self,
+                      task: MetaTask,
+                      estimated_total_time: float,
+                      obs: Dict[str, Any]) -> float:
+        return super().priorityValue(task, estimated_total_time, obs) + \
+            self.flowValues(obs, [task])[0]
+
+    def batchEfficiency(self,
+                        obs: Dict[str, Any],
+                        tasks: List[MetaTask],
+                        robot_src_times: np.ndarray) -> np.ndarray:
+        efficiency = super().batchEfficiency(obs, tasks, robot_src_times)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return efficiency + self.flowValues(obs, tasks) / \
+                self.batchTotalTime(tasks, robot_src_times)
+
+    def assign(self,
+               obs: Dict[str, Any],
+               station_tasks: List[List[MetaTask]],
+               assigned_tasks: List[List[MetaTask]],
+               robot_station_times: Optional[np.ndarray] = None
+               ) -> bool:
+        idle_indices = [
+            i for i in range(self.num_robots) if not assigned_tasks[i]]
+        result = super().assign(
+            obs, station_tasks, assigned_tasks, robot_station_times)
+        for i in idle_indices:
+            if assigned_tasks[i]:
+                self.flow_planner.record(assigned_tasks[i][-1])
+        return result
+
+
+class OptimalScheduler(GreedyScheduler):
+    assign_all = True
+
+    def assignAll(self,
+                  obs: Dict[str, Any],
+                  station_tasks: List[List[MetaTask]],
+                  assigned_tasks: List[List[MetaTask]],
+                  task_manager: ItemTaskManager
+                  ) -> int:
+        # maximize total efficiency of idle robots,
+        #   conflicting tasks are dropped and the rest is solved again
+        assert len(assigned_tasks) == self.num_robots
+        all_station_tasks = sum(station_tasks, [])
+        idle_indices = [i for i in range(
+            self.num_robots) if not assigned_tasks[i]]
+        robot_station_times = task_manager.robotStationTimes(obs)
+        reservations = task_manager.reservationIndex(obs, assigned_tasks)
+
+        num_assigned = 0
+        while all_station_tasks and idle_indices:
+            robot_src_times = robot_station_times[np.ix_(
+                idle_indices,
+                [task.src_station_id for task in all_station_tasks]
+            )]
+            efficiency = self.batchEfficiency(
+                obs, all_station_tasks, robot_src_times)
+            # NOTE: zero profit means the robot stays idle
+            profit = np.where(efficiency > 0, efficiency, 0)
+            pairs = [
+                (robot_index, task_index)
+                for robot_index, task_index in linearAssignment(-profit)
+                if efficiency[robot_index, task_index] > 0
+            ]
+            if not pairs:
+                break
+            pairs.sort(key=lambda pair: -efficiency[pair])
+
+            for robot_index, task_index in pairs:
+                task = all_station_tasks[task_index]
+                penalty = task_manager.reservationPenalty(
+                    task.item_type, task.src_station_id,
+                    task.dst_station_id, reservations)
+                if penalty != task.penalty:
+                    continue
+                robot_id = idle_indices[robot_index]
+                task.robot_id = robot_id
+                task.update(obs)
+                assigned_tasks[robot_id].append(task)
+                reservations.reserve(task)
+                num_assigned += 1
+
+            idle_indices = [
+                i for i in idle_indices if not assigned_tasks[i]]
+            remain_tasks = []
+            for task in all_station_tasks:
+                if task.robot_id != -1:
+                    continue
+                penalty = task_manager.reservationPenalty(
+                    task.item_type, task.src_station_id,
+                    task.dst_station_id, reservations)
+                if penalty is None:
+                    continue
+                if penalty != task.penalty:
+                    task = dataclasses.replace(task, penalty=penalty)
+                remain_tasks.append(task)
+            all_station_tasks = remain_tasks
+
+        return num_assigned
+
+
+class BeamScheduler(GreedyScheduler):
+    """
+    Anytime beam search over task sequences of idle robots,
+        a plan scores the sum of per robot efficiency, only first tasks are assigned
+    """
+    assign_all = True
+
+    def __init__(self,
+                 params: Optional[Dict[str, np.ndarray]] = None,
+                 beam_width: int = 8,
+                 max_depth: int = 8,
+                 time_budget: float = 0.004) -> None:
+        if params is None:
+            super().__init__()
+        else:
+            super().__init__(params)
+        self.beam_width = beam_width
+        self.max_depth = max_depth
+        # seconds per call, the last complete level is returned after that
+        self.time_budget = time_budget
+        # (robot_id, item_type, src, dst) planned behind the assigned tasks
+        self.last_plan: List[Tuple[int, int, int, int]] = []
+        self.last_depth = 0
+
+    def prepare(self,
+                obs: Dict[str, Any],
+                tasks: List[MetaTask],
+                reservations: Any) -> Dict[str, np.ndarray]:
+        # per task arrays of the forward model
+        model = {
+            "src": np.array([task.src_station_id for task in tasks]),
+            "dst": np.array([task.dst_station_id for task in tasks]),
+            "src_ready": np.array(
+                [task.src_ready_time.max for task in tasks], dtype=np.float64),
+            "dst_ready": np.array(
+                [task.dst_ready_time.max for task in tasks], dtype=np.float64),
+            "dst_src": np.array(
+                [task.dst_src_time for task in tasks], dtype=np.float64),
+            "item_value": self.item_delta[[task.item_type - 1 for task in tasks]],
+            "static_value": self.station_type_delta[[
+                obs["stations"][task.dst_station_id]["station_type"] - 1
+                for task in tasks
+            ]] + self.input_value_table[[
+                task.dst_input_status & (len(self.input_value_table) - 1)
+                for task in tasks
+            ]],
+            "raw": np.array([task.item_type in [1, 2, 3] for task in tasks]),
+        }
+        out_keys, in_keys = {}, {}
+        model["out_key"] = np.array([
+            out_keys.setdefault((task.src_station_id, task.item_type), len(out_keys))
+            for task in tasks])
+        model["in_key"] = np.array([
+            in_keys.setdefault((task.dst_station_id, task.item_type), len(in_keys))
+            for task in tasks])
+        model["base_out"] = np.array([
+            reservations.output_counts[task.src_station_id][task.item_type]
+            for task in tasks])
+        model["base_in"] = np.array([
+            reservations.input_counts[task.dst_station_id][task.item_type]
+            for task in tasks])
+        model["num_out_keys"], model["num_in_keys"] = len(out_keys), len(in_keys)
+        return model
+
+    def expand(self,
+               obs: Dict[str, Any],
+               model: Dict[str, Any],
+               state: Dict[str, Any],
+               slot: int,
+               move_times: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        # (task indices, score gains) of valid next tasks of one robot
+        free_time = state["free"][slot]
+        added_out = np.zeros(model["num_out_keys"], dtype=np.int64)
+        added_in = np.zeros(model["num_in_keys"], dtype=np.int64)
+        for key, count in state["out"].items():
+            added_out[key] = count
+        for key, count in state["in"].items():
+            added_in[key] = count
+        out_count = model["base_out"] + added_out[model["out_key"]]
+        in_count = model["base_in"] + added_in[model["in_key"]]
+
+        end_time = np.maximum(
+            np.maximum(free_time + move_times[model["src"]], model["src_ready"])
+            + model["dst_src"],
+            model["dst_ready"]
+        )
+        duration = end_time - free_time
+        penalty = np.where(out_count == 0, 0, -20)
+        delta = model["item_value"] * batchDecayFunc(duration, 9000, 0.8) + \
+            model["static_value"] + penalty
+        valid = (out_count < np.where(model["raw"], 2, 1)) & (in_count == 0) \
+            & (end_time + obs["frame_id"] < 9000) & (duration > 0) & (delta > 0)
+        indices = np.flatnonzero(valid)
+        if not indices.size:
+            return indices, np.zeros(0)
+        robot_delta, robot_time = state["delta"][slot], state["time"][slot]
+        old_efficiency = robot_delta / robot_time if robot_time > 0 else 0
+        gains = (robot_delta + delta[indices]) / \
+            (robot_time + duration[indices]) - old_efficiency
+        return indices, gains
+
+    def apply(self,
+              model: Dict[str, Any],
+              state: Dict[str, Any],
+              slot: int,
+              index: int,
+              move_times: np.ndarray,
+              gain: float) -> Dict[str, Any]:
+        free_time = state["free"][slot]
+        end_time = max(
+            max(free_time + move_times[model["src"][index]], model["src_ready"][index])
+            + model["dst_src"][index],
+            model["dst_ready"][index]
+        )
+        new_state = {
+            "score": state["score"] + gain,
+            "free": state["free"].copy(),
+            "loc": state["loc"].copy(),
+            "delta": state["delta"].copy(),
+            "time": state["time"].copy(),
+            "done": state["done"].copy(),
+            "out": state["out"].copy(),
+            "in": state["in"].copy(),
+            "steps": state["steps"] + [(slot, index)],
+        }
+        duration = end_time - free_time
+        out_key, in_key = model["out_key"][index], model["in_key"][index]
+        out_count = model["base_out"][index] + state["out"].get(out_key, 0)
+        new_state["delta"][slot] += model["item_value"][index] * \
+            decayFunc(duration, 9000, 0.8) + model["static_value"][index] + \
+            (0 if out_count == 0 else -20)
+        new_state["time"][slot] += duration
+        new_state["free"][slot] = end_time
+        new_state["loc"][slot] = model["dst"][index]
+        new_state["out"][out_key] = state["out"].get(out_key, 0) + 1
+        new_state["in"][in_key] = state["in"].get(in_key, 0) + 1
+        return new_state
+
+    def assignAll(self,
+                  obs: Dict[str, Any],
+                  station_tasks: List[List[MetaTask]],
+                  assigned_tasks: List[List[MetaTask]],
+                  task_manager: ItemTaskManager
+                  ) -> int:
+        deadline = time.perf_counter() + self.time_budget
+        assert len(assigned_tasks) == self.num_robots
+        all_station_tasks = [
+            task for task in sum(station_tasks, []) if task.robot_id == -1]
+        idle_indices = [i for i in range(
+            self.num_robots) if not assigned_tasks[i]]
+        if not all_station_tasks or not idle_indices:
+            return 0
+        robot_station_times = task_manager.robotStationTimes(obs)
+        station_times = task_manager.station_times
+        reservations = task_manager.reservationIndex(obs, assigned_tasks)
+        model = self.prepare(obs, all_station_tasks, reservations)
+
+        def moveTimes(state, slot):
+            loc = state["loc"][slot]
+            return robot_station_times[idle_indices[slot]] if loc < 0 \
+                else station_times[loc]
+
+        num_slots = len(idle_indices)
+        root = {
+            "score": 0.0,
+            "free": [0.0] * num_slots,
+            "loc": [-1] * num_slots,
+            "delta": [0.0] * num_slots,
+            "time": [0.0] * num_slots,
+            "done": [False] * num_slots,
+            "out": {},
+            "in": {},
+            "steps": [],
+        }
+
+        # NOTE: warm start, the previous plan replayed in the current model
+        #   seeds every level with its prefix
+        task_index = {
+            (task.item_type, task.src_station_id, task.dst_station_id): index
+            for index, task in enumerate(all_station_tasks)}
+        seeds, state = [], root
+        for robot_id, item_type, src, dst in self.last_plan:
+            index = task_index.get((item_type, src, dst))
+            if robot_id not in idle_indices or index is None:
+                continue
+            slot = idle_indices.index(robot_id)
+            move_times = moveTimes(state, slot)
+            indices, gains = self.expand(obs, model, state, slot, move_times)
+            position = np.flatnonzero(indices == index)
+            if not position.size:
+                continue
+            state = self.apply(
+                model, state, slot, index, move_times, gains[position[0]])
+            seeds.append(state)
+
+        beam, best_beam = [root], [root]
+        for depth in range(self.max_depth):
+            candidates = [] if depth >= len(seeds) else [seeds[depth]]
+            for state in beam:
+                slots = [
+                    slot for slot in range(num_slots) if not state["done"][slot]]
+                if not slots:
+                    candidates.append(state)
+                    continue
+                slot = min(slots, key=lambda slot: state["free"][slot])
+                move_times = moveTimes(state, slot)
+                indices, gains = self.expand(obs, model, state, slot, move_times)
+                if not indices.size:
+                    state = dict(state, done=state["done"].copy())
+                    state["done"][slot] = True
+                    candidates.append(state)
+                    continue
+                top = np.argsort(-gains, kind="stable")[:self.beam_width]
+                for k in top:
+                    candidates.append(self.apply(
+                        model, state, slot, indices[k], move_times, gains[k]))
+                if time.perf_counter() > deadline:
+                    break
+            if time.perf_counter() > deadline and depth > 0:
+                break
+            candidates.sort(key=lambda state: -state["score"])
+            beam = candidates[:self.beam_width]
+            best_beam = beam
+            self.last_depth = depth + 1
+            if all(all(state["done"]) for state in beam):
+                break
+
+        best = best_beam[0]
+        num_assigned, committed = 0, set()
+        self.last_plan = []
+        for slot, index in best["steps"]:
+            task = all_station_tasks[index]
+            robot_id = idle_indices[slot]
+            if slot in committed:
+                self.last_plan.append(
+                    (robot_id, task.item_type, task.src_station_id, task.dst_station_id))
+                continue
+            committed.add(slot)
+            penalty = task_manager.reservationPenalty(
+                task.item_type, task.src_station_id,
+                task.dst_station_id, reservations)
+            if penalty is None:
+                continue
+            if penalty != task.penalty:
+                task = dataclasses.replace(task, penalty=penalty)
+            task.robot_id = robot_id
+            task.update(obs)
+            assigned_tasks[robot_id].append(task)
+            reservations.reserve(task)
+            num_assigned += 1
+        return num_assigned
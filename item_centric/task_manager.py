@@ -1,10 +1,89 @@
-from typing import Any, Dict, List, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
+
+from station_forecast import StationForecaster
 from task_utils import MetaTask, TimeRange
 
 
+class ReservationIndex:
+    """
+    Items reserved at each station by assigned tasks,
+        updated when a task is assigned or finished instead of rebuilt every frame
+    """
+
+    def __init__(self, num_stations: int, num_item_types: int = 8) -> None:
+        self.input_counts = [[0] * num_item_types for _ in range(num_stations)]
+        self.output_counts = [[0] * num_item_types for _ in range(num_stations)]
+        self.input_masks = [0] * num_stations
+        # NOTE: bumped on every change of a station, see genTasks
+        self.versions = [0] * num_stations
+        # id(task) -> (task, whether its src output is reserved)
+        self.tasks: Dict[int, Tuple[MetaTask, bool]] = {}
+
+    def _addInput(self, station_id: int, item_type: int, delta: int) -> None:
+        counts = self.input_counts[station_id]
+        counts[item_type] += delta
+        if counts[item_type] > 0:
+            self.input_masks[station_id] |= 1 << item_type
+        else:
+            self.input_masks[station_id] &= ~(1 << item_type)
+        self.versions[station_id] += 1
+
+    def _addOutput(self, station_id: int, item_type: int, delta: int) -> None:
+        self.output_counts[station_id][item_type] += delta
+        self.versions[station_id] += 1
+
+    def reserve(self, task: MetaTask) -> None:
+        # also releases the src output once the item is picked up
+        entry = self.tasks.get(id(task))
+        if entry is None:
+            self.tasks[id(task)] = (task, not task.owned_item)
+            if not task.owned_item:
+                self._addOutput(task.src_station_id, task.item_type, 1)
+            self._addInput(task.dst_station_id, task.item_type, 1)
+        elif entry[1] and task.owned_item:
+            self.tasks[id(task)] = (task, False)
+            self._addOutput(task.src_station_id, task.item_type, -1)
+
+    def release(self, task: MetaTask) -> None:
+        entry = self.tasks.pop(id(task), None)
+        if entry is None:
+            return
+        if entry[1]:
+            self._addOutput(task.src_station_id, task.item_type, -1)
+        self._addInput(task.dst_station_id, task.item_type, -1)
+
+    def sync(self, assigned_tasks: List[List[MetaTask]]) -> None:
+        # NOTE: catches task lists changed without reserve/release,
+        #   costs one pass over the assigned tasks, not over stations
+        num_tasks = 0
+        for tasks in assigned_tasks:
+            for task in tasks:
+                self.reserve(task)
+                num_tasks += 1
+        if num_tasks == len(self.tasks):
+            return
+        current_ids = {
+            id(task) for tasks in assigned_tasks for task in tasks}
+        for task_id in [
+                task_id for task_id in self.tasks if task_id not in current_ids]:
+            self.release(self.tasks[task_id][0])
+
+
 class ItemTaskManager:
-    def __init__(self) -> None:
+    def __init__(self,
+                 incremental: bool = True,
+                 lookahead: bool = True,
+                 forecaster: Optional[StationForecaster] = None) -> None:
+        # keep candidate tasks alive across frames
+        self.incremental = incremental
+        # NOTE: idle stations whose missing inputs are all being delivered
+        #   count as producing, see lookaheadReadyTimes
+        self.lookahead = lookahead
+        self.fps = 50
+        # NOTE: station timelines, may be shared with other components
+        self.forecaster = StationForecaster() if forecaster is None else forecaster
         self.item_types = [1, 2, 3, 4, 5, 6, 7]
         self.sink_stations = [8, 9]
         self.source_stations = [1, 2, 3]
@@ -46,7 +125,9 @@ class ItemTaskManager:
                 "output": []
             },
         }
+        production_frames = {1: 50, 2: 50, 3: 50, 4: 500, 5: 500, 6: 500, 7: 1000, 8: 1, 9: 1}
         for k, v in self.station_specs.items():
+            v["period"] = production_frames[k]
             input_stat = 0
             for item_type in v["input"]:
                 input_stat += 1 << item_type
@@ -66,6 +147,12 @@ class ItemTaskManager:
             for item_type in v["output"]:
                 self.item_specs[item_type]["src_type"].append(k)
         self.station_by_types = None
+        self.station_locs = None
+        self.station_times = None
+        self.robot_times_key = None
+        self.robot_times = None
+        self.reservations = None
+        self.ready_times = None
 
     @staticmethod
     def moveTimeEst(src: Tuple, dst: Tuple) -> float:
@@ -81,7 +168,79 @@ class ItemTaskManager:
             (dst["loc_x"], dst["loc_y"])
         )
 
+    @staticmethod
+    def moveTimesEst(src: np.ndarray, dst: np.ndarray) -> np.ndarray:
+        # NOTE: (m, 2) x (n, 2) -> (m, n), same estimation as moveTimeEst
+        max_speed = 6
+        scale_factor = 1.1 / max_speed
+        delta = src[:, None, :] - dst[None, :, :]
+        return scale_factor * \
+            np.sqrt(delta[..., 0] ** 2 + delta[..., 1] ** 2)
+
+    def robotStationTimes(self, obs: Dict[str, Any]) -> np.ndarray:
+        # robot -> all stations, computed once per frame
+        if self.station_by_types is None:
+            self.initStations(obs)
+        frame_key = (id(obs), obs["frame_id"])
+        if self.robot_times_key != frame_key:
+            robot_locs = np.array([
+                [robot["loc_x"], robot["loc_y"]]
+                for robot in obs["robots"]
+            ])
+            self.robot_times = self.moveTimesEst(
+                robot_locs, self.station_locs)
+            self.robot_times_key = frame_key
+        return self.robot_times
+
+    def lookaheadReadyTimes(self, obs: Dict[str, Any]) -> List[Optional[float]]:
+        # one stage forward: an idle station starts producing
+        #   once the last of its missing inputs is delivered by an assigned task
+        ready_times = [None] * self.num_stations
+        if not self.lookahead:
+            return ready_times
+        reservations = self.reservations
+        # NOTE: travel estimations are converted to frames as remain_time
+        robot_times = self.robotStationTimes(obs) * self.fps
+        input_etas = {}
+        for task, _ in reservations.tasks.values():
+            if task.owned_item:
+                eta = robot_times[task.robot_id, task.dst_station_id]
+            else:
+                eta = max(robot_times[task.robot_id, task.src_station_id],
+                          task.src_ready_time.max) \
+                    + task.dst_src_time * self.fps
+            key = (task.dst_station_id, task.item_type)
+            input_etas[key] = min(eta, input_etas.get(key, float("inf")))
+
+        for i, station in enumerate(obs["stations"]):
+            if self.forecaster.outputReadyFrame(i) is not None:
+                continue
+            station_spec = self.station_specs[station["station_type"]]
+            if not station_spec["output"]:
+                continue
+            missing = station_spec["full"] & ~station["input_status"]
+            if missing & ~reservations.input_masks[i]:
+                continue
+            start_time = max(
+                [input_etas[(i, item_type)]
+                 for item_type in station_spec["input"]
+                 if missing & (1 << item_type)],
+                default=0
+            )
+            ready_times[i] = float(start_time + station_spec["period"])
+        return ready_times
+
+    def reservationIndex(self,
+                         obs: Dict[str, Any],
+                         assigned_tasks: List[List[MetaTask]]
+                         ) -> ReservationIndex:
+        if self.station_by_types is None:
+            self.initStations(obs)
+        self.reservations.sync(assigned_tasks)
+        return self.reservations
+
     def currentTaskStat(self, assigned_tasks: List[List[MetaTask]]) -> Dict[int, Any]:
+        # NOTE: full rebuild as lists, the hot path uses reservationIndex
         reserved_stat = {
             i: {"input": [], "output": []}
             for i in range(self.num_stations)
@@ -96,93 +255,192 @@ class ItemTaskManager:
                 # fmt: on
         return reserved_stat
 
+    def initStations(self, obs: Dict[str, Any]) -> None:
+        self.num_stations = len(obs["stations"])
+        self.station_by_types = {
+            station_type: []
+            for station_type in self.station_specs.keys()
+        }
+        for i, station in enumerate(obs["stations"]):
+            self.station_by_types[station["station_type"]].append(i)
+        # NOTE: stations never move, travel time between them is fixed
+        self.station_locs = np.array([
+            [station["loc_x"], station["loc_y"]]
+            for station in obs["stations"]
+        ])
+        self.station_times = np.array([
+            [self.betweenStation(src_station, dst_station)
+             for dst_station in obs["stations"]]
+            for src_station in obs["stations"]
+        ])
+        for item_type in self.item_specs:
+            for station_type in self.item_specs[item_type]["src_type"]:
+                self.item_specs[item_type]["src_id"] += self.station_by_types[station_type]
+            for station_type in self.item_specs[item_type]["dst_type"]:
+                self.item_specs[item_type]["dst_id"] += self.station_by_types[station_type]
+
+        # candidate index: one slot per (item, src, dst) in generation order
+        self.task_pairs = []
+        self.task_slots = []
+        self.station_slots = [[] for _ in range(self.num_stations)]
+        for item_index, item_type in enumerate(self.item_types):
+            pairs = [
+                (i, j)
+                for i in self.item_specs[item_type]["src_id"]
+                for j in self.item_specs[item_type]["dst_id"]
+            ]
+            for slot_index, (i, j) in enumerate(pairs):
+                self.station_slots[i].append((item_index, slot_index))
+                if j != i:
+                    self.station_slots[j].append((item_index, slot_index))
+            self.task_pairs.append(pairs)
+            self.task_slots.append([None] * len(pairs))
+        self.station_keys = [None] * self.num_stations
+        self.reservations = ReservationIndex(
+            self.num_stations, max(self.item_types) + 1)
+
+    @staticmethod
+    def reservationPenalty(item_type: int,
+                           i: int,
+                           j: int,
+                           reservations: ReservationIndex
+                           ) -> Optional[float]:
+        # TODO: conflict with reserved tasks
+        output_item_count = reservations.output_counts[i][item_type]
+        if item_type in [1, 2, 3] \
+                and output_item_count >= 2:
+            return None
+        if item_type not in [1, 2, 3] \
+                and output_item_count >= 1:
+            return None
+        if reservations.input_counts[j][item_type]:
+            return None
+        return 0 if output_item_count == 0 else -20
+
+    def readyTimes(self,
+                   item_type: int,
+                   i: int,
+                   j: int,
+                   obs: Dict[str, Any]
+                   ) -> Optional[Tuple[TimeRange, TimeRange]]:
+        # src and dst ready time from the station forecast, None if not possible
+        frame_id = obs["frame_id"]
+        src_frame = self.forecaster.outputReadyFrame(i)
+        if src_frame is None:
+            # idle station, maybe with inputs on the way
+            ready_time = self.ready_times[i]
+            if ready_time is None:
+                return None
+            src_ready_time = TimeRange(ready_time, ready_time)
+        else:
+            src_ready = max(0, src_frame - frame_id)
+            src_ready_time = TimeRange(src_ready, src_ready)
+        # 1. lack this item
+        # 2. input full but producing not done
+        dst_frame = self.forecaster.inputFreeFrame(j, item_type)
+        if dst_frame is None:
+            return None
+        dst_ready = max(0, dst_frame - frame_id)
+        return src_ready_time, TimeRange(dst_ready, dst_ready)
+
+    def makeMetaTask(self,
+                     item_type: int,
+                     i: int,
+                     j: int,
+                     obs: Dict[str, Any],
+                     reservations: ReservationIndex
+                     ) -> Optional[MetaTask]:
+        penalty = self.reservationPenalty(item_type, i, j, reservations)
+        if penalty is None:
+            return None
+        ready_times = self.readyTimes(item_type, i, j, obs)
+        if ready_times is None:
+            return None
+        src_ready_time, dst_ready_time = ready_times
+
+        # NOTE: record dst station input status
+        dst_input_status = obs["stations"][j]["input_status"] \
+            | reservations.input_masks[j]
+        return MetaTask(
+            item_type=item_type,
+            src_station_id=i,
+            dst_station_id=j,
+            src_ready_time=src_ready_time,
+            dst_ready_time=dst_ready_time,
+            penalty=penalty,
+            dst_src_time=self.station_times[i, j].item(),
+            dst_input_status=dst_input_status,
+        )
+
     def genTasks(self,
                  obs: Dict[str, Any],
                  assigned_tasks: List[List[MetaTask]]
                  ) -> List[List[MetaTask]]:
         # NOTE: naive esimation,
         #   e.g., src station definitely can produce the item (producing/done)
-        # TODO: one stage forward estimation
-        #   e.g., src station may lack some input items, which can definitely be produced
+        # NOTE: one stage forward estimation with lookahead,
+        #   e.g., src station lacks some input items, which are being delivered
         # TODO: recursive estimation
         #   e.g., src station may lack some input items, and input of input stations also lack some items, ...
 
-        if self.station_by_types is None:
-            self.num_stations = len(obs["stations"])
-            self.station_by_types = {
-                station_type: []
-                for station_type in self.station_specs.keys()
-            }
-            for i, station in enumerate(obs["stations"]):
-                self.station_by_types[station["station_type"]].append(i)
-            for item_type in self.item_specs:
-                for station_type in self.item_specs[item_type]["src_type"]:
-                    self.item_specs[item_type]["src_id"] += self.station_by_types[station_type]
-                for station_type in self.item_specs[item_type]["dst_type"]:
-                    self.item_specs[item_type]["dst_id"] += self.station_by_types[station_type]
+        reservations = self.reservationIndex(obs, assigned_tasks)
+        self.forecaster.update(obs)
+        self.ready_times = self.lookaheadReadyTimes(obs)
+        if not self.incremental:
+            return self.genAllTasks(obs, reservations)
 
-        reserved_stat = self.currentTaskStat(assigned_tasks)
+        # only pairs touching a station whose status or reservation changed
+        #   are generated again, the others are kept from previous calls
+        dirty_slots = set()
+        for i, station in enumerate(obs["stations"]):
+            station_key = (
+                station["remain_time"],
+                station["input_status"],
+                station["output_status"],
+                reservations.versions[i],
+                self.ready_times[i],
+            )
+            if station_key != self.station_keys[i]:
+                self.station_keys[i] = station_key
+                dirty_slots.update(self.station_slots[i])
+        for item_index, slot_index in dirty_slots:
+            i, j = self.task_pairs[item_index][slot_index]
+            self.task_slots[item_index][slot_index] = self.makeMetaTask(
+                self.item_types[item_index], i, j, obs, reservations)
 
         tasks_per_item = []
+        for item_index, item_type in enumerate(self.item_types):
+            item_tasks = []
+            slots = self.task_slots[item_index]
+            for slot_index, task in enumerate(slots):
+                if task is None:
+                    continue
+                # NOTE: assigned tasks belong to robots now
+                if task.robot_id != -1:
+                    i, j = self.task_pairs[item_index][slot_index]
+                    task = self.makeMetaTask(
+                        item_type, i, j, obs, reservations)
+                    slots[slot_index] = task
+                    if task is None:
+                        continue
+                item_tasks.append(task)
+            tasks_per_item.append(item_tasks)
+
+        return tasks_per_item
+
+    def genAllTasks(self,
+                    obs: Dict[str, Any],
+                    reservations: ReservationIndex
+                    ) -> List[List[MetaTask]]:
+        tasks_per_item = []
         for item_type in self.item_types:
             item_tasks = []
             for i in self.item_specs[item_type]["src_id"]:
                 for j in self.item_specs[item_type]["dst_id"]:
-                    src_station = obs["stations"][i]
-                    dst_station = obs["stations"][j]
-
-                    # TODO: conflict with reserved tasks
-                    output_item_count = sum(
-                        [task == item_type for task in reserved_stat[i]["output"]]
-                    )
-                    if item_type in [1, 2, 3] \
-                            and output_item_count >= 2:
-                        continue
-                    if item_type not in [1, 2, 3] \
-                            and output_item_count >= 1:
-                        continue
-                    if item_type in reserved_stat[j]["input"]:
-                        continue
-
-                    # naive filtering
-                    if src_station["remain_time"] == -1 \
-                            and src_station["output_status"] == 0:
-                        continue
-                    src_ready_time = TimeRange(0, 0) \
-                        if src_station["output_status"] == 1 \
-                        else TimeRange(src_station["remain_time"], src_station["remain_time"])
-                    penalty = 0 if output_item_count == 0 else -20
-                    # 1. lack this item
-                    # 2. input full but producing not done
-                    full_stat = self.station_specs[dst_station["station_type"]]["full"]
-                    if dst_station["input_status"] & (1 << item_type) \
-                            and dst_station["input_status"] != full_stat:
-                        continue
-                    if dst_station["input_status"] == full_stat \
-                            and dst_station["remain_time"] >= 0 \
-                            and dst_station["output_status"] == 1:
-                        continue
-                    dst_ready_time = TimeRange(0, 0) \
-                        if not (dst_station["input_status"] & (1 << item_type)) or dst_station["output_status"] == 1 \
-                        else TimeRange(dst_station["remain_time"], dst_station["remain_time"])
-
-                    # NOTE: record dst station input status
-                    dst_input_status = dst_station["input_status"]
-                    for k in reserved_stat[j]["input"]:
-                        dst_input_status |= 1 << k
-                    meta_task = MetaTask(
-                        item_type=item_type,
-                        src_station_id=i,
-                        dst_station_id=j,
-                        src_ready_time=src_ready_time,
-                        dst_ready_time=dst_ready_time,
-                        penalty=penalty,
-                        dst_src_time=self.betweenStation(
-                            src_station, dst_station),
-                        dst_input_status=dst_input_status,
-                    )
-
-                    item_tasks.append(meta_task)
+                    meta_task = self.makeMetaTask(
+                        item_type, i, j, obs, reservations)
+                    if meta_task is not None:
+                        item_tasks.append(meta_task)
             tasks_per_item.append(item_tasks)
 
         return tasks_per_item
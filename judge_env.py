@@ -1,36 +1,68 @@
 import sys
-from typing import Any, Dict, List, Optional, Tuple
+import time
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple, Union
+
+import numpy as np
+
+from action_buffer import ActionBuffer
+from compact_obs import ROBOT_DTYPE, STATION_DTYPE, CompactObs
+from profiler import StageProfiler
 
 
 class JudgeEnv:
     END_TOKEN = "OK"
 
-    def __init__(self) -> None:
+    def __init__(self,
+                 compact_obs: bool = False,
+                 stdin: Optional[BinaryIO] = None,
+                 profiler: Optional[StageProfiler] = None) -> None:
         self.frame_id = 0
         self.env_map = []
+        # NOTE: array backed observation, see compact_obs.py
+        self.compact_obs = compact_obs
+        self.stdin = sys.stdin.buffer if stdin is None else stdin
+        self.pending = b""
+        # NOTE: opt-in like the agents, shared with the agent for a full report
+        self.profiler = StageProfiler(enabled=False) if profiler is None else profiler
+        self.frame_start_time = None
 
     def reset(self):
-        while True:
-            line = sys.stdin.readline().strip()
-            if line == self.END_TOKEN:
-                break
-            self.env_map.append(line)
+        block = self._readBlock()
+        if block is not None:
+            self.env_map = [line.strip() for line in block.decode().splitlines()]
         # print(self.env_map, file=sys.stderr)
 
+    def _readBlock(self) -> Optional[bytes]:
+        # NOTE: the judge waits for our reply after OK,
+        #   so one frame can be read in large chunks without blocking
+        data = self.pending
+        end = data.find(self.END_TOKEN.encode())
+        while end < 0:
+            chunk = self.stdin.read1(1 << 16)
+            if not chunk:
+                self.pending = b""
+                return None
+            data += chunk
+            # numbers and map lines never contain "OK"
+            end = data.find(
+                self.END_TOKEN.encode(), max(0, len(data) - len(chunk) - 1))
+        self.pending = data[end + len(self.END_TOKEN):]
+        return data[:end].lstrip()
+
     def _writeDone(self):
         sys.stdout.write(f"{self.END_TOKEN}\n")
         sys.stdout.flush()
 
     @staticmethod
-    def _parseObs(obs) -> Optional[Dict]:
-        def _parseBaseInfo(lines: List[str]):
-            frame_id, money = tuple(map(int, lines.pop(0).split()))
+    def _parseObs(obs: List[str]) -> Optional[Dict]:
+        def _parseBaseInfo(lines: Iterator[str]):
+            frame_id, money = tuple(map(int, next(lines).split()))
             return {
                 "frame_id": frame_id,
                 "money": money,
             }
 
-        def _parseStation(lines: List[str]):
+        def _parseStation(lines: Iterator[str]):
             station_specs = {
                 "station_type": int,
                 "loc_x": float,
@@ -40,10 +72,10 @@ class JudgeEnv:
                 "output_status": int,
             }
 
-            num_stations = int(lines.pop(0))
+            num_stations = int(next(lines))
             stations = []
             for _ in range(num_stations):
-                items = lines.pop(0).split()
+                items = next(lines).split()
                 station = {
                     key: station_specs[key](value)
                     for key, value in zip(station_specs.keys(), items)
@@ -51,7 +83,7 @@ class JudgeEnv:
                 stations.append(station)
             return {"stations": stations}
 
-        def _parseRobots(lines: List[str]):
+        def _parseRobots(lines: Iterator[str]):
             robot_specs = {
                 "station_id": int,
                 "item_type": int,
@@ -66,7 +98,7 @@ class JudgeEnv:
             }
             robots = []
             for _ in range(4):
-                items = lines.pop(0).split()
+                items = next(lines).split()
                 robot = {
                     key: robot_specs[key](value)
                     for key, value in zip(robot_specs.keys(), items)
@@ -74,36 +106,70 @@ class JudgeEnv:
                 robots.append(robot)
             return {"robots": robots}
 
+        lines = iter(obs)
         obs_dict: Dict[str, Any] = {}
-        obs_dict.update(_parseBaseInfo(obs))
-        obs_dict.update(_parseStation(obs))
-        obs_dict.update(_parseRobots(obs))
+        obs_dict.update(_parseBaseInfo(lines))
+        obs_dict.update(_parseStation(lines))
+        obs_dict.update(_parseRobots(lines))
         return obs_dict
 
+    @staticmethod
+    def _parseCompactObs(obs: List[str]) -> CompactObs:
+        return JudgeEnv._parseCompactBlock("\n".join(obs))
+
+    @staticmethod
+    def _parseCompactBlock(block: str) -> CompactObs:
+        base_info, num_stations, values = block.split("\n", 2)
+        frame_id, money = tuple(map(int, base_info.split()))
+        num_stations = int(num_stations)
+        # NOTE: one bulk conversion for all stations and robots
+        values = np.fromstring(values, dtype=np.float64, sep=" ")
+        num_station_values = num_stations * len(STATION_DTYPE)
+        return CompactObs.fromValues(
+            frame_id, money,
+            values[:num_station_values].reshape(
+                num_stations, len(STATION_DTYPE)),
+            values[num_station_values:].reshape(-1, len(ROBOT_DTYPE)),
+        )
+
     def recv(self) -> Tuple[Optional[Dict], bool]:
         """
         Returns:
             observation (object): agent's observation of the current environment
             done (boolean): whether the episode has ended, in which case further step() calls will return None
         """
-        observation = []
-        while True:
-            line = sys.stdin.readline().strip()
-            if not line:
-                return None, True
-            if line == self.END_TOKEN:
-                break
-            observation.append(line)
-        # print(observation, file=sys.stderr)
-        self.frame_id = int(observation[0].split()[0])
-        obs = self._parseObs(observation)
+        block = self._readBlock()
+        if block is None or not block.strip():
+            return None, True
+        self.frame_start_time = time.perf_counter()
+        block = block.decode()
+        # print(block, file=sys.stderr)
+        obs = self._parseCompactBlock(block) \
+            if self.compact_obs else self._parseObs(block.splitlines())
+        self.frame_id = obs["frame_id"]
+        self.profiler.record(
+            "parse", time.perf_counter() - self.frame_start_time)
         return obs, False
 
-    def send(self, actions: List[str]) -> None:
-        sys.stdout.write(f"{self.frame_id}\n")
-        for action in actions:
-            sys.stdout.write(f"{action}\n")
-        self._writeDone()
+    def parseStatistics(self) -> Dict[str, float]:
+        # per frame parse time in ms
+        return self.profiler.stats("parse")
+
+    def send(self, actions: Union[List[str], ActionBuffer]) -> None:
+        # NOTE: the whole reply is written and flushed once
+        if isinstance(actions, ActionBuffer):
+            reply = actions.format(self.frame_id, self.END_TOKEN)
+        else:
+            reply = "\n".join(
+                [str(self.frame_id)] + actions + [self.END_TOKEN, ""])
+        with self.profiler.stage("send"):
+            sys.stdout.write(reply)
+            sys.stdout.flush()
+        # NOTE: frame time, from a complete frame read to the reply flushed
+        if self.frame_start_time is not None:
+            self.profiler.record(
+                "frame", time.perf_counter() - self.frame_start_time)
+            self.frame_start_time = None
 
 
 if __name__ == "__main__":
@@ -120,4 +186,5 @@ if __name__ == "__main__":
             break
         env.send(["forward 0 1"])
 
+    print(f"[INFO]: Parse time {env.parseStatistics()}", file=sys.stderr)
     print("[INFO]: Env wrapper finished", file=sys.stderr)
@@ -6,9 +6,11 @@ from typing import Dict
 import numpy as np
 
 from item_centric.agent import ItemBasedAgent
-from item_centric.scheduler import BaseScheduler, GreedyScheduler
+from item_centric.scheduler import (BaseScheduler, BeamScheduler, FlowScheduler,
+                                   GreedyScheduler, OptimalScheduler)
 # from robot_centric.agent import RobotBasedAgent
 # from robot_centric.scheduler import GreedyScheduler
+from profiler import StageProfiler
 from RobotEnv.env_wrapper import EnvWrapper
 from utils import fixSeed
 
@@ -24,6 +26,12 @@ if __name__ == "__main__":
     parser.add_argument("--use_revised_control", default=True, type=bool)
     parser.add_argument("--save-unfinished", default=False, action="store_true")
     parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--scheduler", default="greedy", choices=["greedy", "optimal", "flow", "beam"])
+    parser.add_argument("--profile", default=False, action="store_true")
+    parser.add_argument("--plan-ahead", default=False, action="store_true")
+    parser.add_argument("--event-driven", default=False, action="store_true")
+    parser.add_argument("--background-planner", default=False, action="store_true")
+    parser.add_argument("--sampling-control", default=False, action="store_true")
     args = parser.parse_args()
     robot_env_path = os.path.join(os.path.dirname(__file__), "RobotEnv")
     args.map_id = os.path.join(robot_env_path, args.map_id)
@@ -75,8 +83,21 @@ if __name__ == "__main__":
         args.use_revised_control = False
     else:
         raise ValueError("Unknown map")
-    scheduler = GreedyScheduler(params)
-    agent = ItemBasedAgent(scheduler, args.use_revised_control)
+    if args.scheduler == "greedy":
+        scheduler = GreedyScheduler(params)
+    elif args.scheduler == "optimal":
+        scheduler = OptimalScheduler(params)
+    elif args.scheduler == "flow":
+        scheduler = FlowScheduler(params)
+    else:
+        scheduler = BeamScheduler(params)
+    agent = ItemBasedAgent(
+        scheduler, args.use_revised_control,
+        profiler=StageProfiler() if args.profile else None,
+        plan_ahead=args.plan_ahead,
+        event_driven=args.event_driven,
+        background_planner=args.background_planner,
+        use_sampling_control=args.sampling_control)
     while True:
         obs, done = env.recv()
         if done:
@@ -85,6 +106,7 @@ if __name__ == "__main__":
         env.send(actions)
 
     env.close()
+    agent.close()
 
     if not args.no_statistics:
         agent.showStatistics(args.save_unfinished)
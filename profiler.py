@@ -0,0 +1,128 @@
+import sys
+import time
+from typing import Dict, List, Optional, TextIO
+
+import numpy as np
+
+
+class StageTimer:
+    __slots__ = ("profiler", "name", "start_time")
+
+    def __init__(self, profiler: "StageProfiler", name: str) -> None:
+        self.profiler = profiler
+        self.name = name
+        self.start_time = 0.0
+
+    def __enter__(self) -> "StageTimer":
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.profiler.record(
+            self.name, time.perf_counter() - self.start_time)
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self) -> "NullTimer":
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+class StageProfiler:
+    """
+    Opt-in per-stage latency recorder,
+        the last `capacity` samples of each stage are kept in a ring buffer
+    """
+    NULL_TIMER = NullTimer()
+
+    def __init__(self,
+                 enabled: bool = True,
+                 capacity: int = 10000,
+                 budget: float = 15e-3,
+                 budget_stage: str = "frame") -> None:
+        self.enabled = enabled
+        self.capacity = capacity
+        # NOTE: samples of budget_stage longer than budget are counted
+        self.budget = budget
+        self.budget_stage = budget_stage
+        self.num_over_budget = 0
+        self.samples: Dict[str, np.ndarray] = {}
+        self.counts: Dict[str, int] = {}
+        self.timers: Dict[str, StageTimer] = {}
+
+    def stage(self, name: str):
+        # usage: with profiler.stage("genTasks"): ...
+        if not self.enabled:
+            return self.NULL_TIMER
+        timer = self.timers.get(name)
+        if timer is None:
+            timer = self.timers[name] = StageTimer(self, name)
+        return timer
+
+    def record(self, name: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = np.empty(self.capacity)
+            self.counts[name] = 0
+        samples[self.counts[name] % self.capacity] = seconds
+        self.counts[name] += 1
+        if name == self.budget_stage and seconds > self.budget:
+            self.num_over_budget += 1
+
+    def stats(self, name: str) -> Dict[str, float]:
+        # count of all samples, percentiles (ms) of the kept ones
+        if not self.counts.get(name):
+            return {}
+        samples = self.samples[name][:min(self.counts[name], self.capacity)] * 1e3
+        p50, p99 = np.percentile(samples, [50, 99])
+        return {
+            "count": self.counts[name],
+            "mean": samples.mean(),
+            "p50": p50,
+            "p99": p99,
+            "max": samples.max(),
+        }
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        return {name: self.stats(name) for name in self.samples}
+
+    def histogram(self, name: str, num_bins: int = 12) -> List[str]:
+        # log scale bins from 1us to 100ms
+        samples = self.samples[name][:min(self.counts[name], self.capacity)]
+        edges = np.logspace(-6, -1, num_bins + 1)
+        counts, _ = np.histogram(np.clip(samples, edges[0], edges[-1]), edges)
+        scale = 40 / max(1, counts.max())
+        return [
+            f"{edges[i] * 1e3:9.3f} ms | {'#' * int(np.ceil(count * scale)):<40} {count}"
+            for i, count in enumerate(counts)
+        ]
+
+    def showReport(self,
+                   file: TextIO = sys.stderr,
+                   stages: Optional[List[str]] = None) -> None:
+        if not self.enabled:
+            return
+        for name in stages or list(self.samples):
+            stats = self.stats(name)
+            if not stats:
+                continue
+            print(
+                f"[INFO]: {name:<12} count {stats['count']:>6}, "
+                f"p50 {stats['p50']:.3f} ms, p99 {stats['p99']:.3f} ms, "
+                f"max {stats['max']:.3f} ms",
+                file=file
+            )
+            for line in self.histogram(name):
+                print(f"    {line}", file=file)
+        if self.budget_stage in self.counts:
+            print(
+                f"[INFO]: {self.num_over_budget} {self.budget_stage}s "
+                f"over {self.budget * 1e3:.1f} ms budget",
+                file=file
+            )
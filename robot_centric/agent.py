@@ -1,5 +1,7 @@
-from typing import Dict, List
+import sys
+from typing import Dict, List, Optional
 
+from profiler import StageProfiler
 from subtask_to_action import SubtaskToAction
 from task_to_subtask import TaskHelper
 
@@ -8,8 +10,12 @@ from .task_manager import TaskManager
 
 
 class RobotBasedAgent:
-    def __init__(self, scheduler: BaseScheduler) -> None:
+    def __init__(self,
+                 scheduler: BaseScheduler,
+                 profiler: Optional[StageProfiler] = None) -> None:
         self.num_robots = 4
+        self.profiler = StageProfiler(enabled=False) \
+            if profiler is None else profiler
         self.moneys, self.task_log = [], []
         self.last_obs = [None for _ in range(self.num_robots)]
 
@@ -24,26 +30,31 @@ class RobotBasedAgent:
         self.scheduler.clear(list(range(self.num_robots)))
 
     def step(self, obs: Dict) -> List[str]:
+        with self.profiler.stage("step"):
+            return self._step(obs)
+
+    def _step(self, obs: Dict) -> List[str]:
         assert obs is not None
         self.moneys.append(obs["money"])
 
         # check task status
         subtasks = [None] * self.num_robots
-        for i, task in enumerate(self.scheduler.stat()):
-            if task is None:
-                continue
-            task.update(obs)
-            if self.task_helper.isTaskDone(task):
-                self.task_log.append({
-                    "start_time": self.last_obs[i]["frame_id"],
-                    "end_time": obs["frame_id"],
-                    "duration": obs["frame_id"] - self.last_obs[i]["frame_id"],
-                    "task_info": task,
-                    "obs_info": self.last_obs[i],
-                })
-                continue
-            subtask = self.task_helper.makeSubtask(task, obs)
-            subtasks[i] = subtask
+        with self.profiler.stage("status"):
+            for i, task in enumerate(self.scheduler.stat()):
+                if task is None:
+                    continue
+                task.update(obs)
+                if self.task_helper.isTaskDone(task):
+                    self.task_log.append({
+                        "start_time": self.last_obs[i]["frame_id"],
+                        "end_time": obs["frame_id"],
+                        "duration": obs["frame_id"] - self.last_obs[i]["frame_id"],
+                        "task_info": task,
+                        "obs_info": self.last_obs[i],
+                    })
+                    continue
+                subtask = self.task_helper.makeSubtask(task, obs)
+                subtasks[i] = subtask
 
         # make decision
         robot_indices = [
@@ -51,24 +62,25 @@ class RobotBasedAgent:
             if subtasks[i] is None
         ]  # idle robots
         self.scheduler.clear(robot_indices)
-        candidate_tasks = self.task_manager.genTasks(obs)
-        candidate_tasks = self.task_manager.filterInvalidTasks(
-            candidate_tasks, obs)
+        with self.profiler.stage("genTasks"):
+            candidate_tasks = self.task_manager.genTasks(obs)
+            candidate_tasks = self.task_manager.filterInvalidTasks(
+                candidate_tasks, obs)
         for i in range(self.num_robots):
             if subtasks[i] is None:
-                robot_tasks = self.task_manager.checkConflict(
-                    candidate_tasks[i], self.scheduler.stat(), obs)
-                selected_task = self.scheduler.select(i, robot_tasks, obs)
-                subtask = self.task_helper.makeSubtask(selected_task, obs)
+                with self.profiler.stage("assign"):
+                    robot_tasks = self.task_manager.checkConflict(
+                        candidate_tasks[i], self.scheduler.stat(), obs)
+                    selected_task = self.scheduler.select(i, robot_tasks, obs)
+                with self.profiler.stage("makeSubtask"):
+                    subtask = self.task_helper.makeSubtask(selected_task, obs)
                 subtasks[i] = subtask
                 self.last_obs[i] = obs
 
         # control
-        actions = []
-        for subtask in subtasks:
-            assert subtask is not None
-            action = self.subtask_to_action.getAction(subtask, obs)
-            actions += action
+        assert all(subtask is not None for subtask in subtasks)
+        with self.profiler.stage("getAction"):
+            actions = self.subtask_to_action.getActions(subtasks, obs)
 
         return actions
 
@@ -86,22 +98,27 @@ class RobotBasedAgent:
                     f"task_type {task.task_type}, station {task.station_id}, item {task.item_type}"
                 )
 
-        import matplotlib.pyplot as plt
         import numpy as np
 
-        # time - money
-        fig, ax = plt.subplots()
-        ax.plot(self.moneys, label="money")
-        ax.set_xlabel("time")
-        ax.set_ylabel("money")
-        fig.savefig("money.png")
-
-        # task info
-        fig, ax = plt.subplots()
-        ax.hist(task_durations, bins=100)
-        ax.set_xlabel("duration")
-        ax.set_ylabel("count")
-        fig.savefig("task_durations.png")
+        # NOTE: latency report replaces the plots when profiling
+        if self.profiler.enabled:
+            self.profiler.showReport(sys.stdout)
+        else:
+            import matplotlib.pyplot as plt
+
+            # time - money
+            fig, ax = plt.subplots()
+            ax.plot(self.moneys, label="money")
+            ax.set_xlabel("time")
+            ax.set_ylabel("money")
+            fig.savefig("money.png")
+
+            # task info
+            fig, ax = plt.subplots()
+            ax.hist(task_durations, bins=100)
+            ax.set_xlabel("duration")
+            ax.set_ylabel("count")
+            fig.savefig("task_durations.png")
 
         print("[INFO]: Task duration {:.2f} +- {:.2f}".format(
             np.mean(task_durations), np.std(task_durations)))
@@ -1,6 +1,7 @@
 import math
 from typing import Any, Dict, List, Optional
 
+from station_forecast import StationForecaster
 from task_utils import Task, TaskType
 
 
@@ -46,6 +47,7 @@ class TaskManager:
         }
 
         self.costs = [3000, 4400, 5800, 15400, 17200, 19200, 76000]
+        self.forecaster = StationForecaster()
 
     def isTaskValid(self, task: Task, obs: Dict[str, Any]) -> None:
         # FIXME: this may be useless, genTasks is enough
@@ -223,10 +225,22 @@ class TaskManager:
         # 6. some items cannot be sold if there are not receiving stations
         # ...
 
-    def filterInvalidTasks(self, tasks: List[List[Task]], obs: Dict[str, Any]) -> List[List[Task]]:
-        # TODO: coarse filter of all tasks
+    @staticmethod
+    def arrivalTime(obs: Dict[str, Any], robot_id: int, station_id: int) -> float:
         # params that can be adjusted
         predict_scale = 1.3
+        station = obs["stations"][station_id]
+        robot = obs["robots"][robot_id]
+        # NOTE: compared with remain_time frames as before
+        return math.sqrt(
+            (robot["loc_x"] - station["loc_x"]) ** 2 +
+            (robot["loc_y"] - station["loc_y"]) ** 2
+        ) / 6 * predict_scale
+
+    def filterInvalidTasks(self, tasks: List[List[Task]], obs: Dict[str, Any]) -> List[List[Task]]:
+        # TODO: coarse filter of all tasks
+        self.forecaster.update(obs)
+        frame_id = obs["frame_id"]
 
         # stats
         new_tasks = [[] for _ in range(4)]
@@ -252,26 +266,11 @@ class TaskManager:
                 # buy product
                 if task.task_type == TaskType.BUY:
                     # from processing stations
-                    # not producing now
-                    if 4 <= station_type <= 7 and \
-                            obs['stations'][task.station_id]['remain_time'] == -1:
-                        valid_index[idx] = 0
-
                     # not ready within predicted arriving time
-                    elif 4 <= station_type <= 7 and \
-                            obs['stations'][task.station_id]['output_status'] == 0:
-                        # clac time
-                        station_pos_x, station_pos_y = \
-                            obs['stations'][task.station_id]['loc_x'], \
-                            obs['stations'][task.station_id]['loc_y']
-                        robot_pos_x, robot_pos_y = \
-                            obs['robots'][i]['loc_x'], obs['robots'][i]['loc_y']
-                        predicted_time = math.sqrt(
-                            (robot_pos_x - station_pos_x) ** 2 +
-                            (robot_pos_y - station_pos_y) ** 2
-                        ) / 6 * predict_scale
-                        # check
-                        if predicted_time < obs['stations'][task.station_id]['remain_time']:
+                    if 4 <= station_type <= 7:
+                        predicted_time = self.arrivalTime(obs, i, task.station_id)
+                        if not self.forecaster.isOutputReadyBy(
+                                task.station_id, frame_id + predicted_time):
                             valid_index[idx] = 0
 
                 # sell product
@@ -279,42 +278,13 @@ class TaskManager:
                     # full station; not producing or not ready within arrival time
                     # fixme: may not be the right way to interpret; other robots may clear the station
                     if 4 <= station_type <= 7:
-                        # get input stat
-                        input_status = obs['stations'][task.station_id]['input_status']
-                        placed_item_list = [0 for _ in range(6)]
-                        for item_idx in range(6):
-                            input_status //= 2
-                            placed_item_list[item_idx] = input_status % 2
-
-                        # print('Deciding:', f'robot {i} station {task.station_id} item {task.item_type} station_type {station_type}',
-                        #     f'remain_time {obs["stations"][task.station_id]["remain_time"]}, item_list', placed_item_list)
-
-                        # already_have + not producing / conjesture
-                        if placed_item_list[task.item_type-1] == 1 \
-                                and obs['stations'][task.station_id]['remain_time'] <= 0:
+                        # occupied slot not free within arrival time
+                        predicted_time = self.arrivalTime(obs, i, task.station_id)
+                        if not self.forecaster.isInputFreeBy(
+                                task.station_id, task.item_type,
+                                frame_id + predicted_time):
                             valid_index[idx] = 0
 
-                        # do not have + producing / conjesture + lack one item
-                        # elif placed_item_list[task.item_type-1] == 0 and obs['stations'][task.station_id]['remain_time'] >= 0 and \
-                        #         sum(placed_item_list) == len(self.station_specs[station_type]["input"])-1 and obs['stations'][task.station_id]['output_status'] == 1:
-                        #     valid_index[idx] = 0
-
-                        # already_have + not ready within arrival time
-                        elif placed_item_list[task.item_type-1] == 1:
-                            # calc time
-                            station_pos_x, station_pos_y = \
-                                obs['stations'][task.station_id]['loc_x'], \
-                                obs['stations'][task.station_id]['loc_y']
-                            robot_pos_x, robot_pos_y = \
-                                obs['robots'][i]['loc_x'], obs['robots'][i]['loc_y']
-                            predicted_time = math.sqrt(
-                                (robot_pos_x - station_pos_x) ** 2 +
-                                (robot_pos_y - station_pos_y) ** 2
-                            ) / 6 * predict_scale
-                            # check
-                            if predicted_time < obs['stations'][task.station_id]['remain_time']:
-                                valid_index[idx] = 0
-
             # delete
             new_tasks[i] = [task for idx, task in enumerate(
                 tasks[i]) if valid_index[idx] == 1]
@@ -1,26 +1,155 @@
 import argparse
+import csv
+import json
+import os
 import re
+import shlex
 import subprocess
+import sys
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List
+
+import numpy as np
+
+SCORE_PATTERN = re.compile(r'{"status":"Successful","score":(\d+)}')
+
+
+def runJob(job: Dict[str, Any]) -> Dict[str, Any]:
+    # NOTE: every job talks to its own simulator through a unique pipe
+    pipe_name = f"/tmp/pipe_{uuid.uuid4().hex}"
+    command = [
+        sys.executable, job["main"],
+        "--map-id", f"maps/{job['map_id']}.txt",
+        "--seed", str(job["seed"]),
+        "--pipe-name", pipe_name,
+        "--no-statistics",
+    ] + shlex.split(job["args"])
+    result = {
+        "param_set": job["param_set"],
+        "map_id": job["map_id"],
+        "seed": job["seed"],
+        "score": None,
+        "runtime": 0.0,
+        "error": "",
+    }
+    start_time = time.perf_counter()
+    try:
+        process = subprocess.run(
+            command, capture_output=True, timeout=job["timeout"],
+            cwd=os.path.dirname(os.path.abspath(job["main"])))
+        output = process.stdout.decode("utf-8", errors="replace")
+        score = SCORE_PATTERN.search(output)
+        if score:
+            result["score"] = int(score.group(1))
+        else:
+            error = process.stderr.decode("utf-8", errors="replace").strip()
+            result["error"] = f"exit code {process.returncode}, no score; " \
+                + (error.splitlines()[-1] if error else "")
+    except subprocess.TimeoutExpired:
+        result["error"] = f"timeout after {job['timeout']}s"
+    result["runtime"] = time.perf_counter() - start_time
+    if os.path.exists(pipe_name):
+        os.remove(pipe_name)
+    return result
+
+
+def aggregate(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # statistics per (param set, map)
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for result in results:
+        groups.setdefault(
+            (result["param_set"], result["map_id"]), []).append(result)
+    summary = []
+    for (param_set, map_id), group in sorted(groups.items()):
+        scores = np.array([
+            result["score"] for result in group
+            if result["score"] is not None
+        ])
+        summary.append({
+            "param_set": param_set,
+            "map_id": map_id,
+            "runs": len(group),
+            "failures": len(group) - len(scores),
+            "mean": float(scores.mean()) if len(scores) else float("nan"),
+            "min": float(scores.min()) if len(scores) else float("nan"),
+            "max": float(scores.max()) if len(scores) else float("nan"),
+            "std": float(scores.std()) if len(scores) else float("nan"),
+            "runtime": float(np.mean([result["runtime"] for result in group])),
+        })
+    return summary
+
+
+def parseParamSets(param_sets: List[str]) -> Dict[str, str]:
+    # "name=--extra --args" -> {name: "--extra --args"}
+    parsed = {}
+    for param_set in param_sets:
+        name, _, args = param_set.partition("=")
+        parsed[name] = args
+    return parsed if parsed else {"default": ""}
+
+
+def writeResults(results: List[Dict[str, Any]],
+                 summary: List[Dict[str, Any]],
+                 json_path: str, csv_path: str) -> None:
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump({"results": results, "summary": summary}, f, indent=2)
+    if csv_path:
+        with open(csv_path, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+            writer.writeheader()
+            writer.writerows(results)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--seeds", default=None, type=int, nargs="+")
+    parser.add_argument("--maps", default=[1, 2, 3, 4], type=int, nargs="+")
+    parser.add_argument("--param-set", default=[], action="append",
+                        help="name=extra main.py args, e.g. optimal='--scheduler optimal'")
+    parser.add_argument("--main", default="main.py")
+    parser.add_argument("--workers", default=os.cpu_count(), type=int)
+    parser.add_argument("--timeout", default=600, type=float)
+    parser.add_argument("--json", default="")
+    parser.add_argument("--csv", default="")
     args = parser.parse_args()
 
-    scores = []
-    pattern = re.compile(r'{"status":"Successful","score":(\d+)}')
-    for map_id in range(1, 5):
-        output = subprocess.check_output([
-            "python", "main.py",
-            "--map-id", f"maps/{map_id}.txt",
-            "--seed", str(args.seed),
-            "--no-statistics"
-        ])
-        result = pattern.search(output.decode('utf-8'))
-        if not result:
-            print(f"[ERROR]: Failed to parse output for map {map_id}")
-            exit(1)
-        scores.append(int(result.group(1)))
-    print(f"\n\n[INFO]: {scores}")
-    print(f"[INFO]: Total score {sum(scores)}")
+    seeds = args.seeds if args.seeds is not None else [args.seed]
+    jobs = [
+        {
+            "param_set": name,
+            "args": param_args,
+            "map_id": map_id,
+            "seed": seed,
+            "main": args.main,
+            "timeout": args.timeout,
+        }
+        for name, param_args in parseParamSets(args.param_set).items()
+        for map_id in args.maps
+        for seed in seeds
+    ]
+    print(f"[INFO]: {len(jobs)} jobs on {args.workers} workers")
+    start_time = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        for result in executor.map(runJob, jobs):
+            if result["error"]:
+                print(f"[ERROR]: map {result['map_id']}, seed {result['seed']}, "
+                      f"{result['param_set']}: {result['error']}")
+            results.append(result)
+    summary = aggregate(results)
+    writeResults(results, summary, args.json, args.csv)
+
+    for stat in summary:
+        print(f"[INFO]: {stat['param_set']:<10} map {stat['map_id']} "
+              f"mean {stat['mean']:.1f}, min {stat['min']:.0f}, "
+              f"std {stat['std']:.1f}, failures {stat['failures']}/{stat['runs']}")
+    for name in parseParamSets(args.param_set):
+        total = sum(stat["mean"] for stat in summary if stat["param_set"] == name)
+        print(f"[INFO]: {name} total score {total:.1f}")
+    print(f"[INFO]: Wall time {time.perf_counter() - start_time:.1f}s")
+    if any(result["error"] for result in results):
+        exit(1)
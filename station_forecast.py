@@ -0,0 +1,126 @@
+from bisect import bisect_left, bisect_right
+from typing import Any, Dict, List, Optional
+
+# station type: (input item types, production frames, has output)
+STATION_SPECS = {
+    1: ([], 50, True),
+    2: ([], 50, True),
+    3: ([], 50, True),
+    4: ([1, 2], 500, True),
+    5: ([1, 3], 500, True),
+    6: ([2, 3], 500, True),
+    7: ([4, 5, 6], 1000, True),
+    8: ([7], 1, False),
+    9: ([1, 2, 3, 4, 5, 6, 7], 1, False),
+}
+
+
+class StationForecaster:
+    """
+    Predicted timeline of every station over the next `horizon` frames,
+        output_frames[i] are the frames when successive products are available,
+        input_frames[i][item_type] is the frame when the input slot is free
+    """
+
+    def __init__(self, horizon: int = 1000) -> None:
+        self.horizon = horizon
+        self.frame_id = None
+        self.station_keys: List[Any] = []
+        self.output_frames: List[List[int]] = []
+        self.input_frames: List[Dict[int, Optional[int]]] = []
+        self.num_updates = 0
+
+    def update(self, obs: Dict[str, Any]) -> None:
+        # NOTE: absolute frames stay valid while a station ticks as predicted,
+        #   only stations off their timeline are forecast again
+        frame_id = obs["frame_id"]
+        if frame_id == self.frame_id:
+            return
+        self.frame_id = frame_id
+        stations = obs["stations"]
+        if len(self.station_keys) != len(stations):
+            self.station_keys = [None] * len(stations)
+            self.output_frames = [[] for _ in stations]
+            self.input_frames = [{} for _ in stations]
+        for i, station in enumerate(stations):
+            remain_time = station["remain_time"]
+            if remain_time > 0:
+                done_frame = frame_id + remain_time
+            elif remain_time == 0 and station["output_status"] == 1:
+                done_frame = -2  # blocked
+            else:
+                done_frame = remain_time
+            station_key = (
+                done_frame, station["input_status"], station["output_status"])
+            if station_key != self.station_keys[i]:
+                self.station_keys[i] = station_key
+                self.forecast(i, station, frame_id)
+                self.num_updates += 1
+
+    def forecast(self, i: int, station: Dict[str, Any], frame_id: int) -> None:
+        inputs, period, has_output = STATION_SPECS[station["station_type"]]
+        remain_time = station["remain_time"]
+        input_status = station["input_status"]
+        output_status = station["output_status"]
+        full_stat = sum(1 << item_type for item_type in inputs)
+
+        # output, assuming every product is picked up once available
+        output_frames = []
+        if has_output:
+            if output_status == 1:
+                output_frames.append(0)
+            if remain_time >= 0:
+                output_frames.append(
+                    0 if output_status == 1 and remain_time == 0
+                    else frame_id + remain_time)
+            # the next production starts without new inputs
+            if output_frames and (not inputs or input_status == full_stat):
+                next_frame = max(output_frames[-1], frame_id) + period
+                while next_frame <= frame_id + self.horizon:
+                    output_frames.append(next_frame)
+                    if inputs:
+                        break
+                    next_frame += period
+        self.output_frames[i] = output_frames
+
+        # input slots, an occupied slot is free when the next production starts
+        input_frames = {}
+        for item_type in inputs:
+            if not input_status & (1 << item_type):
+                input_frames[item_type] = 0
+            elif input_status != full_stat:
+                input_frames[item_type] = None
+            elif remain_time >= 0 and output_status == 1:
+                input_frames[item_type] = None
+            elif output_status == 1:
+                input_frames[item_type] = 0
+            else:
+                input_frames[item_type] = frame_id + remain_time
+        self.input_frames[i] = input_frames
+
+    def outputReadyFrame(self, i: int) -> Optional[int]:
+        # first frame with an output, None if the station is idle
+        output_frames = self.output_frames[i]
+        return output_frames[0] if output_frames else None
+
+    def isOutputReadyBy(self, i: int, frame_id: float) -> bool:
+        output_frames = self.output_frames[i]
+        return bool(output_frames) and output_frames[0] <= frame_id
+
+    def numOutputsBy(self, i: int, frame_id: float) -> int:
+        # O(log n), products available until frame_id
+        return bisect_right(self.output_frames[i], frame_id)
+
+    def nextOutputFrame(self, i: int, frame_id: float) -> Optional[int]:
+        # O(log n), first product available at or after frame_id
+        output_frames = self.output_frames[i]
+        index = bisect_left(output_frames, frame_id)
+        return output_frames[index] if index < len(output_frames) else None
+
+    def inputFreeFrame(self, i: int, item_type: int) -> Optional[int]:
+        # None if the slot is not free within the forecast
+        return self.input_frames[i].get(item_type)
+
+    def isInputFreeBy(self, i: int, item_type: int, frame_id: float) -> bool:
+        free_frame = self.input_frames[i].get(item_type)
+        return free_frame is not None and free_frame <= frame_id
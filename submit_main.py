@@ -1,8 +1,11 @@
 import argparse
+import sys
 
 from item_centric.agent import ItemBasedAgent
-from item_centric.scheduler import GreedyScheduler
+from item_centric.scheduler import (BeamScheduler, FlowScheduler, GreedyScheduler,
+                                    OptimalScheduler)
 from judge_env import JudgeEnv
+from profiler import StageProfiler
 from utils import fixSeed
 
 
@@ -11,12 +14,37 @@ if __name__ == "__main__":
     parser.add_argument("--show-statistics",
                         default=False, action="store_true")
     parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--compact-obs", default=False, action="store_true")
+    parser.add_argument("--profile", default=False, action="store_true")
+    parser.add_argument("--deadline-ms", default=None, type=float)
+    parser.add_argument("--plan-ahead", default=False, action="store_true")
+    parser.add_argument("--event-driven", default=False, action="store_true")
+    parser.add_argument("--background-planner", default=False, action="store_true")
+    parser.add_argument("--sampling-control", default=False, action="store_true")
+    parser.add_argument("--scheduler", default="greedy", choices=["greedy", "optimal", "flow", "beam"])
     args = parser.parse_args()
 
-    env = JudgeEnv()
+    profiler = StageProfiler(enabled=args.profile)
+    # NOTE: parse statistics need the env profiler even without --profile
+    env = JudgeEnv(
+        args.compact_obs,
+        profiler=profiler if args.profile else StageProfiler(enabled=args.show_statistics))
     fixSeed(args.seed)
-    scheduler = GreedyScheduler()
-    agent = ItemBasedAgent(scheduler)
+    if args.scheduler == "greedy":
+        scheduler = GreedyScheduler()
+    elif args.scheduler == "optimal":
+        scheduler = OptimalScheduler()
+    elif args.scheduler == "flow":
+        scheduler = FlowScheduler()
+    else:
+        scheduler = BeamScheduler()
+    agent = ItemBasedAgent(
+        scheduler, use_action_buffer=True, profiler=profiler,
+        deadline=None if args.deadline_ms is None else args.deadline_ms * 1e-3,
+        plan_ahead=args.plan_ahead,
+        event_driven=args.event_driven,
+        background_planner=args.background_planner,
+        use_sampling_control=args.sampling_control)
     env_map = env.reset()
     env._writeDone()
     while True:
@@ -25,6 +53,11 @@ if __name__ == "__main__":
             break
         actions = agent.step(obs)
         env.send(actions)
+    agent.close()
 
+    if args.profile and not args.show_statistics:
+        # NOTE: stdout is the judge pipe
+        profiler.showReport(sys.stderr)
     if args.show_statistics:
+        print(f"[INFO]: Parse time (ms) {env.parseStatistics()}", file=sys.stderr)
         agent.showStatistics()
@@ -0,0 +1,211 @@
+import math
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from action_buffer import ActionBuffer
+from task_utils import Subtask, SubtaskType
+
+
+class SubtaskToAction:
+    """
+    Sampling controller: a grid of (forward, rotate) commands per robot
+        is rolled forward with a unicycle model and scored by progress and clearance,
+        all robots and samples in one numpy batch
+    """
+
+    def __init__(self, params: Optional[Dict] = None):
+        # not assigned params: use init ones
+        if not params:
+            self.params = {
+                "num_line_samples": 9,
+                "num_angular_samples": 13,
+                "horizon_frames": 15,
+                "rollout_step_frames": 3,
+                "heading_weight": 0.3,
+                "robot_clearance": 0.5,
+                "robot_weight": 0.25,
+                "wall_clearance": 0.3,
+                "wall_weight": 4.0,
+                "collision_penalty": 100.0,
+            }
+        else:
+            self.params = params
+
+        line_samples = np.linspace(-2, 6, self.params["num_line_samples"])
+        angular_samples = np.linspace(
+            -math.pi, math.pi, self.params["num_angular_samples"])
+        # (samples,)
+        self.line_samples, self.angular_samples = [
+            grid.ravel() for grid in np.meshgrid(line_samples, angular_samples)]
+        self.map_size = 50
+        self.frame_time = 0.02
+        self.robot_density = 20
+        self.max_force = 250
+        self.max_torque = 50
+
+    def getActions(self,
+                   subtasks: List[Optional[Subtask]],
+                   obs: Dict[str, Any],
+                   action_buffer: Optional[ActionBuffer] = None
+                   ) -> Union[List[str], ActionBuffer]:
+        commands = self.getCommands(subtasks, obs)
+        if action_buffer is not None:
+            for subtask, command in zip(subtasks, commands):
+                if subtask is not None:
+                    action_buffer.setCommand(subtask.robot_id, *command)
+            return action_buffer
+
+        actions = []
+        for subtask, command in zip(subtasks, commands):
+            if subtask is not None:
+                actions += self.formatAction(subtask.robot_id, *command)
+        return actions
+
+    # get action from a single subtask
+    def getAction(self, subtask: Subtask, obs: Dict[str, Any]) -> List[str]:
+        subtasks = [None] * len(obs["robots"])
+        subtasks[subtask.robot_id] = subtask
+        return self.formatAction(
+            subtask.robot_id, *self.getCommands(subtasks, obs)[subtask.robot_id])
+
+    @staticmethod
+    def formatAction(robot_id: int,
+                     subtask_type: SubtaskType,
+                     l_speed: float,
+                     a_speed: float) -> List[str]:
+        if subtask_type == SubtaskType.GOTO:
+            return [f'forward {robot_id} {l_speed}', f'rotate {robot_id} {a_speed}']
+        elif subtask_type == SubtaskType.BUY:
+            return [f'buy {robot_id}']
+        elif subtask_type == SubtaskType.SELL:
+            return [f'sell {robot_id}']
+        else:
+            return [f'destroy {robot_id}']
+
+    def getCommands(self,
+                    subtasks: List[Optional[Subtask]],
+                    obs: Dict[str, Any]
+                    ) -> List[Optional[Tuple[SubtaskType, float, float]]]:
+        # (subtask type, line speed, angular speed) of every robot
+        commands = [None] * len(subtasks)
+        goto_ids = []
+        for i, subtask in enumerate(subtasks):
+            if subtask is None:
+                continue
+            if subtask.subtask_type == SubtaskType.GOTO:
+                goto_ids.append(i)
+            elif subtask.subtask_type in \
+                    [SubtaskType.BUY, SubtaskType.SELL, SubtaskType.DESTROY]:
+                commands[i] = (subtask.subtask_type, 0, 0)
+            else:
+                raise NotImplementedError()
+        if not goto_ids:
+            return commands
+
+        targets = np.array([
+            [subtasks[i].station_stat["loc_x"], subtasks[i].station_stat["loc_y"]]
+            for i in goto_ids])
+        best = self.selectSamples(obs, goto_ids, targets)
+        for i, index in zip(goto_ids, best.tolist()):
+            commands[i] = (
+                SubtaskType.GOTO,
+                float(self.line_samples[index]),
+                float(self.angular_samples[index]))
+        return commands
+
+    def rolloutOthers(self, obs: Dict[str, Any], num_steps: int, step_time: float) -> np.ndarray:
+        # (robots, steps, 2) constant velocity prediction of every robot
+        robots = obs["robots"]
+        loc = np.array([[robot["loc_x"], robot["loc_y"]] for robot in robots])
+        velocity = np.array(
+            [[robot["line_speed_x"], robot["line_speed_y"]] for robot in robots])
+        times = step_time * np.arange(1, num_steps + 1)
+        return loc[:, None, :] + times[None, :, None] * velocity[:, None, :]
+
+    def selectSamples(self,
+                      obs: Dict[str, Any],
+                      robot_ids: List[int],
+                      targets: np.ndarray) -> np.ndarray:
+        # index of the best sample of each robot, (robots,) -> (robots,)
+        params = self.params
+        robots = [obs["robots"][i] for i in robot_ids]
+        loc = np.array([[robot["loc_x"], robot["loc_y"]] for robot in robots])
+        theta = np.array([robot["theta"] for robot in robots])
+        velocity = np.array(
+            [[robot["line_speed_x"], robot["line_speed_y"]] for robot in robots])
+        radius = np.array(
+            [0.45 if robot["item_type"] == 0 else 0.53 for robot in robots])
+        mass = self.robot_density * math.pi * radius ** 2
+        inertia = 0.5 * mass * radius ** 2
+        all_radius = np.array(
+            [0.45 if robot["item_type"] == 0 else 0.53 for robot in obs["robots"]])
+
+        step_frames = params["rollout_step_frames"]
+        num_steps = max(params["horizon_frames"] // step_frames, 1)
+        dt = step_frames * self.frame_time
+        others = self.rolloutOthers(obs, num_steps, dt)
+        # NOTE: a robot is not its own obstacle
+        other_mask = np.array(robot_ids)[:, None] != np.arange(len(obs["robots"]))[None, :]
+
+        # (robots, samples) unicycle rollout, as the judge limits force and torque
+        line_speed = np.repeat(
+            (velocity * np.stack([np.cos(theta), np.sin(theta)], axis=-1))
+            .sum(axis=-1)[:, None], len(self.line_samples), axis=1)
+        angular_speed = np.repeat(
+            np.array([robot["angular_speed"] for robot in robots])[:, None],
+            len(self.line_samples), axis=1)
+        heading = np.repeat(theta[:, None], len(self.line_samples), axis=1)
+        x = np.repeat(loc[:, 0:1], len(self.line_samples), axis=1)
+        y = np.repeat(loc[:, 1:2], len(self.line_samples), axis=1)
+        max_line_delta = (self.max_force / mass * dt)[:, None]
+        max_angular_delta = (self.max_torque / inertia * dt)[:, None]
+        wall_clear = np.full(x.shape, np.inf)
+        robot_clear = np.full(x.shape, np.inf)
+        # NOTE: distance averaged over the rollout, passing by the station
+        #   is not better than slowing down at it
+        mean_dist = np.zeros(x.shape)
+        for step in range(num_steps):
+            line_speed = line_speed + np.clip(
+                self.line_samples - line_speed, -max_line_delta, max_line_delta)
+            angular_speed = angular_speed + np.clip(
+                self.angular_samples - angular_speed,
+                -max_angular_delta, max_angular_delta)
+            heading = heading + angular_speed * dt
+            x = x + line_speed * np.cos(heading) * dt
+            y = y + line_speed * np.sin(heading) * dt
+            wall_clear = np.minimum(wall_clear, np.minimum(
+                np.minimum(x, self.map_size - x),
+                np.minimum(y, self.map_size - y)) - radius[:, None])
+            # (robots, samples, others)
+            dist = np.sqrt(
+                (x[..., None] - others[None, None, :, step, 0]) ** 2 +
+                (y[..., None] - others[None, None, :, step, 1]) ** 2
+            ) - radius[:, None, None] - all_radius[None, None, :]
+            dist = np.where(other_mask[:, None, :], dist, np.inf)
+            robot_clear = np.minimum(robot_clear, dist.min(axis=-1))
+            mean_dist += np.sqrt(
+                (targets[:, 0:1] - x) ** 2 + (targets[:, 1:2] - y) ** 2) / num_steps
+
+        # NOTE: robots already close to each other may keep their distance,
+        #   only getting closer is penalized, and softly as robots block the way
+        start_clear = np.sqrt(
+            ((loc[:, None, :] - others[None, :, 0, :]) ** 2).sum(axis=-1)
+        ) - radius[:, None] - all_radius[None, :]
+        start_clear = np.where(other_mask, start_clear, np.inf).min(axis=-1)[:, None]
+
+        start_dist = np.linalg.norm(targets - loc, axis=-1)[:, None]
+        # NOTE: not facing the station is a penalty fading out on arrival,
+        #   a bonus would keep robots away from the station
+        end_dist = np.sqrt((targets[:, 0:1] - x) ** 2 + (targets[:, 1:2] - y) ** 2)
+        target_angle = np.arctan2(targets[:, 1:2] - y, targets[:, 0:1] - x)
+        score = (start_dist - mean_dist) + params["heading_weight"] * \
+            (np.cos(target_angle - heading) - 1) * np.minimum(end_dist, 1)
+        score -= params["robot_weight"] * np.maximum(
+            np.minimum(params["robot_clearance"], start_clear) - robot_clear, 0)
+        # NOTE: stations near walls are reached, only the wall itself is avoided
+        score -= params["wall_weight"] * \
+            np.maximum(np.minimum(params["wall_clearance"], start_dist) - wall_clear, 0)
+        # NOTE: robots push each other aside, only hitting a wall is a collision
+        score -= params["collision_penalty"] * (wall_clear < 0)
+        return score.argmax(axis=1)
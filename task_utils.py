@@ -3,6 +3,8 @@ import enum
 from collections import namedtuple
 from typing import Any, Dict, Optional
 
+import numpy as np
+
 TimeRange = namedtuple("TimeRange", ["min", "max"])
 
 
@@ -12,6 +14,13 @@ def decayFunc(x, max_x, min_ratio) -> float:
     return (1 - (1 - (1 - x / max_x) ** 2) ** 0.5) * (1 - min_ratio) + min_ratio
 
 
+def batchDecayFunc(x: np.ndarray, max_x, min_ratio) -> np.ndarray:
+    with np.errstate(invalid="ignore"):
+        ratio = (1 - np.sqrt(1 - (1 - x / max_x) ** 2)) * \
+            (1 - min_ratio) + min_ratio
+    return np.where(x >= max_x, min_ratio, ratio)
+
+
 @dataclasses.dataclass
 class MetaTask:
     # NOTE: actually only one task type is needed, that is BUY and SELL,
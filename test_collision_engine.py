@@ -0,0 +1,107 @@
+import math
+import random
+import unittest
+
+import numpy as np
+
+from collision_engine import CollisionEngine
+from subtask_to_action import SubtaskToAction
+from subtask_to_action_revised import SubtaskToAction as RevisedSubtaskToAction
+from task_utils import Subtask, SubtaskType
+from test_utils import makeObs, makeRobot
+
+
+class TestCollisionEngine(unittest.TestCase):
+    def setUp(self):
+        self.params = SubtaskToAction().params
+        self.parked = [makeRobot(40, 40, 0, 0), makeRobot(5, 45, 0, 0)]
+
+    def testCrossingTracks(self):
+        # robot 1 reaches the crossing point first, robot 0 slows down
+        engine = CollisionEngine(self.params)
+        engine.update(makeObs(
+            [makeRobot(10, 20, 6, 0), makeRobot(14, 17, 0, 6)] + self.parked))
+        self.assertEqual(engine.query(0), (None, 1.96875))
+        self.assertEqual(engine.query(1), (None, math.inf))
+
+    def testOppositeDirection(self):
+        robots = [makeRobot(10, 20, 6, 0.5), makeRobot(16, 20.8, -6, 0.3)]
+        engine = CollisionEngine(self.params)
+        engine.update(makeObs(robots + self.parked))
+        self.assertEqual(engine.query(0), (None, 4.6875))
+
+        # revised control mirrors the other robot's heading: both turn away
+        engine = CollisionEngine(
+            self.params, same_direction_threshold=0.52, revised=True)
+        engine.update(makeObs(robots + self.parked))
+        self.assertEqual(engine.query(0), (-math.pi, math.inf))
+        self.assertEqual(engine.query(1), (-math.pi, math.inf))
+
+    def testStoppedRobots(self):
+        engine = CollisionEngine(self.params)
+        engine.update(makeObs(
+            [makeRobot(10, 20, 6, 0), makeRobot(11, 20, 0, 0)] + self.parked))
+        for robot_id in range(4):
+            self.assertEqual(engine.query(robot_id), (None, math.inf))
+
+    def testFrameCache(self):
+        engine = CollisionEngine(self.params)
+        obs = makeObs(
+            [makeRobot(10, 20, 6, 0), makeRobot(14, 17, 0, 6)] + self.parked)
+        engine.update(obs)
+        robot_turn = engine.robot_turn
+        engine.update(obs)
+        self.assertIs(engine.robot_turn, robot_turn)
+        engine.update(makeObs(obs["robots"], frame_id=2))
+        self.assertIsNot(engine.robot_turn, robot_turn)
+
+    def testSafeSpeed(self):
+        # closed form must pick the same grid speed as the bisection
+        from bench_collision import makeEncounters
+        engine = CollisionEngine(self.params)
+        encounters = makeEncounters(2000, seed=0)
+        expected = engine.bisectSafeSpeed(*encounters)
+        self.assertTrue(np.array_equal(
+            engine.safeSpeed(*encounters), expected))
+        for i in range(0, 2000, 50):
+            self.assertEqual(
+                engine.safeSpeed(*[arg[i:i + 1] for arg in encounters])[0],
+                expected[i])
+
+    def testGetAction(self):
+        obs = makeObs(
+            [makeRobot(10, 20, 6, 0), makeRobot(14, 17, 0, 6)] + self.parked)
+        for subtask_to_action in [SubtaskToAction(), RevisedSubtaskToAction()]:
+            subtask = Subtask(SubtaskType.GOTO, None, robot_id=0, station_id=0)
+            subtask.update(obs)
+            actions = subtask_to_action.getAction(subtask, obs)
+            self.assertEqual(actions[0], "forward 0 1.96875")
+
+    def testGetActions(self):
+        # batch path must match the per-robot path, including avoidance state
+        rng = random.Random(0)
+        for control in [SubtaskToAction, RevisedSubtaskToAction]:
+            single, batch = control(), control()
+            for frame_id in range(500):
+                robots = [
+                    makeRobot(
+                        20 + rng.uniform(-3, 3), 20 + rng.uniform(-3, 3),
+                        rng.uniform(-6, 6), rng.uniform(-6, 6),
+                        item_type=rng.choice([0, 1])
+                    )
+                    for _ in range(4)
+                ]
+                obs = makeObs(robots, frame_id)
+                subtasks = []
+                for robot_id in range(4):
+                    subtask = Subtask(
+                        SubtaskType.GOTO, None, robot_id, station_id=0)
+                    subtask.update(obs)
+                    subtasks.append(subtask)
+                expected = sum(
+                    [single.getAction(subtask, obs) for subtask in subtasks], [])
+                self.assertEqual(batch.getActions(subtasks, obs), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
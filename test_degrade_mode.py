@@ -0,0 +1,113 @@
+import copy
+import random
+import unittest
+
+from item_centric.agent import ItemBasedAgent
+from item_centric.scheduler import GreedyScheduler
+from test_utils import recordObservations
+
+
+class TestDegradeMode(unittest.TestCase):
+    def testNoDeadline(self):
+        # a generous deadline never changes the schedule
+        agents = [
+            ItemBasedAgent(GreedyScheduler()),
+            ItemBasedAgent(GreedyScheduler(), deadline=60),
+        ]
+        for obs in recordObservations(100, seed=0):
+            actions = [agent.step(obs) for agent in agents]
+            self.assertEqual(actions[0], actions[1])
+        self.assertEqual(agents[1].num_degraded_frames, 0)
+
+    def testDegrade(self):
+        # no time left: idle robots take the nearest task and control still runs
+        agent = ItemBasedAgent(GreedyScheduler(), deadline=0)
+        rng = random.Random(0)
+        num_assigned, num_idle_frames = 0, 0
+        for obs in recordObservations(200, seed=0):
+            for tasks in agent.assigned_tasks:
+                if tasks and rng.random() < 0.2:
+                    tasks.pop(0)
+            agent.last_candidate_tasks = agent.task_manager.genTasks(
+                obs, agent.assigned_tasks)
+            idle_indices = [i for i in range(4) if not agent.assigned_tasks[i]]
+            num_idle_frames += bool(idle_indices)
+            actions = agent.step(obs)
+            self.assertEqual(actions[0], " ")
+            num_assigned += sum(bool(agent.assigned_tasks[i]) for i in idle_indices)
+
+            reserved_stat = agent.task_manager.currentTaskStat(agent.assigned_tasks)
+            for stat in reserved_stat.values():
+                self.assertEqual(len(stat["input"]), len(set(stat["input"])))
+        self.assertEqual(agent.num_degraded_frames, num_idle_frames)
+        self.assertGreater(num_assigned, 20)
+
+    def testPlanAhead(self):
+        # no time left: replanning and planning ahead are skipped too
+        agent = ItemBasedAgent(GreedyScheduler(), deadline=0, plan_ahead=True)
+        gen_tasks = agent.task_manager.genTasks
+        num_calls = 0
+
+        def countedGenTasks(*args):
+            nonlocal num_calls
+            num_calls += 1
+            return gen_tasks(*args)
+
+        agent.task_manager.genTasks = countedGenTasks
+        for obs in recordObservations(50, seed=0):
+            agent.step(obs)
+        self.assertEqual(num_calls, 0)
+
+    def makeStaleAgent(self):
+        # candidates of frame 1, the next obs is 100 frames later
+        agent = ItemBasedAgent(GreedyScheduler(), deadline=0)
+        obs = recordObservations(1, seed=0)[0]
+        agent.step(obs)
+        agent.assigned_tasks = [[] for _ in range(4)]
+        agent.last_candidate_tasks = agent.task_manager.genTasks(
+            obs, agent.assigned_tasks)
+        obs = copy.deepcopy(obs)
+        obs["frame_id"] += 100
+        return agent, obs
+
+    def testStaleSrc(self):
+        # candidates whose src output is gone are not taken
+        agent, obs = self.makeStaleAgent()
+        src_id = min(task.src_station_id
+                     for tasks in agent.last_candidate_tasks for task in tasks)
+        for i, station in enumerate(obs["stations"]):
+            station["output_status"] = int(i == src_id)
+            station["remain_time"] = -1
+        agent.step(obs)
+        assigned = [task for tasks in agent.assigned_tasks for task in tasks]
+        self.assertTrue(assigned)
+        for task in assigned:
+            self.assertEqual(task.src_station_id, src_id)
+            self.assertEqual(task.src_ready_time.max, 0)
+
+    def testStaleDst(self):
+        # candidates whose dst input slot was filled since are not taken
+        agent, obs = self.makeStaleAgent()
+        for station in obs["stations"]:
+            station["output_status"] = 1
+            station["remain_time"] = -1
+        # slots filled while the station still lacks other inputs
+        filled = set()
+        for tasks in agent.last_candidate_tasks:
+            for task in tasks:
+                dst_station = obs["stations"][task.dst_station_id]
+                if dst_station["station_type"] in [4, 5, 6, 7] \
+                        and not dst_station["input_status"]:
+                    dst_station["input_status"] = 1 << task.item_type
+                    filled.add((task.dst_station_id, task.item_type))
+        self.assertTrue(filled)
+        agent.step(obs)
+        assigned = [task for tasks in agent.assigned_tasks for task in tasks]
+        self.assertTrue(assigned)
+        for task in assigned:
+            self.assertNotIn((task.dst_station_id, task.item_type), filled)
+            self.assertEqual(task.dst_ready_time.max, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
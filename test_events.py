@@ -0,0 +1,64 @@
+import copy
+import unittest
+
+from events import EventDetector, EventType
+from headless_sim import randomMap
+from item_centric.agent import ItemBasedAgent
+from item_centric.scheduler import GreedyScheduler
+from test_utils import makeRobot, makeStation, playGame
+
+
+def makeObs():
+    stations = [makeStation(1, 10, 10), makeStation(4, 20, 10)]
+    stations[0]["remain_time"] = 1
+    stations[1]["input_status"] = (1 << 1) | (1 << 2)
+    stations[1]["remain_time"] = 1
+    robots = [makeRobot(10, 10) for _ in range(4)]
+    robots[0]["item_type"] = 2
+    robots[0]["station_id"] = 1
+    return {"frame_id": 1, "money": 200000, "stations": stations, "robots": robots}
+
+
+class TestEvents(unittest.TestCase):
+    def testDiff(self):
+        detector = EventDetector()
+        obs = makeObs()
+        events = detector.diff(obs, [False, True, False, False])
+        self.assertEqual(
+            [(event.event_type, event.robot_id) for event in events],
+            [(EventType.ROBOT_IDLE, 1)])
+        # nothing changed
+        obs = copy.deepcopy(obs)
+        obs["frame_id"] = 2
+        self.assertEqual(detector.diff(obs, [False, True, False, False]), [])
+
+        obs = copy.deepcopy(obs)
+        obs["frame_id"] = 3
+        obs["robots"][0]["item_type"] = 0
+        obs["robots"][3]["item_type"] = 1
+        obs["robots"][3]["station_id"] = 0
+        obs["stations"][0]["remain_time"] = 0
+        obs["stations"][0]["output_status"] = 1
+        obs["stations"][1]["input_status"] = 1 << 1
+        events = detector.diff(obs, [True, True, False, False])
+        self.assertEqual(
+            [(event.event_type, event.robot_id, event.station_id, event.item_type)
+             for event in events],
+            [(EventType.ROBOT_IDLE, 0, -1, 0),
+             (EventType.ITEM_SOLD, 0, 1, 2),
+             (EventType.ITEM_BOUGHT, 3, 0, 1),
+             (EventType.OUTPUT_READY, -1, 0, 0),
+             (EventType.PRODUCTION_DONE, -1, 0, 0),
+             (EventType.INPUT_FREED, -1, 1, 2)])
+
+    def testAgentGame(self):
+        agent = ItemBasedAgent(
+            GreedyScheduler(), plan_ahead=True, event_driven=True)
+        playGame(agent, randomMap(1))
+        # scheduling runs only on events and the periodic refresh
+        self.assertGreater(agent.num_skipped_frames, 1000)
+        self.assertTrue(agent.task_log)
+
+
+if __name__ == "__main__":
+    unittest.main()
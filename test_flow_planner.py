@@ -0,0 +1,57 @@
+import unittest
+
+import numpy as np
+
+from headless_sim import BatchSimulator, randomMap
+from item_centric.agent import ItemBasedAgent
+from item_centric.flow_planner import FlowPlanner, linearProgram
+from item_centric.scheduler import FlowScheduler
+from test_utils import playGame
+
+
+class TestFlowPlanner(unittest.TestCase):
+    def testLinearProgram(self):
+        # max 3x + 2y, x + y <= 4, x + 3y <= 6, x <= 3
+        x = linearProgram(
+            np.array([3.0, 2.0]),
+            np.array([[1.0, 1.0], [1.0, 3.0], [1.0, 0.0]]),
+            np.array([4.0, 6.0, 3.0]))
+        np.testing.assert_allclose(x, [3, 1], atol=1e-9)
+
+    def testSolve(self):
+        obs = BatchSimulator([randomMap(0)]).observations()[0]
+        planner = FlowPlanner()
+        target_rates = planner.solve(obs)
+        self.assertTrue(target_rates)
+        stations = obs["stations"]
+        task_manager = planner.task_manager
+        inflow, outflow, robot_frames = {}, {}, 0
+        for (item_type, i, j), rate in target_rates.items():
+            inflow[(j, item_type)] = inflow.get((j, item_type), 0) + rate
+            outflow[i] = outflow.get(i, 0) + rate
+            robot_frames += rate * task_manager.station_times[i, j] * 50 * 2
+        self.assertLessEqual(robot_frames, 4 + 1e-6)
+        for i, rate in outflow.items():
+            station_spec = task_manager.station_specs[stations[i]["station_type"]]
+            self.assertLessEqual(rate, 1 / station_spec["period"] + 1e-9)
+            # inputs arrive as fast as products leave
+            for item_type in station_spec["input"]:
+                self.assertAlmostEqual(inflow[(i, item_type)], rate)
+        # item 7 is planned
+        self.assertTrue(any(item_type == 7 for item_type, _, _ in target_rates))
+
+    def testAgentGame(self):
+        scheduler = FlowScheduler()
+        playGame(ItemBasedAgent(scheduler), randomMap(0))
+        flow_planner = scheduler.flow_planner
+        # most assigned tasks follow the planned edges
+        num_tasks = sum(flow_planner.counts.values())
+        num_planned = sum(
+            count for edge, count in flow_planner.counts.items()
+            if edge in flow_planner.target_rates)
+        self.assertGreater(num_tasks, 0)
+        self.assertGreaterEqual(num_planned, 0.75 * num_tasks)
+
+
+if __name__ == "__main__":
+    unittest.main()
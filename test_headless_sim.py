@@ -0,0 +1,132 @@
+import unittest
+
+import numpy as np
+
+from headless_sim import (BUY_PRICES, INIT_MONEY, SELL_PRICES, BatchSimulator,
+                          VecEnv, parseMap, randomMap)
+from item_centric.agent import ItemBasedAgent
+from item_centric.scheduler import GreedyScheduler
+from task_utils import decayFunc
+from test_utils import playGame
+
+
+def smallMap():
+    env_map = ["." * 100 for _ in range(100)]
+    env_map[0] = "1" + "." * 98 + "4"
+    env_map[50] = "." * 40 + "A.A.A.A" + "." * 53
+    env_map[99] = "9" + "." * 99
+    return env_map
+
+
+class TestHeadlessSim(unittest.TestCase):
+    def testParseMap(self):
+        station_types, station_locs, robot_locs = parseMap(smallMap())
+        self.assertEqual(station_types, [1, 4, 9])
+        np.testing.assert_allclose(
+            station_locs, [[0.25, 49.75], [49.75, 49.75], [0.25, 0.25]])
+        np.testing.assert_allclose(robot_locs[:, 1], 24.75)
+
+    def testProduction(self):
+        simulator = BatchSimulator([smallMap()])
+        for _ in range(52):
+            simulator.step([[]])
+        obs = simulator.observations()[0]
+        self.assertEqual(obs["stations"][0]["output_status"], 1)
+        # the next product is blocked by the full output
+        self.assertGreater(obs["stations"][0]["remain_time"], 0)
+        self.assertEqual(obs["stations"][1]["remain_time"], -1)
+
+    def testTrade(self):
+        simulator = BatchSimulator([smallMap()])
+        for _ in range(52):
+            simulator.step([[]])
+        simulator.robot_loc[0, 0] = simulator.station_loc[0, 0]
+        simulator.step([[]])
+        simulator.step([["buy 0"]])
+        self.assertEqual(simulator.item_type[0, 0], 1)
+        self.assertEqual(simulator.money[0], INIT_MONEY - BUY_PRICES[1])
+        # station 4 takes item 1 once
+        simulator.robot_loc[0, 0] = simulator.station_loc[0, 1]
+        simulator.step([[]])
+        simulator.step([["sell 0"]])
+        self.assertEqual(simulator.item_type[0, 0], 0)
+        self.assertEqual(simulator.input_status[0, 1], 1 << 1)
+        # held for 2 frames, no collision
+        self.assertEqual(
+            simulator.money[0],
+            INIT_MONEY - BUY_PRICES[1] + int(SELL_PRICES[1] * decayFunc(2, 9000, 0.8)))
+
+    def testCollision(self):
+        simulator = BatchSimulator([smallMap()])
+        # robots 0 and 1 drive into each other
+        actions = ["forward 0 6", "forward 1 -2"]
+        for _ in range(50):
+            simulator.step([actions])
+            dist = np.linalg.norm(
+                simulator.robot_loc[0, 0] - simulator.robot_loc[0, 1])
+            self.assertGreater(dist, 0.9 - 1e-6)
+        self.assertGreater(simulator.impulse[0, 0], 0)
+        self.assertTrue((simulator.robot_loc >= 0.45 - 1e-9).all())
+
+    def testBatchMatchesSingle(self):
+        maps = [randomMap(0), randomMap(1)]
+        batch = BatchSimulator(maps)
+        single = BatchSimulator(maps[1:])
+        actions = ["forward 0 3", "rotate 0 1.5", "forward 2 -1"]
+        for _ in range(100):
+            batch.step([[], actions])
+            single.step([actions])
+        np.testing.assert_allclose(batch.robot_loc[1], single.robot_loc[0])
+        self.assertEqual(batch.observations()[1], single.observations()[0])
+
+    def testAgentGame(self):
+        frame_ids = []
+        env = playGame(
+            ItemBasedAgent(GreedyScheduler()), randomMap(0),
+            callback=lambda obs: frame_ids.append(obs["frame_id"]))
+        self.assertEqual(frame_ids, list(range(1, 1501)))
+        self.assertGreater(env.score, INIT_MONEY)
+
+
+class TestVecEnv(unittest.TestCase):
+    def testLockstep(self):
+        env_maps = [randomMap(seed) for seed in range(3)]
+        env = VecEnv(env_maps, max_frames=300)
+        agents = [ItemBasedAgent(GreedyScheduler()) for _ in env_maps]
+        env.reset()
+        while True:
+            observations, done = env.recv()
+            if done:
+                break
+            env.send([agent.step(obs) for agent, obs in zip(agents, observations)])
+
+        # every game matches the same game played alone
+        for env_map, score in zip(env_maps, env.scores()):
+            single_env = playGame(
+                ItemBasedAgent(GreedyScheduler()), env_map, max_frames=300)
+            self.assertEqual(single_env.score, score)
+
+    def testStackedObs(self):
+        env_maps = [randomMap(0), randomMap(1, {1: 1, 2: 1, 9: 1})]
+        env = VecEnv(env_maps, compact_obs=True)
+        env.reset()
+        env.send([["forward 0 2"], ["rotate 1 1"]])
+        stacked_obs = env.stackedObs()
+        self.assertEqual(stacked_obs["station_array"].shape, (2, 18))
+        self.assertEqual(stacked_obs["robot_array"].shape, (2, 4))
+        self.assertEqual(stacked_obs["num_stations"].tolist(), [18, 3])
+        # padded stations are empty
+        self.assertTrue((stacked_obs["station_array"]["station_type"][1, 3:] == 0).all())
+
+        compact_observations, _ = env.recv()
+        for obs, compact_obs in zip(env.simulator.observations(), compact_observations):
+            self.assertEqual(len(compact_obs["stations"]), len(obs["stations"]))
+            for key in ["frame_id", "money", "stations", "robots"]:
+                self.assertEqual(
+                    [dict(record) for record in compact_obs[key]]
+                    if isinstance(obs[key], list) else compact_obs[key],
+                    obs[key])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+import io
+import pickle
+import random
+import unittest
+from unittest import mock
+
+from action_buffer import ActionBuffer
+from compact_obs import CompactObs
+from item_centric.scheduler import GreedyScheduler
+from item_centric.task_manager import ItemTaskManager
+from judge_env import JudgeEnv
+from profiler import StageProfiler
+from subtask_to_action import SubtaskToAction
+from task_utils import Subtask, SubtaskType
+from test_utils import makeObs, makeRobot, recordObservations
+
+
+def formatObs(obs):
+    # judge protocol text of one frame, without the trailing OK
+    lines = [f"{obs['frame_id']} {obs['money']}", f"{len(obs['stations'])}"]
+    for station in obs["stations"]:
+        lines.append(" ".join(str(value) for value in station.values()))
+    for robot in obs["robots"]:
+        lines.append(" ".join(str(value) for value in robot.values()))
+    return lines
+
+
+class ChunkReader(io.BytesIO):
+    # pipe that hands out a few bytes per read
+    def read1(self, size=-1):
+        return super().read1(7)
+
+
+class TestJudgeEnv(unittest.TestCase):
+    def testRecv(self):
+        trace = recordObservations(20, seed=0)
+        env_map = ["." * 100 for _ in range(100)]
+        env_map[3] = "..1..A..9" + "." * 91
+        text = "\n".join(env_map + ["OK"]) + "\n"
+        for obs in trace:
+            text += "\r\n".join(formatObs(obs) + ["OK"]) + "\r\n"
+        for stdin_type in [io.BytesIO, ChunkReader]:
+            for compact_obs in [False, True]:
+                env = JudgeEnv(
+                    compact_obs, stdin_type(text.encode()), profiler=StageProfiler())
+                env.reset()
+                self.assertEqual(env.env_map, env_map)
+                for expected in trace:
+                    obs, done = env.recv()
+                    self.assertFalse(done)
+                    self.assertEqual(obs, expected)
+                    self.assertEqual(env.frame_id, expected["frame_id"])
+                self.assertEqual(env.recv(), (None, True))
+                self.assertEqual(env.parseStatistics()["count"], len(trace))
+        # nothing is timed without a profiler
+        env = JudgeEnv(stdin=io.BytesIO(text.encode()))
+        env.reset()
+        while not env.recv()[1]:
+            pass
+        self.assertEqual(env.parseStatistics(), {})
+
+    def testSend(self):
+        env = JudgeEnv(stdin=io.BytesIO())
+        env.frame_id = 12
+        action_buffer = ActionBuffer()
+        action_buffer.append(" ")
+        action_buffer.setCommand(2, SubtaskType.SELL)
+        action_buffer.setCommand(0, SubtaskType.GOTO, 6, -0.5)
+        for actions in [action_buffer, [" ", "forward 0 6.0", "rotate 0 -0.5", "sell 2"]]:
+            with mock.patch("sys.stdout", new_callable=io.StringIO) as stdout:
+                env.send(actions)
+            self.assertEqual(
+                stdout.getvalue(),
+                "12\n \nforward 0 6.0\nrotate 0 -0.5\nsell 2\nOK\n")
+
+    def testActionBuffer(self):
+        # numeric commands format to the same actions as getActions
+        rng = random.Random(0)
+        control, buffered_control = SubtaskToAction(), SubtaskToAction()
+        action_buffer = ActionBuffer()
+        for frame_id in range(200):
+            obs = makeObs([
+                makeRobot(20 + rng.uniform(-3, 3), 20 + rng.uniform(-3, 3),
+                          rng.uniform(-6, 6), rng.uniform(-6, 6))
+                for _ in range(4)
+            ], frame_id)
+            subtasks = []
+            for robot_id in range(4):
+                subtask_type = rng.choice(list(SubtaskType))
+                subtask = None if subtask_type == SubtaskType.GOTO and robot_id == 3 \
+                    else Subtask(subtask_type, None, robot_id, station_id=0)
+                if subtask is not None:
+                    subtask.update(obs)
+                subtasks.append(subtask)
+            expected = control.getActions(subtasks, obs)
+            action_buffer.clear()
+            self.assertIs(
+                buffered_control.getActions(subtasks, obs, action_buffer),
+                action_buffer)
+            self.assertEqual(len(action_buffer), len(expected))
+            for line, expected_line in zip(action_buffer, expected):
+                tokens, expected_tokens = line.split(), expected_line.split()
+                self.assertEqual(tokens[:2], expected_tokens[:2])
+                if len(tokens) > 2:
+                    self.assertEqual(float(tokens[2]), float(expected_tokens[2]))
+
+
+class TestCompactObs(unittest.TestCase):
+    def testParse(self):
+        for obs in recordObservations(50, seed=0):
+            obs["robots"][1]["item_type"] = 3
+            obs["robots"][1]["station_id"] = 7
+            expected = JudgeEnv._parseObs(formatObs(obs))
+            compact_obs = JudgeEnv._parseCompactObs(formatObs(obs))
+            self.assertIsInstance(compact_obs, CompactObs)
+            self.assertEqual(compact_obs, expected)
+            self.assertEqual(dict(compact_obs), expected)
+            for record, station in zip(compact_obs["stations"], expected["stations"]):
+                for key, value in station.items():
+                    self.assertIs(type(record[key]), type(value))
+            self.assertEqual(
+                compact_obs.robot_array["item_type"].tolist(), [0, 3, 0, 0])
+            self.assertEqual(
+                pickle.loads(pickle.dumps(compact_obs["robots"][1])),
+                expected["robots"][1])
+
+    def testConsumers(self):
+        # schedulers see the same values through the dict view
+        task_manager, compact_task_manager = ItemTaskManager(), ItemTaskManager()
+        scheduler = GreedyScheduler()
+        for obs in recordObservations(50, seed=1):
+            compact_obs = JudgeEnv._parseCompactObs(formatObs(obs))
+            obs = JudgeEnv._parseObs(formatObs(obs))
+            assigned_tasks = [[] for _ in range(4)]
+            compact_assigned_tasks = [[] for _ in range(4)]
+            candidate_tasks = task_manager.genTasks(obs, assigned_tasks)
+            compact_tasks = compact_task_manager.genTasks(
+                compact_obs, compact_assigned_tasks)
+            self.assertEqual(compact_tasks, candidate_tasks)
+            self.assertEqual(
+                scheduler.assign(compact_obs, compact_tasks, compact_assigned_tasks),
+                scheduler.assign(obs, candidate_tasks, assigned_tasks))
+            self.assertEqual(compact_assigned_tasks, assigned_tasks)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import time
+import unittest
+
+from headless_sim import BatchSimulator, randomMap
+from item_centric.agent import ItemBasedAgent
+from item_centric.planner_process import ObsRing
+from item_centric.scheduler import GreedyScheduler
+from task_utils import MetaTask, TimeRange
+from test_utils import playGame
+
+
+class TestPlannerProcess(unittest.TestCase):
+    def testObsRing(self):
+        simulator = BatchSimulator([randomMap(0)])
+        ring = ObsRing(num_slots=2)
+        reader = ObsRing(num_slots=2, name=ring.name)
+        try:
+            self.assertIsNone(reader.readLatest(-1))
+            task = MetaTask(4, 3, 7, TimeRange(0, 0), TimeRange(0, 0), 1.0)
+            task.owned_item = True
+            for _ in range(3):
+                simulator.step([["forward 0 2"]])
+                obs = simulator.observations()[0]
+                seq = ring.write(obs, [[], [task], [], []])
+            # the latest of three frames in two slots
+            latest_seq, latest_obs, tasks = reader.readLatest(-1)
+            self.assertEqual(latest_seq, seq)
+            self.assertEqual(latest_obs["frame_id"], obs["frame_id"])
+            for key in ["stations", "robots"]:
+                self.assertEqual(
+                    [dict(record) for record in latest_obs[key]], obs[key])
+            self.assertEqual(tasks[1, 0].tolist(), [4, 3, 7, 1])
+            self.assertEqual(tasks[0, 0, 0], 0)
+            self.assertIsNone(reader.readLatest(latest_seq))
+        finally:
+            reader.close()
+            ring.close()
+
+    def testAgentGame(self):
+        agent = ItemBasedAgent(GreedyScheduler(), background_planner=True)
+        try:
+            # NOTE: leave the worker some time on a single core
+            playGame(agent, randomMap(0), callback=lambda obs: time.sleep(0.0005))
+        finally:
+            agent.close()
+        planner_process = agent.planner_process
+        self.assertTrue(planner_process.plan_latencies)
+        self.assertGreaterEqual(min(planner_process.plan_latencies), 0)
+        self.assertTrue(agent.task_log)
+        self.assertFalse(planner_process.process.is_alive())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,51 @@
+import io
+import unittest
+
+import numpy as np
+
+from item_centric.agent import ItemBasedAgent
+from item_centric.scheduler import GreedyScheduler
+from profiler import StageProfiler
+from test_utils import recordObservations
+
+
+class TestStageProfiler(unittest.TestCase):
+    def testRingBuffer(self):
+        profiler = StageProfiler(capacity=100, budget=0.5)
+        for i in range(250):
+            profiler.record("frame", i / 100)
+        stats = profiler.stats("frame")
+        self.assertEqual(stats["count"], 250)
+        # only the last 100 samples are kept
+        self.assertAlmostEqual(stats["max"], 2490)
+        self.assertAlmostEqual(stats["p50"], np.percentile(np.arange(150, 250), 50) * 10)
+        self.assertEqual(profiler.num_over_budget, 199)
+        self.assertEqual(profiler.stats("parse"), {})
+
+    def testDisabled(self):
+        profiler = StageProfiler(enabled=False)
+        with profiler.stage("parse"):
+            pass
+        profiler.record("frame", 1)
+        self.assertEqual(profiler.report(), {})
+        output = io.StringIO()
+        profiler.showReport(output)
+        self.assertEqual(output.getvalue(), "")
+
+    def testAgentStages(self):
+        profiler = StageProfiler()
+        agent = ItemBasedAgent(GreedyScheduler(), profiler=profiler)
+        for obs in recordObservations(30, seed=0):
+            agent.step(obs)
+        report = profiler.report()
+        for name in ["step", "status", "genTasks", "assign", "makeSubtask", "getAction"]:
+            self.assertIn(name, report)
+        self.assertEqual(report["step"]["count"], 30)
+        self.assertLessEqual(report["getAction"]["max"], report["step"]["max"])
+        output = io.StringIO()
+        profiler.showReport(output)
+        self.assertIn("p99", output.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+
+from headless_sim import randomMap
+from item_centric.agent import ItemBasedAgent
+from item_centric.route_planner import RoutePlanner
+from item_centric.scheduler import GreedyScheduler
+from item_centric.task_manager import ItemTaskManager
+from test_utils import makeRobot, makeStation, playGame
+
+
+def makeChainObs():
+    # robot 0 brings item 1 to station 4, which finishes a product soon
+    stations = [
+        makeStation(1, 10, 10), makeStation(4, 20, 10), makeStation(7, 30, 10)]
+    stations[0]["output_status"] = 1
+    stations[1]["remain_time"] = 30
+    return {
+        "frame_id": 1,
+        "money": 200000,
+        "stations": stations,
+        "robots": [makeRobot(10, 10)] + [makeRobot(40, 40)] * 3,
+    }
+
+
+class TestRoutePlanner(unittest.TestCase):
+    def setUp(self):
+        self.task_manager = ItemTaskManager()
+        self.planner = RoutePlanner(GreedyScheduler(), self.task_manager)
+        self.assigned_tasks = [[] for _ in range(4)]
+        obs = makeChainObs()
+        current_task = [
+            task for task in self.task_manager.genTasks(obs, self.assigned_tasks)[0]
+            if task.dst_station_id == 1][0]
+        current_task.robot_id = 0
+        self.assigned_tasks[0].append(current_task)
+
+    def testPlan(self):
+        obs = makeChainObs()
+        candidate_tasks = self.task_manager.genTasks(obs, self.assigned_tasks)
+        self.assertEqual(
+            self.planner.plan(obs, candidate_tasks, self.assigned_tasks), 1)
+        current_task, next_task = self.assigned_tasks[0]
+        self.assertEqual(next_task.src_station_id, current_task.dst_station_id)
+        self.assertEqual((next_task.item_type, next_task.dst_station_id), (4, 2))
+        self.assertEqual(next_task.robot_id, 0)
+        self.assertEqual(self.task_manager.reservations.output_counts[1][4], 1)
+        # the queue is full
+        self.assertEqual(self.planner.plan(
+            obs, self.task_manager.genTasks(obs, self.assigned_tasks),
+            self.assigned_tasks), 0)
+
+    def testReplan(self):
+        obs = makeChainObs()
+        self.planner.plan(
+            obs, self.task_manager.genTasks(obs, self.assigned_tasks),
+            self.assigned_tasks)
+        self.assertEqual(self.planner.replan(obs, self.assigned_tasks), 0)
+        # station 7 got item 4 from elsewhere, the planned task is dropped
+        obs["frame_id"] = 2
+        obs["stations"][2]["input_status"] = 1 << 4
+        self.task_manager.genTasks(obs, self.assigned_tasks)
+        self.assertEqual(self.planner.replan(obs, self.assigned_tasks), 1)
+        self.assertEqual(len(self.assigned_tasks[0]), 1)
+        self.assertEqual(self.task_manager.reservations.output_counts[1][4], 0)
+
+    def testAgentGame(self):
+        agent = ItemBasedAgent(GreedyScheduler(), plan_ahead=True)
+        num_chained_frames = 0
+
+        def check(obs):
+            nonlocal num_chained_frames
+            # a robot never holds an item its current task does not want
+            for robot, tasks in zip(obs["robots"], agent.assigned_tasks):
+                if robot["item_type"] and tasks:
+                    self.assertEqual(tasks[0].item_type, robot["item_type"])
+            num_chained_frames += any(len(tasks) > 1 for tasks in agent.assigned_tasks)
+
+        playGame(agent, randomMap(1), callback=check)
+        self.assertGreater(num_chained_frames, 0)
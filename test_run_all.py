@@ -0,0 +1,84 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from run_all import aggregate, runJob
+
+FAKE_MAIN = """
+import argparse
+parser = argparse.ArgumentParser()
+parser.add_argument("--map-id")
+parser.add_argument("--seed", type=int)
+parser.add_argument("--pipe-name")
+parser.add_argument("--no-statistics", action="store_true")
+parser.add_argument("--bonus", default=0, type=int)
+args = parser.parse_args()
+map_id = int(args.map_id[len("maps/"):-len(".txt")])
+if map_id == 3:
+    raise RuntimeError("simulator crashed")
+score = 1000 * map_id + args.seed + args.bonus
+print('{"status":"Successful","score":%d}' % score)
+"""
+
+
+class TestRunAll(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.main = os.path.join(self.tmp_dir.name, "main.py")
+        with open(self.main, "w") as f:
+            f.write(FAKE_MAIN)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def testRunJob(self):
+        job = {"param_set": "bonus", "args": "--bonus 5", "map_id": 2,
+               "seed": 1, "main": self.main, "timeout": 60}
+        result = runJob(job)
+        self.assertEqual(result["score"], 2006)
+        self.assertEqual(result["error"], "")
+        result = runJob(dict(job, map_id=3))
+        self.assertIsNone(result["score"])
+        self.assertIn("simulator crashed", result["error"])
+
+    def testAggregate(self):
+        results = [
+            {"param_set": "a", "map_id": 1, "seed": seed,
+             "score": score, "runtime": 1.0, "error": ""}
+            for seed, score in enumerate([10, 20, None])
+        ]
+        summary = aggregate(results)
+        self.assertEqual(len(summary), 1)
+        self.assertEqual(summary[0]["mean"], 15)
+        self.assertEqual(summary[0]["min"], 10)
+        self.assertEqual(summary[0]["std"], 5)
+        self.assertEqual(summary[0]["failures"], 1)
+
+    def testCommandLine(self):
+        json_path = os.path.join(self.tmp_dir.name, "results.json")
+        csv_path = os.path.join(self.tmp_dir.name, "results.csv")
+        process = subprocess.run([
+            sys.executable, "run_all.py", "--main", self.main,
+            "--maps", "1", "2", "3", "--seeds", "0", "1",
+            "--param-set", "base=", "--param-set", "bonus=--bonus 7",
+            "--workers", "4", "--json", json_path, "--csv", csv_path,
+        ], capture_output=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+        self.assertEqual(process.returncode, 1)
+        with open(json_path) as f:
+            output = json.load(f)
+        self.assertEqual(len(output["results"]), 12)
+        with open(csv_path) as f:
+            self.assertEqual(len(list(csv.DictReader(f))), 12)
+        means = {(stat["param_set"], stat["map_id"]): stat["mean"]
+                 for stat in output["summary"]}
+        self.assertEqual(means[("base", 1)], 1000.5)
+        self.assertEqual(means[("bonus", 2)], 2007.5)
+        self.assertIn("bonus total score", process.stdout.decode())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import itertools
+import random
+import unittest
+
+import numpy as np
+
+from item_centric.scheduler import (BeamScheduler, GreedyScheduler, OptimalScheduler,
+                                   linearAssignment)
+from item_centric.task_manager import ItemTaskManager
+from test_utils import recordObservations
+
+
+def scalarAssign(scheduler, obs, station_tasks, assigned_tasks):
+    # per (robot, task) loop of the original GreedyScheduler.assign
+    idle_indices = [i for i in range(4) if not assigned_tasks[i]]
+    max_efficiency = 0
+    selected = None
+    for robot_id in idle_indices:
+        robot_loc = np.array([
+            obs["robots"][robot_id]["loc_x"],
+            obs["robots"][robot_id]["loc_y"]
+        ])
+        for task in sum(station_tasks, []):
+            src_loc = np.array([
+                obs["stations"][task.src_station_id]["loc_x"],
+                obs["stations"][task.src_station_id]["loc_y"]
+            ])
+            efficiency = scheduler.taskEfficiency(
+                task, ItemTaskManager.moveTimeEst(robot_loc, src_loc), obs)
+            if efficiency is not None and efficiency > max_efficiency:
+                max_efficiency = efficiency
+                selected = (robot_id, task)
+    return selected
+
+
+def checkAssignAll(test, scheduler):
+    # all idle robots in one call, without breaking task reservations
+    task_manager = ItemTaskManager()
+    assigned_tasks = [[] for _ in range(4)]
+    rng = random.Random(0)
+    num_assigned = 0
+    for obs in recordObservations(500, seed=0):
+        for tasks in assigned_tasks:
+            if tasks and rng.random() < 0.1:
+                tasks.pop(0)
+        candidate_tasks = task_manager.genTasks(obs, assigned_tasks)
+        idle_indices = [i for i in range(4) if not assigned_tasks[i]]
+        result = scheduler.assignAll(
+            obs, candidate_tasks, assigned_tasks, task_manager)
+        test.assertLessEqual(result, len(idle_indices))
+        num_assigned += result
+
+        reserved_stat = task_manager.currentTaskStat(assigned_tasks)
+        for stat in reserved_stat.values():
+            for item_type in set(stat["output"]):
+                test.assertLessEqual(
+                    stat["output"].count(item_type),
+                    2 if item_type in [1, 2, 3] else 1)
+            test.assertEqual(len(stat["input"]), len(set(stat["input"])))
+        for robot_id, tasks in enumerate(assigned_tasks):
+            for task in tasks:
+                test.assertEqual(task.robot_id, robot_id)
+    return num_assigned
+
+
+class TestGreedyScheduler(unittest.TestCase):
+    def testAssign(self):
+        # vectorized scoring must select the same (robot, task) pair
+        rng = np.random.default_rng(0)
+        for seed in range(3):
+            scheduler = GreedyScheduler({
+                "item_delta": rng.uniform(50, 1000, 7),
+                "station_type_delta": rng.uniform(-60, 40, 9),
+                "station_input_delta": rng.uniform(-50, 90, 8),
+            })
+            task_manager = ItemTaskManager()
+            assigned_tasks = [[] for _ in range(4)]
+            pop_rng = random.Random(seed)
+            num_assigned = 0
+            for obs in recordObservations(500, seed):
+                for tasks in assigned_tasks:
+                    if tasks and pop_rng.random() < 0.1:
+                        tasks.pop(0)
+                candidate_tasks = task_manager.genTasks(obs, assigned_tasks)
+                expected = scalarAssign(
+                    scheduler, obs, candidate_tasks, assigned_tasks)
+                result = scheduler.assign(
+                    obs, candidate_tasks, assigned_tasks,
+                    task_manager.robotStationTimes(obs))
+                self.assertEqual(result, expected is not None)
+                if result:
+                    robot_id, task = expected
+                    self.assertIs(assigned_tasks[robot_id][-1], task)
+                    self.assertEqual(task.robot_id, robot_id)
+                    num_assigned += 1
+            self.assertGreater(num_assigned, 50)
+
+    def testNoTaskInTime(self):
+        obs = recordObservations(1, seed=0)[0]
+        obs["frame_id"] = 8999
+        obs["stations"][0]["output_status"] = 1
+        task_manager = ItemTaskManager()
+        assigned_tasks = [[] for _ in range(4)]
+        candidate_tasks = task_manager.genTasks(obs, assigned_tasks)
+        self.assertTrue(sum(candidate_tasks, []))
+        self.assertFalse(GreedyScheduler().assign(
+            obs, candidate_tasks, assigned_tasks))
+
+
+class TestOptimalScheduler(unittest.TestCase):
+    def testLinearAssignment(self):
+        rng = np.random.default_rng(0)
+        for shape in [(1, 1), (3, 3), (4, 9), (6, 2)]:
+            for _ in range(20):
+                cost = rng.integers(-20, 20, shape).astype(np.float64)
+                pairs = linearAssignment(cost)
+                self.assertEqual(len(pairs), min(shape))
+                self.assertEqual(len(set(i for i, _ in pairs)), min(shape))
+                self.assertEqual(len(set(j for _, j in pairs)), min(shape))
+                best = min(
+                    sum(cost[i, j] for i, j in zip(rows, cols))
+                    for rows in itertools.permutations(range(shape[0]), min(shape))
+                    for cols in itertools.permutations(range(shape[1]), min(shape))
+                    if rows == tuple(sorted(rows))
+                )
+                self.assertEqual(sum(cost[i, j] for i, j in pairs), best)
+
+    def testAssignAll(self):
+        self.assertGreater(checkAssignAll(self, OptimalScheduler()), 100)
+
+
+class TestBeamScheduler(unittest.TestCase):
+    def testAssignAll(self):
+        scheduler = BeamScheduler(time_budget=1)
+        self.assertGreater(checkAssignAll(self, scheduler), 100)
+        self.assertGreater(scheduler.last_depth, 1)
+
+    def testTimeBudget(self):
+        # the first level is always searched
+        obs = recordObservations(1, seed=0)[0]
+        obs["stations"][0]["output_status"] = 1
+        scheduler = BeamScheduler(time_budget=0)
+        task_manager = ItemTaskManager()
+        assigned_tasks = [[] for _ in range(4)]
+        candidate_tasks = task_manager.genTasks(obs, assigned_tasks)
+        self.assertEqual(scheduler.assignAll(
+            obs, candidate_tasks, assigned_tasks, task_manager), 1)
+        self.assertEqual(scheduler.last_depth, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
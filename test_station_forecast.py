@@ -0,0 +1,57 @@
+import unittest
+
+from station_forecast import StationForecaster
+from test_utils import makeStation
+
+
+def makeObs(frame_id, stations):
+    return {"frame_id": frame_id, "stations": stations}
+
+
+class TestStationForecast(unittest.TestCase):
+    def setUp(self):
+        self.forecaster = StationForecaster(horizon=200)
+        self.stations = [makeStation(1, 10, 10), makeStation(4, 20, 10)]
+        self.stations[0]["remain_time"] = 30
+        # station 4 with both inputs is producing
+        self.stations[1]["remain_time"] = 100
+        self.stations[1]["input_status"] = (1 << 1) | (1 << 2)
+        self.forecaster.update(makeObs(10, self.stations))
+
+    def testOutputFrames(self):
+        self.assertEqual(self.forecaster.output_frames[0], [40, 90, 140, 190])
+        self.assertEqual(self.forecaster.outputReadyFrame(0), 40)
+        self.assertEqual(self.forecaster.numOutputsBy(0, 100), 2)
+        self.assertEqual(self.forecaster.nextOutputFrame(0, 91), 140)
+        self.assertIsNone(self.forecaster.nextOutputFrame(0, 500))
+        # the next product of station 4 waits for new inputs
+        self.assertEqual(self.forecaster.output_frames[1], [110])
+        self.assertTrue(self.forecaster.isOutputReadyBy(1, 110))
+        self.assertFalse(self.forecaster.isOutputReadyBy(1, 109))
+
+    def testInputFrames(self):
+        # full inputs are free when the next production starts
+        self.assertEqual(self.forecaster.inputFreeFrame(1, 1), 110)
+        self.stations[1]["input_status"] = 1 << 1
+        self.forecaster.update(makeObs(11, self.stations))
+        self.assertIsNone(self.forecaster.inputFreeFrame(1, 1))
+        self.assertTrue(self.forecaster.isInputFreeBy(1, 2, 11))
+        self.assertFalse(self.forecaster.isInputFreeBy(1, 1, 1000))
+
+    def testIncrementalUpdate(self):
+        num_updates = self.forecaster.num_updates
+        for frame_id in range(11, 20):
+            for station in self.stations:
+                station["remain_time"] -= 1
+            self.forecaster.update(makeObs(frame_id, self.stations))
+        # both stations ticked as predicted
+        self.assertEqual(self.forecaster.num_updates, num_updates)
+        for station in self.stations:
+            station["remain_time"] -= 1
+        self.stations[0]["output_status"] = 1
+        self.forecaster.update(makeObs(20, self.stations))
+        self.assertEqual(self.forecaster.num_updates, num_updates + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
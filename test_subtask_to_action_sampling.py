@@ -0,0 +1,67 @@
+import unittest
+
+from action_buffer import ActionBuffer
+from headless_sim import BatchSimulator, randomMap
+from item_centric.agent import ItemBasedAgent
+from item_centric.scheduler import GreedyScheduler
+from subtask_to_action_sampling import SubtaskToAction
+from task_utils import Subtask, SubtaskType
+from test_utils import playGame
+
+
+class TestSamplingControl(unittest.TestCase):
+    def testReachStation(self):
+        simulator = BatchSimulator([randomMap(0)])
+        controller = SubtaskToAction()
+        # NOTE: other robots are idle and in the way
+        for station_id in [3, 6]:
+            simulator.reset()
+            for _ in range(400):
+                obs = simulator.observations()[0]
+                if obs["robots"][0]["station_id"] == station_id:
+                    break
+                subtask = Subtask(SubtaskType.GOTO, None, 0, station_id)
+                subtask.update(obs)
+                simulator.step([controller.getActions([subtask, None, None, None], obs)])
+            self.assertEqual(obs["robots"][0]["station_id"], station_id)
+
+    def testTradeActions(self):
+        simulator = BatchSimulator([randomMap(0)])
+        obs = simulator.observations()[0]
+        controller = SubtaskToAction()
+        subtasks = [
+            Subtask(SubtaskType.BUY, None, 0, 0),
+            None,
+            Subtask(SubtaskType.SELL, None, 2, 1),
+            Subtask(SubtaskType.GOTO, None, 3, 2),
+        ]
+        for subtask in subtasks:
+            if subtask is not None:
+                subtask.update(obs)
+        actions = controller.getActions(subtasks, obs)
+        self.assertEqual(actions[:2], ["buy 0", "sell 2"])
+        self.assertTrue(actions[2].startswith("forward 3"))
+        self.assertTrue(actions[3].startswith("rotate 3"))
+        self.assertEqual(controller.getAction(subtasks[0], obs), ["buy 0"])
+        action_buffer = controller.getActions(subtasks, obs, ActionBuffer())
+        self.assertEqual(action_buffer.buy.tolist(), [True, False, False, False])
+        self.assertEqual(action_buffer.sell.tolist(), [False, False, True, False])
+
+    def testAgentGame(self):
+        agent = ItemBasedAgent(GreedyScheduler(), use_sampling_control=True)
+        self.assertIsInstance(agent.subtask_to_action, SubtaskToAction)
+        wall_clearance = agent.subtask_to_action.params["wall_clearance"]
+
+        def check(obs):
+            # robots keep off the walls
+            for robot in obs["robots"]:
+                radius = 0.45 if robot["item_type"] == 0 else 0.53
+                for loc in [robot["loc_x"], robot["loc_y"]]:
+                    self.assertGreaterEqual(min(loc, 50 - loc) - radius, wall_clearance)
+
+        playGame(agent, randomMap(0), callback=check)
+        self.assertTrue(agent.task_log)
+
+
+if __name__ == "__main__":
+    unittest.main()
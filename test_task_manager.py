@@ -0,0 +1,135 @@
+import random
+import unittest
+
+import numpy as np
+
+from item_centric.scheduler import GreedyScheduler
+from item_centric.task_manager import ItemTaskManager
+from task_utils import MetaTask
+from test_utils import makeRobot, makeStation, recordObservations
+
+
+class TestItemTaskManager(unittest.TestCase):
+    def testIncrementalGenTasks(self):
+        # incremental index must generate exactly the tasks of a full rebuild
+        rng = random.Random(0)
+        incremental = ItemTaskManager()
+        full = ItemTaskManager(incremental=False)
+        scheduler = GreedyScheduler()
+        assigned_tasks = [[] for _ in range(4)]
+        num_assigned = 0
+        for obs in recordObservations(1000, seed=0):
+            for tasks in assigned_tasks:
+                if tasks and rng.random() < 0.1:
+                    tasks.pop(0)
+            for _ in range(4):
+                expected = full.genTasks(obs, assigned_tasks)
+                candidate_tasks = incremental.genTasks(obs, assigned_tasks)
+                self.assertEqual(candidate_tasks, expected)
+                if not scheduler.assign(obs, candidate_tasks, assigned_tasks):
+                    break
+                num_assigned += 1
+        self.assertGreater(num_assigned, 100)
+
+    def testGenTasks(self):
+        obs = recordObservations(1, seed=0)[0]
+        obs["stations"][0]["output_status"] = 1
+        task_manager = ItemTaskManager()
+        tasks_per_item = task_manager.genTasks(obs, [[] for _ in range(4)])
+        self.assertEqual(len(tasks_per_item), 7)
+        for item_type, item_tasks in zip(task_manager.item_types, tasks_per_item):
+            for task in item_tasks:
+                self.assertIsInstance(task, MetaTask)
+                self.assertEqual(task.item_type, item_type)
+                self.assertEqual(task.robot_id, -1)
+        self.assertTrue(any(
+            task.src_station_id == 0 for task in tasks_per_item[0]))
+
+    def testStationTimes(self):
+        obs = recordObservations(1, seed=0)[0]
+        task_manager = ItemTaskManager()
+        task_manager.genTasks(obs, [[] for _ in range(4)])
+        for i, src_station in enumerate(obs["stations"]):
+            for j, dst_station in enumerate(obs["stations"]):
+                self.assertEqual(
+                    task_manager.station_times[i, j],
+                    ItemTaskManager.betweenStation(src_station, dst_station))
+
+        robot_times = task_manager.robotStationTimes(obs)
+        self.assertIs(task_manager.robotStationTimes(obs), robot_times)
+        self.assertEqual(robot_times.shape, (4, len(obs["stations"])))
+        for robot_id, robot in enumerate(obs["robots"]):
+            for i, station in enumerate(obs["stations"]):
+                self.assertTrue(np.isclose(
+                    robot_times[robot_id, i],
+                    ItemTaskManager.moveTimeEst(
+                        (robot["loc_x"], robot["loc_y"]),
+                        (station["loc_x"], station["loc_y"]))))
+
+    def testReservationIndex(self):
+        # same reservations as the full rebuild, whoever changes the task lists
+        task_manager = ItemTaskManager()
+        scheduler = GreedyScheduler()
+        assigned_tasks = [[] for _ in range(4)]
+        rng = random.Random(0)
+        for obs in recordObservations(300, seed=0):
+            reservations = task_manager.reservationIndex(obs, assigned_tasks)
+            for tasks in assigned_tasks:
+                if tasks and rng.random() < 0.1:
+                    reservations.release(tasks.pop(0))
+                elif tasks and rng.random() < 0.1:
+                    tasks[0].owned_item = True
+                    reservations.reserve(tasks[0])
+                elif tasks and rng.random() < 0.05:
+                    # changed behind the index, picked up by sync
+                    tasks.pop(0)
+            candidate_tasks = task_manager.genTasks(obs, assigned_tasks)
+            scheduler.assign(obs, candidate_tasks, assigned_tasks)
+
+            reservations = task_manager.reservationIndex(obs, assigned_tasks)
+            reserved_stat = task_manager.currentTaskStat(assigned_tasks)
+            for i, stat in reserved_stat.items():
+                for item_type in task_manager.item_types:
+                    self.assertEqual(
+                        reservations.output_counts[i][item_type],
+                        stat["output"].count(item_type))
+                    self.assertEqual(
+                        reservations.input_counts[i][item_type],
+                        stat["input"].count(item_type))
+                self.assertEqual(
+                    reservations.input_masks[i],
+                    sum(1 << item_type for item_type in set(stat["input"])))
+
+    def testLookahead(self):
+        # station 4 has item 1 and item 2 is on the way
+        stations = [
+            makeStation(2, 10, 10), makeStation(4, 20, 10), makeStation(9, 30, 10)]
+        stations[1]["input_status"] = 1 << 1
+        stations[0]["output_status"] = 1
+        obs = {
+            "frame_id": 1,
+            "money": 200000,
+            "stations": stations,
+            "robots": [makeRobot(10, 10)] + [makeRobot(40, 40)] * 3,
+        }
+        for lookahead in [False, True]:
+            task_manager = ItemTaskManager(lookahead=lookahead)
+            assigned_tasks = [[] for _ in range(4)]
+            delivery = [
+                task for task in task_manager.genTasks(obs, assigned_tasks)[1]
+                if task.dst_station_id == 1][0]
+            delivery.robot_id = 0
+            assigned_tasks[0].append(delivery)
+
+            item_tasks = task_manager.genTasks(obs, assigned_tasks)[3]
+            if not lookahead:
+                self.assertEqual(item_tasks, [])
+                continue
+            self.assertEqual(len(item_tasks), 1)
+            # deliver item 2 (10 m from src to dst), then produce for 500 frames
+            eta = ItemTaskManager.moveTimeEst((10, 10), (20, 10)) * 50
+            self.assertAlmostEqual(item_tasks[0].src_ready_time.max, eta + 500)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from tune_decision_param import makeAgent as makeDecisionAgent
+from tune_control_param import makeAgent as makeControlAgent
+from tune_utils import ParallelTuner
+
+
+def makeParam(param):
+    return param
+
+
+def playQuadratic(job):
+    # stand-in for a game, best money at param == map_id + seed
+    param = np.array(job["param"])
+    return 1000 - float(((param - job["map_id"] - job["seed"]) ** 2).sum())
+
+
+class RandomSearch:
+    # minimal ask/tell optimizer with the CMAEvolutionStrategy interface
+    def __init__(self, x0, seed=0):
+        self.rng = np.random.default_rng(seed)
+        self.result = (np.array(x0, dtype=float), float("inf"))
+        self.num_tell = 0
+
+    def ask(self):
+        return [self.result[0] + self.rng.normal(0, 0.5, len(self.result[0]))
+                for _ in range(6)]
+
+    def tell(self, candidates, values):
+        self.num_tell += 1
+        best = int(np.argmin(values))
+        if values[best] < self.result[1]:
+            self.result = (candidates[best], values[best])
+
+    def stop(self):
+        return False
+
+
+class TestParallelTuner(unittest.TestCase):
+    def testFitness(self):
+        tuner = ParallelTuner(
+            makeParam, maps=[1, 2], seeds=[0, 1], workers=4,
+            play_game=playQuadratic)
+        values = tuner.fitness([[1.0, 1.0], [2.0, 2.0], [0.0, 0.0]])
+        # mean over 4 games: target 1, 2, 2, 3
+        self.assertEqual(values, [-997.0, -999.0, -991.0])
+
+    def testCheckpoint(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            checkpoint_path = os.path.join(tmp_dir, "es.pkl")
+            tuner = ParallelTuner(
+                makeParam, maps=[2], seeds=[0], workers=2,
+                checkpoint_path=checkpoint_path, play_game=playQuadratic)
+            es = tuner.optimize(RandomSearch([0, 0]), iterations=3)
+            self.assertEqual(es.num_tell, 3)
+            # resume from the saved optimizer state
+            tuner = ParallelTuner(
+                makeParam, maps=[2], seeds=[0], workers=2,
+                checkpoint_path=checkpoint_path, play_game=playQuadratic)
+            resumed = tuner.optimize(RandomSearch([0, 0]), iterations=5)
+            self.assertEqual(tuner.iteration, 5)
+            self.assertEqual(resumed.num_tell, 5)
+            self.assertLessEqual(resumed.result[1], es.result[1])
+
+    def testHeadless(self):
+        tuner = ParallelTuner(
+            makeDecisionAgent, maps=[0, 1], seeds=[0], workers=2,
+            env_args={"max_frames": 300}, headless=True)
+        param = [100, 100, 100, 300, 300, 300, 900] \
+            + [0, 0, 0, 0, 0, 0, 0, -50, -50] + [0] * 8
+        values = tuner.fitness([param, param])
+        self.assertEqual(values[0], values[1])
+        self.assertLess(values[0], 0)
+
+    def testMakeAgent(self):
+        agent = makeDecisionAgent(list(range(24)))
+        self.assertEqual(agent.scheduler.station_input_delta.tolist(), list(range(16, 24)))
+        for use_revised_control in [False, True]:
+            agent = makeControlAgent(
+                [0.1 * i for i in range(10)], use_revised_control)
+            params = agent.subtask_to_action.params
+            self.assertEqual(params["collision_predict_time_1"], 0.0)
+            self.assertEqual(params["angle_difference_penalty_speed"], 0.8)
+            self.assertEqual("same_direction_threshold" in params, use_revised_control)
+
+
+if __name__ == "__main__":
+    unittest.main()
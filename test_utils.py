@@ -0,0 +1,91 @@
+import math
+import random
+
+from headless_sim import HeadlessEnv
+from item_centric.task_manager import ItemTaskManager
+
+
+def makeStation(station_type, loc_x, loc_y):
+    return {
+        "station_type": station_type,
+        "loc_x": loc_x,
+        "loc_y": loc_y,
+        "remain_time": -1,
+        "input_status": 0,
+        "output_status": 0,
+    }
+
+
+def makeRobot(loc_x, loc_y, line_speed_x=0.0, line_speed_y=0.0, item_type=0):
+    return {
+        "station_id": -1,
+        "item_type": item_type,
+        "time_coef": 1.0,
+        "momentum_coef": 1.0,
+        "angular_speed": 0.0,
+        "line_speed_x": line_speed_x,
+        "line_speed_y": line_speed_y,
+        "theta": math.atan2(line_speed_y, line_speed_x),
+        "loc_x": loc_x,
+        "loc_y": loc_y,
+    }
+
+
+def makeObs(robots, frame_id=1):
+    return {
+        "frame_id": frame_id,
+        "money": 200000,
+        "stations": [
+            {
+                "station_type": 1,
+                "loc_x": 25.25,
+                "loc_y": 20.25,
+                "remain_time": -1,
+                "input_status": 0,
+                "output_status": 0,
+            }
+        ],
+        "robots": robots,
+    }
+
+
+def recordObservations(num_frames, seed):
+    # station states evolve a few at a time, like consecutive game frames
+    rng = random.Random(seed)
+    station_types = [1, 1, 2, 2, 3, 3, 4, 5, 6, 7, 7, 8, 9]
+    stations = [
+        makeStation(station_type, rng.uniform(0, 50), rng.uniform(0, 50))
+        for station_type in station_types
+    ]
+    trace = []
+    for frame_id in range(1, num_frames + 1):
+        for station in rng.sample(stations, rng.randint(0, 3)):
+            full_stat = ItemTaskManager().station_specs[
+                station["station_type"]]["full"]
+            station["remain_time"] = rng.choice([-1, 0, rng.randint(1, 500)])
+            station["input_status"] = rng.randint(0, 255) & full_stat
+            station["output_status"] = rng.randint(0, 1)
+        trace.append({
+            "frame_id": frame_id,
+            "money": 200000,
+            "stations": [dict(station) for station in stations],
+            "robots": [
+                makeRobot(rng.uniform(0, 50), rng.uniform(0, 50))
+                for _ in range(4)
+            ],
+        })
+    return trace
+
+
+def playGame(agent, env_map, max_frames=1500, callback=None):
+    # one headless game, callback(obs) after every step
+    env = HeadlessEnv(env_map, max_frames=max_frames)
+    env.reset()
+    while True:
+        obs, done = env.recv()
+        if done:
+            break
+        env.send(agent.step(obs))
+        if callback is not None:
+            callback(obs)
+    return env
@@ -0,0 +1,189 @@
+import os
+import pickle
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+
+def playGame(job: Dict[str, Any]) -> float:
+    # one full game in a fresh simulator, returns the final money
+    from RobotEnv.env_wrapper import EnvWrapper
+    from utils import fixSeed
+
+    robot_env_path = os.path.join(os.path.dirname(__file__), "RobotEnv")
+    map_id = os.path.join(robot_env_path, f"maps/{job['map_id']}.txt")
+    env_binary_name = os.path.join(robot_env_path, job["env_binary_name"])
+    env_wrapper_name = os.path.join(robot_env_path, job["env_wrapper_name"])
+    # NOTE: every worker talks to its own simulator through a unique pipe
+    pipe_name = f"/tmp/pipe_{uuid.uuid4().hex}"
+    launch_command = f"{env_binary_name} {job['env_args']} "\
+        f"-m {map_id} \"{env_wrapper_name} {pipe_name}\""
+    env = EnvWrapper(pipe_name, launch_command)
+
+    fixSeed(job["seed"])
+    agent = job["make_agent"](job["param"])
+    env.reset()
+    while True:
+        obs, done = env.recv()
+        if done:
+            break
+        actions = agent.step(obs)
+        env.send(actions)
+
+    env.close()
+    return agent.moneys[-1]
+
+
+def headlessMap(map_id: int) -> List[str]:
+    from headless_sim import randomMap, readMap
+
+    map_path = os.path.join(
+        os.path.dirname(__file__), "RobotEnv", f"maps/{map_id}.txt")
+    if os.path.exists(map_path):
+        return readMap(map_path)
+    # NOTE: without the official maps, the map id seeds a random map
+    return randomMap(map_id)
+
+
+def playHeadlessGames(jobs: List[Dict[str, Any]]) -> List[float]:
+    # all games of a chunk in one VecEnv, returns the final money of each
+    from headless_sim import MAX_FRAMES, VecEnv
+    from utils import fixSeed
+
+    # NOTE: games in lockstep share the global RNG, seeded once per chunk
+    fixSeed(jobs[0]["seed"])
+    env = VecEnv([job["env_map"] for job in jobs],
+                 jobs[0].get("max_frames", MAX_FRAMES))
+    agents = [job["make_agent"](job["param"]) for job in jobs]
+    env.reset()
+    while True:
+        observations, done = env.recv()
+        if done:
+            break
+        env.send([
+            agent.step(obs) for agent, obs in zip(agents, observations)])
+
+    env.close()
+    return env.scores()
+
+
+class ParallelTuner:
+    """
+    Evaluates a whole CMA-ES population at once,
+        every candidate is scored on all (map, seed) pairs by a worker pool
+    """
+
+    def __init__(self,
+                 make_agent: Callable,
+                 maps: List[int],
+                 seeds: List[int],
+                 workers: Optional[int] = None,
+                 checkpoint_path: str = "",
+                 env_args: Optional[Dict[str, str]] = None,
+                 play_game: Callable = playGame,
+                 headless: bool = False) -> None:
+        self.make_agent = make_agent
+        self.maps = maps
+        self.seeds = seeds
+        self.workers = workers or os.cpu_count()
+        self.checkpoint_path = checkpoint_path
+        self.env_args = {
+            "env_binary_name": "./Robot_fast",
+            "env_args": "-d",
+            "env_wrapper_name": "./env_wrapper",
+        }
+        self.env_args.update(env_args or {})
+        self.play_game = play_game
+        # NOTE: headless games run in-process, one VecEnv per worker
+        self.headless = headless
+        self.env_maps = {
+            map_id: headlessMap(map_id) for map_id in maps
+        } if headless else {}
+        self.iteration = 0
+
+    def playGames(self, jobs: List[Dict[str, Any]]) -> List[float]:
+        if self.headless:
+            return self.playHeadlessGames(jobs)
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = [executor.submit(self.play_game, job) for job in jobs]
+            scores = []
+            for job, future in zip(jobs, futures):
+                try:
+                    scores.append(future.result())
+                except Exception as e:
+                    # NOTE: a crashed game scores 0
+                    print(f"[ERROR]: map {job['map_id']}, seed {job['seed']}: {e}")
+                    scores.append(0)
+        return scores
+
+    def playHeadlessGames(self, jobs: List[Dict[str, Any]]) -> List[float]:
+        chunks = [
+            list(range(i, len(jobs), self.workers))
+            for i in range(min(self.workers, len(jobs)))
+        ]
+        scores = [0.0] * len(jobs)
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            futures = [
+                executor.submit(playHeadlessGames, [jobs[i] for i in chunk])
+                for chunk in chunks
+            ]
+            for chunk, future in zip(chunks, futures):
+                try:
+                    for i, score in zip(chunk, future.result()):
+                        scores[i] = score
+                except Exception as e:
+                    # NOTE: a crashed chunk scores 0 for all its games
+                    print(f"[ERROR]: headless chunk of {len(chunk)} games: {e}")
+        return scores
+
+    def fitness(self, params: List[Any]) -> List[float]:
+        # negative mean money over maps and seeds, CMA-ES minimizes
+        jobs = [
+            dict(self.env_args,
+                 make_agent=self.make_agent, param=list(param),
+                 map_id=map_id, seed=seed,
+                 env_map=self.env_maps.get(map_id))
+            for param in params
+            for map_id in self.maps
+            for seed in self.seeds
+        ]
+        scores = np.array(self.playGames(jobs)).reshape(len(params), -1)
+        return (-scores.mean(axis=1)).tolist()
+
+    def saveCheckpoint(self, es) -> None:
+        if not self.checkpoint_path:
+            return
+        # NOTE: write then rename, an interrupted save keeps the last checkpoint
+        tmp_path = f"{self.checkpoint_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump({"es": es, "iteration": self.iteration}, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def loadCheckpoint(self):
+        if not self.checkpoint_path \
+                or not os.path.exists(self.checkpoint_path):
+            return None
+        with open(self.checkpoint_path, "rb") as f:
+            checkpoint = pickle.load(f)
+        self.iteration = checkpoint["iteration"]
+        print(f"[INFO]: Resume from iteration {self.iteration}")
+        return checkpoint["es"]
+
+    def optimize(self, es, iterations: int, callback: Optional[Callable] = None):
+        checkpoint_es = self.loadCheckpoint()
+        if checkpoint_es is not None:
+            es = checkpoint_es
+        while self.iteration < iterations and not es.stop():
+            start_time = time.perf_counter()
+            candidates = es.ask()
+            es.tell(candidates, self.fitness(candidates))
+            self.iteration += 1
+            self.saveCheckpoint(es)
+            print(f"[CMA-ES] Iteration {self.iteration}, "
+                  f"best {es.result[1]}, {time.perf_counter() - start_time:.1f}s")
+            if callback is not None:
+                callback(es)
+        return es